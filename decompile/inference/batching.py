@@ -0,0 +1,70 @@
+"""Batching and throughput helpers for bulk inference."""
+import time
+from typing import List, Sequence
+
+
+def length_sorted_batches(lengths: Sequence[int], batch_size: int) -> List[List[int]]:
+    """Groups prompts of similar length into batches, so that little padding is
+    generated. Batches are ordered from the longest prompts to the shortest,
+    which surfaces out of memory errors on the first batch.
+
+    Args:
+        lengths (Sequence[int]): Length of every prompt, in tokens or in
+            characters as a cheaper estimate.
+        batch_size (int): Number of prompts in a batch.
+
+    Returns:
+        List[List[int]]: Indices of the prompts of every batch.
+    """
+    order = sorted(range(len(lengths)), key=lambda index: -lengths[index])
+    return [
+        order[start : start + batch_size] for start in range(0, len(order), batch_size)
+    ]
+
+
+class ThroughputMeter:
+    """Counts generated samples and tokens over wall time.
+
+    Attributes:
+        num_samples (int): Number of generated samples.
+        num_prompt_tokens (int): Number of prompt tokens of the samples.
+        num_generated_tokens (int): Number of generated tokens.
+    """
+
+    def __init__(self) -> None:
+        self.num_samples = 0
+        self.num_prompt_tokens = 0
+        self.num_generated_tokens = 0
+        self._start = time.perf_counter()
+
+    def update(
+        self, num_samples: int, num_prompt_tokens: int, num_generated_tokens: int
+    ) -> None:
+        """Adds a finished batch.
+
+        Args:
+            num_samples (int): Number of samples of the batch.
+            num_prompt_tokens (int): Number of prompt tokens of the batch.
+            num_generated_tokens (int): Number of tokens generated for the batch.
+        """
+        self.num_samples += num_samples
+        self.num_prompt_tokens += num_prompt_tokens
+        self.num_generated_tokens += num_generated_tokens
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the meter was created"""
+        return time.perf_counter() - self._start
+
+    def report(self) -> str:
+        """Throughput so far.
+
+        Returns:
+            str: samples/s and generated tokens/s.
+        """
+        elapsed = max(self.elapsed, 1e-9)
+        return (
+            f"{self.num_samples} samples in {elapsed:.1f}s: "
+            + f"{self.num_samples / elapsed:.2f} samples/s, "
+            + f"{self.num_generated_tokens / elapsed:.1f} tokens/s"
+        )
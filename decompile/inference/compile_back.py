@@ -0,0 +1,367 @@
+"""Compile-back evaluation: recompiles predicted source code and compares its
+standardized assembly with the assembly the model was given."""
+import os
+import json
+import time
+import shlex
+import signal
+import difflib
+import tempfile
+import subprocess
+from collections import Counter
+from functools import partial
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from decompile.inference.result_cache import canonical_asm
+from decompile.preprocessing.flag_matrix import build_precompiled_header
+from decompile.preprocessing.standardize import (
+    standardize_asm,
+    standardize_compiler_asm,
+)
+from decompile.preprocessing.toolchain import (
+    COMPILATION_COMMANDS,
+    SHARED_MEMORY_FOLDER,
+    assembly_command,
+    include_arguments,
+    objdump_command,
+)
+
+# status of a compile-back attempt, "ok" is the only successful one
+COMPILE_BACK_STATUSES = (
+    "ok",
+    "unsupported_language",
+    "compile_error",
+    "disassembly_error",
+    "missing_function",
+    "timeout",
+)
+# largest compiler error message kept in the results
+_MAX_ERROR_CHARS = 2000
+
+
+def _prlimit_prefix(cpu_seconds: int, memory_bytes: int, file_bytes: int) -> List[str]:
+    """prlimit prefix setting the resource limits of a sandboxed command before
+    it execs the command. They are inherited by the processes the compiler
+    driver starts."""
+    return [
+        "prlimit",
+        f"--cpu={cpu_seconds}:{cpu_seconds + 1}",
+        f"--as={memory_bytes}",
+        f"--fsize={file_bytes}",
+        "--core=0",
+        "--",
+    ]
+
+
+def run_sandboxed(
+    command: Sequence[str],
+    timeout: float,
+    memory_bytes: int = 2 * 1024**3,
+    file_bytes: int = 64 * 1024**2,
+    cwd: Optional[Union[Path, str]] = None,
+) -> Tuple[int, bytes, bytes]:
+    """Runs a command with a wall clock timeout and CPU, memory and output file
+    limits. The limits are set by prlimit, which then execs the command. The
+    command runs in its own session, so that a timeout kills the processes it
+    started too, e.g. cc1 and as under gcc.
+
+    Args:
+        command (Sequence[str]): Command as a list of arguments.
+        timeout (float): Wall clock seconds before the command is killed.
+        memory_bytes (int): Address space limit of every process.
+        file_bytes (int): Size limit of the files the command writes.
+        cwd (Optional[Union[Path, str]]): Working directory of the command.
+
+    Returns:
+        Tuple[int, bytes, bytes]: return code, stdout and stderr.
+
+    Raises:
+        subprocess.TimeoutExpired: The command did not finish in time.
+    """
+    cpu_seconds = max(int(timeout) + 1, 1)
+    with subprocess.Popen(
+        _prlimit_prefix(cpu_seconds, memory_bytes, file_bytes) + list(command),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=cwd,
+        start_new_session=True,
+    ) as process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.communicate()
+            raise
+    return process.returncode, stdout, stderr
+
+
+def _compile_error(stderr: bytes) -> Dict[str, str]:
+    """compile_back result of a failed compilation."""
+    error = stderr.decode("utf-8", errors="replace")
+    return {"status": "compile_error", "asm": "", "error": error[-_MAX_ERROR_CHARS:]}
+
+
+def _sandboxed_assembly(
+    source_file: Path,
+    sandbox: Callable[[List[str]], Tuple[int, bytes, bytes]],
+    asm_syntax_type: str,
+    architecture: str,
+    *,
+    asm_backend: str,
+    include_folder: Optional[Path],
+) -> Dict[str, str]:
+    """Compiles a source file in the sandbox, then disassembles it with objdump
+    or reads the compiler assembly, as the asm_backend of DatasetJsonl does."""
+    if asm_backend == "compiler":
+        return_code, assembly, stderr = sandbox(
+            assembly_command(
+                source_file,
+                asm_syntax_type,
+                architecture,
+                include_arguments(source_file, include_folder),
+            )
+        )
+        if return_code != 0:
+            return _compile_error(stderr)
+        asm_text = standardize_compiler_asm(assembly.decode("utf-8", errors="replace"))
+    else:
+        binary_file = source_file.with_suffix(".o")
+        return_code, _, stderr = sandbox(
+            shlex.split(COMPILATION_COMMANDS[source_file.suffix])
+            + include_arguments(source_file, include_folder)
+            + [str(source_file), "-o", str(binary_file)]
+        )
+        if return_code != 0:
+            return _compile_error(stderr)
+        return_code, listing, stderr = sandbox(
+            objdump_command([binary_file], asm_syntax_type, architecture)
+        )
+        if return_code != 0:
+            error = stderr.decode("utf-8", errors="replace")
+            return {"status": "disassembly_error", "asm": "", "error": error}
+        asm_text = standardize_asm(listing)
+    if not asm_text:
+        return {"status": "missing_function", "asm": "", "error": ""}
+    return {"status": "ok", "asm": asm_text, "error": ""}
+
+
+def compile_back(
+    source_text: str,
+    file_name: str,
+    *,
+    timeout: float = 10.0,
+    memory_bytes: int = 2 * 1024**3,
+    asm_syntax_type: str = "att",
+    asm_backend: str = "objdump",
+    architecture: str = "x86-64",
+    include_folder: Optional[Union[Path, str]] = None,
+    scratch_folder: Optional[Union[Path, str]] = None,
+) -> Dict[str, str]:
+    """Compiles source code with the compiler of the preprocessing pipeline,
+    produces its assembly with the same backend and options and standardizes
+    it, so that the result is comparable with the dataset inputs.
+
+    Args:
+        source_text (str): Predicted source code.
+        file_name (str): File name of the record, its suffix picks the compiler.
+        timeout (float): Wall clock seconds allowed to each of the compiler
+            and objdump.
+        memory_bytes (int): Address space limit of the compiler.
+        asm_syntax_type (str): Syntax type of the dataset assembly.
+        asm_backend (str): Backend of the dataset assembly, "objdump" to
+            disassemble the object file or "compiler" to read gcc -S output.
+        architecture (str): Architecture of the dataset assembly.
+        include_folder (Optional[Union[Path, str]]): Folder of a precompiled
+            header built by build_precompiled_header, used for C++ sources.
+        scratch_folder (Optional[Union[Path, str]]): Folder of the temporary
+            source and object files, in memory by default when available.
+
+    Returns:
+        Dict[str, str]: status, standardized assembly and compiler error.
+    """
+    suffix = Path(file_name).suffix
+    if suffix not in COMPILATION_COMMANDS:
+        return {"status": "unsupported_language", "asm": "", "error": suffix}
+    if scratch_folder is None and SHARED_MEMORY_FOLDER.is_dir():
+        scratch_folder = SHARED_MEMORY_FOLDER
+    with tempfile.TemporaryDirectory(dir=scratch_folder) as temp_folder:
+        source_file = Path(temp_folder) / f"prediction{suffix}"
+        source_file.write_text(source_text, encoding="utf-8")
+        try:
+            return _sandboxed_assembly(
+                source_file,
+                partial(
+                    run_sandboxed,
+                    timeout=timeout,
+                    memory_bytes=memory_bytes,
+                    cwd=temp_folder,
+                ),
+                asm_syntax_type,
+                architecture,
+                asm_backend=asm_backend,
+                include_folder=None if include_folder is None else Path(include_folder),
+            )
+        except subprocess.TimeoutExpired:
+            return {"status": "timeout", "asm": "", "error": f"over {timeout}s"}
+
+
+def asm_similarity(reference_asm: str, candidate_asm: str) -> float:
+    """Similarity of two standardized assembly listings: the difflib ratio of
+    their canonical instruction lines, 1.0 for identical function bodies.
+
+    Args:
+        reference_asm (str): Dataset assembly.
+        candidate_asm (str): Assembly of the recompiled prediction.
+
+    Returns:
+        float: similarity between 0 and 1.
+    """
+    reference_lines = canonical_asm(reference_asm).split("\n")
+    candidate_lines = canonical_asm(candidate_asm).split("\n")
+    return difflib.SequenceMatcher(
+        None, reference_lines, candidate_lines, autojunk=False
+    ).ratio()
+
+
+def _score_record(
+    line: bytes, prediction_field: str, **compile_kwargs: Any
+) -> Dict[str, Any]:
+    """Compile-back result of a jsonl line of predictions."""
+    record = json.loads(line)
+    file_name = record.get("file_name", "prediction.cpp")
+    result = compile_back(record[prediction_field], file_name, **compile_kwargs)
+    similarity = 0.0
+    if result["status"] == "ok":
+        similarity = asm_similarity(record["input"], result["asm"])
+    return {
+        "file_name": file_name,
+        "status": result["status"],
+        "similarity": similarity,
+        "exact_match": result["status"] == "ok"
+        and canonical_asm(record["input"]) == canonical_asm(result["asm"]),
+        "asm": result["asm"],
+        "error": result["error"],
+    }
+
+
+def evaluate_compile_back(
+    predictions_jsonl_path: Union[Path, str],
+    results_jsonl_path: Union[Path, str],
+    summary_path: Union[Path, str],
+    *,
+    nproc: int = 1,
+    timeout: float = 10.0,
+    memory_bytes: int = 2 * 1024**3,
+    asm_syntax_type: str = "att",
+    asm_backend: str = "objdump",
+    prediction_field: str = "prediction",
+    chunksize: int = 4,
+    report_every: int = 1000,
+    precompile_header: bool = True,
+) -> Dict[str, Any]:
+    """Recompiles every prediction of a jsonl file, e.g. the output of the bulk
+    mode of evaluate.py, in a pool of workers. Every prediction is compiled in
+    a sandboxed process with a timeout, and a prediction that fails to compile,
+    hangs the compiler or exhausts its limits only fails its own record. One
+    result per record is written in input order, then a summary with the
+    compile rate and the assembly similarity. C++ predictions are compiled
+    against a precompiled header built once before the workers start.
+
+    Args:
+        predictions_jsonl_path (Union[Path, str]): jsonl file of records with
+            input, file_name and prediction fields.
+        results_jsonl_path (Union[Path, str]): Path to the jsonl file of results.
+        summary_path (Union[Path, str]): Path to the json summary.
+        nproc (int): Number of processes to use for multiprocessing.
+        timeout (float): Wall clock seconds allowed to every compilation.
+        memory_bytes (int): Address space limit of every compilation.
+        asm_syntax_type (str): Syntax type of the dataset assembly.
+        asm_backend (str): Backend the dataset assembly was produced with,
+            "objdump" or "compiler".
+        prediction_field (str): Field of the predicted source code.
+        chunksize (int): Number of records sent to a worker at once.
+        report_every (int): Print progress after this many records.
+        precompile_header (bool): Build the precompiled header of C++ sources.
+
+    Returns:
+        Dict[str, Any]: summary of the evaluation.
+    """
+    with tempfile.TemporaryDirectory() as temp_folder:
+        include_folder: Optional[str] = None
+        if precompile_header and build_precompiled_header(temp_folder):
+            include_folder = temp_folder
+        score_record = partial(
+            _score_record,
+            prediction_field=prediction_field,
+            timeout=timeout,
+            memory_bytes=memory_bytes,
+            asm_syntax_type=asm_syntax_type,
+            asm_backend=asm_backend,
+            include_folder=include_folder,
+        )
+        return _evaluate_records(
+            predictions_jsonl_path,
+            results_jsonl_path,
+            summary_path,
+            score_record,
+            nproc=nproc,
+            chunksize=chunksize,
+            report_every=report_every,
+        )
+
+
+def _evaluate_records(
+    predictions_jsonl_path: Union[Path, str],
+    results_jsonl_path: Union[Path, str],
+    summary_path: Union[Path, str],
+    score_record: Callable[[bytes], Dict[str, Any]],
+    *,
+    nproc: int,
+    chunksize: int,
+    report_every: int,
+) -> Dict[str, Any]:
+    """Scores the records of evaluate_compile_back and writes the summary."""
+    scores: List[Tuple[str, float, bool]] = []
+    start = time.perf_counter()
+    with Path(predictions_jsonl_path).open("rb") as predictions_file, Path(
+        results_jsonl_path
+    ).open("w", encoding="utf-8") as results_file, Pool(processes=nproc) as pool:
+        lines = (line for line in predictions_file if line.strip())
+        for result in pool.imap(score_record, lines, chunksize):
+            results_file.write(json.dumps(result) + "\n")
+            scores.append(
+                (result["status"], result["similarity"], result["exact_match"])
+            )
+            if len(scores) % report_every == 0:
+                print(f"Compiled back {len(scores)} predictions")
+    summary = _summarize(scores, time.perf_counter() - start)
+    Path(summary_path).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    return summary
+
+
+def _summarize(scores: List[Tuple[str, float, bool]], elapsed: float) -> Dict[str, Any]:
+    """Summary of the status, similarity and exact match of every record."""
+    statuses = Counter(status for status, _, _ in scores)
+    num_records = len(scores)
+    num_compiled = statuses["ok"]
+    similarities = [similarity for _, similarity, _ in scores]
+    compiled_similarities = [
+        similarity for status, similarity, _ in scores if status == "ok"
+    ]
+    num_exact_matches = sum(exact_match for _, _, exact_match in scores)
+    return {
+        "num_records": num_records,
+        "num_compiled": num_compiled,
+        "compile_rate": num_compiled / num_records if num_records else 0.0,
+        "mean_similarity": sum(similarities) / num_records if num_records else 0.0,
+        "mean_compiled_similarity": (
+            sum(compiled_similarities) / num_compiled if num_compiled else 0.0
+        ),
+        "exact_match_rate": num_exact_matches / num_records if num_records else 0.0,
+        "statuses": dict(statuses),
+        "elapsed_seconds": elapsed,
+        "records_per_minute": 60 * num_records / elapsed if elapsed else 0.0,
+    }
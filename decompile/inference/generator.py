@@ -0,0 +1,104 @@
+"""Batched text generation with a causal language model."""
+from itertools import islice
+from typing import Any, Iterable, Iterator, List, Tuple
+
+import torch
+
+from decompile.inference.batching import ThroughputMeter, length_sorted_batches
+
+
+class BatchGenerator:
+    """Generates completions of many prompts in padded batches. Prompts are
+    padded on the left so that every completion starts right after its prompt.
+
+    Attributes:
+        model (Any): Causal language model.
+        tokenizer (Any): Tokenizer of the model.
+        batch_size (int): Number of prompts generated at once.
+        max_new_tokens (int): Maximum number of generated tokens of a prompt.
+        window_size (int): Number of prompts sorted by length at once.
+        meter (ThroughputMeter): Throughput of the generator.
+    """
+
+    def __init__(
+        self,
+        model: Any,
+        tokenizer: Any,
+        *,
+        batch_size: int = 8,
+        max_new_tokens: int = 512,
+        window_size: int = 1024,
+    ) -> None:
+        """Initialize the generator
+
+        Args:
+            model (Any): Causal language model.
+            tokenizer (Any): Tokenizer of the model.
+            batch_size (int): Number of prompts generated at once.
+            max_new_tokens (int): Maximum number of generated tokens of a prompt.
+            window_size (int): Number of prompts sorted by length at once.
+        """
+        self.model = model
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+        self.max_new_tokens = max_new_tokens
+        self.window_size = window_size
+        self.meter = ThroughputMeter()
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = "left"
+        self.model.eval()
+
+    @torch.no_grad()
+    def generate(self, prompts: List[str]) -> List[Tuple[str, int]]:
+        """Generates the completions of a batch of prompts with greedy decoding.
+
+        Args:
+            prompts (List[str]): Prompts of the batch.
+
+        Returns:
+            List[Tuple[str, int]]: Completion of every prompt and its number
+            of tokens.
+        """
+        encoded = self.tokenizer(prompts, return_tensors="pt", padding=True).to(
+            self.model.device
+        )
+        output_ids = self.model.generate(
+            **encoded,
+            max_new_tokens=self.max_new_tokens,
+            do_sample=False,
+            pad_token_id=self.tokenizer.pad_token_id,
+        )
+        new_ids = output_ids[:, encoded["input_ids"].shape[1] :]
+        num_tokens = (new_ids != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+        texts = self.tokenizer.batch_decode(new_ids, skip_special_tokens=True)
+        self.meter.update(
+            len(prompts), int(encoded["attention_mask"].sum()), sum(num_tokens)
+        )
+        return list(zip(texts, num_tokens))
+
+    def iter_generate(self, prompts: Iterable[str]) -> Iterator[Tuple[int, str]]:
+        """Generates the completions of all prompts in batches of similar length.
+        Prompts are read lazily, window_size at a time, and every window is
+        sorted by the length of its prompts in characters, so that only the
+        prompts of the current batch are tokenized. Completions are yielded as
+        soon as their batch finishes, so they are not in the order of the
+        prompts.
+
+        Args:
+            prompts (Iterable[str]): Prompts to complete.
+
+        Yields:
+            Tuple[int, str]: Index of the prompt and its completion.
+        """
+        prompts_iterator = iter(prompts)
+        offset = 0
+        for window in iter(
+            lambda: list(islice(prompts_iterator, self.window_size)), []
+        ):
+            lengths = [len(prompt) for prompt in window]
+            for batch in length_sorted_batches(lengths, self.batch_size):
+                completions = self.generate([window[index] for index in batch])
+                for index, (text, _) in zip(batch, completions):
+                    yield offset + index, text
+            offset += len(window)
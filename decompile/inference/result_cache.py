@@ -0,0 +1,221 @@
+"""Cache of model outputs keyed on canonicalized assembly."""
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Union
+
+from decompile.preprocessing.cache import connect_index
+from decompile.preprocessing.canonicalize import canonicalize_asm
+
+# files of a model folder whose content changes the outputs of the model
+MODEL_FILE_PATTERNS = ("*.safetensors", "*.bin", "*.pt", "*.pth", "*config.json")
+
+
+def canonical_asm(asm_text: str) -> str:
+    """Canonical form of standardized assembly used for cache keys, see
+    canonicalize_asm. Instruction addresses and the addresses of branch targets
+    depend on where the function was placed in its binary, so they are dropped
+    and branches inside the function point to local labels. The header with the
+    function name and signature is kept, as is every line without an address.
+
+    Args:
+        asm_text (str): Output of standardize_asm_file.
+
+    Returns:
+        str: canonical assembly.
+    """
+    return canonicalize_asm(asm_text.strip(), keep_line_info=True)
+
+
+def model_fingerprint(model_path: Union[Path, str], tokenizer_hash: str) -> str:
+    """Identifies a model and its tokenizer in cache keys. For a local model
+    folder the name, size and modification time of its weights, adapter and
+    config files are hashed, so that a model retrained in place gets new keys
+    without reading its weights. Other model paths, e.g. hub names, are used
+    as they are.
+
+    Args:
+        model_path (Union[Path, str]): Model folder or hub name given to load_model.
+        tokenizer_hash (str): tokenizer_fingerprint of the tokenizer.
+
+    Returns:
+        str: hex digest identifying the model and tokenizer.
+    """
+    digest = hashlib.sha256(tokenizer_hash.encode("utf-8"))
+    model_folder = Path(model_path)
+    if not model_folder.is_dir():
+        digest.update(str(model_path).encode("utf-8"))
+        return digest.hexdigest()
+    model_files = {
+        file for pattern in MODEL_FILE_PATTERNS for file in model_folder.glob(pattern)
+    }
+    for model_file in sorted(model_files):
+        stat = model_file.stat()
+        digest.update(
+            json.dumps([model_file.name, stat.st_size, stat.st_mtime_ns]).encode(
+                "utf-8"
+            )
+        )
+    return digest.hexdigest()
+
+
+class InferenceCache:
+    """Model outputs by cache key, in an in-memory LRU in front of an optional
+    sqlite store that persists across runs and processes.
+
+    Attributes:
+        cache_folder (Optional[Path]): Folder of the sqlite store, None keeps
+            the cache in memory only.
+        max_memory_entries (int): Size of the in-memory LRU.
+    """
+
+    index_file_name = "inference.sqlite3"
+
+    def __init__(
+        self,
+        cache_folder: Optional[Union[Path, str]] = None,
+        max_memory_entries: int = 4096,
+    ) -> None:
+        self.cache_folder = None if cache_folder is None else Path(cache_folder)
+        self.max_memory_entries = max_memory_entries
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        if self.cache_folder is not None:
+            self.cache_folder.mkdir(parents=True, exist_ok=True)
+            with self._connect() as connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS results "
+                    + "(key TEXT PRIMARY KEY, output TEXT, last_access REAL)"
+                )
+
+    @staticmethod
+    def make_key(
+        asm_text: str, model_id: str, generation_params: Dict[str, Any]
+    ) -> str:
+        """Builds the cache key of a model output.
+
+        Args:
+            asm_text (str): Standardized assembly given to the model.
+            model_id (str): Identifies the model and tokenizer, see
+                model_fingerprint.
+            generation_params (Dict[str, Any]): Everything else the output
+                depends on, e.g. max_new_tokens.
+
+        Returns:
+            str: hex digest used as the cache key.
+        """
+        parts = [canonical_asm(asm_text), model_id, generation_params]
+        return hashlib.sha256(
+            json.dumps(parts, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Looks up a model output.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            Optional[str]: Cached output, or None on a cache miss.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return self._memory[key]
+        output = None
+        if self.cache_folder is not None:
+            with self._connect() as connection:
+                row = connection.execute(
+                    "SELECT output FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    output = row[0]
+                    connection.execute(
+                        "UPDATE results SET last_access = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+        with self._lock:
+            if output is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._remember(key, output)
+        return output
+
+    def put(self, key: str, output: str) -> None:
+        """Stores a model output.
+
+        Args:
+            key (str): Cache key.
+            output (str): Model output.
+        """
+        with self._lock:
+            self._remember(key, output)
+        if self.cache_folder is not None:
+            with self._connect() as connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                    (key, output, time.time()),
+                )
+
+    def generate(
+        self,
+        keys: List[str],
+        inputs: List[str],
+        generate_batch: Callable[[List[str]], List[str]],
+    ) -> List[str]:
+        """Outputs of a batch of inputs: cached outputs are returned as they are,
+        and every distinct missing key is generated once.
+
+        Args:
+            keys (List[str]): Cache key of every input.
+            inputs (List[str]): Inputs of the batch.
+            generate_batch (Callable[[List[str]], List[str]]): Generates the
+                outputs of a batch of inputs.
+
+        Returns:
+            List[str]: Output of every input.
+        """
+        outputs: Dict[str, Optional[str]] = {}
+        missing: Dict[str, str] = {}
+        for key, model_input in zip(keys, inputs):
+            if key not in outputs:
+                outputs[key] = self.get(key)
+                if outputs[key] is None:
+                    missing[key] = model_input
+        if missing:
+            for key, output in zip(missing, generate_batch(list(missing.values()))):
+                self.put(key, output)
+                outputs[key] = output
+        return [outputs[key] or "" for key in keys]
+
+    def stats(self) -> Dict[str, float]:
+        """Cache statistics since this instance was created.
+
+        Returns:
+            Dict[str, float]: memory hits, disk hits, misses and hit rate.
+        """
+        with self._lock:
+            counters: Dict[str, float] = dict(self._counters)
+        lookups = sum(counters.values())
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        counters["hit_rate"] = hits / lookups if lookups else 0.0
+        return counters
+
+    def _remember(self, key: str, output: str) -> None:
+        """Adds an entry to the in-memory LRU, the lock must be held."""
+        self._memory[key] = output
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _connect(self) -> ContextManager[sqlite3.Connection]:
+        """Opens a connection to the store and commits on exit."""
+        assert self.cache_folder is not None
+        return connect_index(self.cache_folder / InferenceCache.index_file_name)
@@ -0,0 +1,233 @@
+"""Resident decompilation service with dynamic batching over localhost HTTP."""
+import json
+import time
+import queue
+import threading
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+
+class QueueFullError(Exception):
+    """Raised when a request arrives while the queue of the batcher is full."""
+
+
+@dataclass
+class _Request:
+    """Prompt waiting in the queue of the batcher, with its result slot."""
+
+    prompt: str
+    deadline: float
+    output: Optional[str] = None
+    error: Optional[BaseException] = None
+    done: threading.Event = field(default_factory=threading.Event)
+
+
+class DynamicBatcher:
+    """Queue of prompts served by a single worker thread. The worker waits for a
+    first request, then gathers the requests that arrive within max_wait_seconds
+    into one batch of at most max_batch_size prompts. Requests whose deadline
+    passed while they were queued are dropped before generation.
+
+    Attributes:
+        generate_batch (Callable[[List[str]], List[str]]): Generates the
+            outputs of a batch of prompts.
+        max_batch_size (int): Maximum number of prompts in a batch.
+        max_wait_seconds (float): How long the worker waits for a batch to fill.
+    """
+
+    def __init__(
+        self,
+        generate_batch: Callable[[List[str]], List[str]],
+        max_batch_size: int = 8,
+        max_wait_seconds: float = 0.02,
+        max_queue_size: int = 256,
+    ) -> None:
+        """Initialize the batcher
+
+        Args:
+            generate_batch (Callable[[List[str]], List[str]]): Generates the
+                outputs of a batch of prompts.
+            max_batch_size (int): Maximum number of prompts in a batch.
+            max_wait_seconds (float): How long the worker waits for a batch to fill.
+            max_queue_size (int): Maximum number of queued requests.
+        """
+        self.generate_batch = generate_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self._queue: "queue.Queue[_Request]" = queue.Queue(maxsize=max_queue_size)
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "DynamicBatcher":
+        """Starts the worker thread.
+
+        Returns:
+            DynamicBatcher: the batcher itself.
+        """
+        self._worker.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops the worker thread after its current batch."""
+        self._stopped.set()
+        self._worker.join()
+
+    def submit(self, prompt: str, timeout: float) -> str:
+        """Queues a prompt and waits for its output.
+
+        Args:
+            prompt (str): Prompt to generate from.
+            timeout (float): Seconds to wait for the output, queueing included.
+
+        Returns:
+            str: Generated output.
+        """
+        request = _Request(prompt, time.monotonic() + timeout)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full as error:
+            raise QueueFullError("too many queued requests") from error
+        if not request.done.wait(timeout):
+            raise TimeoutError(f"no output after {timeout}s")
+        if request.error is not None:
+            raise request.error
+        assert request.output is not None
+        return request.output
+
+    def _next_batch(self) -> List[_Request]:
+        """Waits for the next batch of live requests."""
+        try:
+            batch = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+        batch_deadline = time.monotonic() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = batch_deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        now = time.monotonic()
+        return [request for request in batch if request.deadline > now]
+
+    def _run(self) -> None:
+        """Worker loop: generates one batch at a time until stopped."""
+        while not self._stopped.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                outputs = self.generate_batch([request.prompt for request in batch])
+                for request, output in zip(batch, outputs):
+                    request.output = output
+            except Exception as error:  # pylint: disable=broad-except
+                for request in batch:
+                    request.error = error
+            for request in batch:
+                request.done.set()
+
+
+def make_server(
+    batcher: DynamicBatcher,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    default_timeout: float = 60.0,
+    stats: Optional[Callable[[], Dict[str, Any]]] = None,
+) -> ThreadingHTTPServer:
+    """HTTP server in front of a batcher. POST /decompile takes
+    {"input": <assembly>, "timeout": <seconds>} and answers {"output": <code>}.
+    A full queue answers 503 and a timeout answers 504. GET /health answers 200
+    and GET /stats answers the output of stats.
+
+    Args:
+        batcher (DynamicBatcher): Started batcher.
+        host (str): Address to listen on.
+        port (int): Port to listen on, 0 picks a free port.
+        default_timeout (float): Timeout of requests that do not set one.
+        stats (Optional[Callable[[], Dict[str, Any]]]): Statistics of the
+            service, e.g. those of the inference cache.
+
+    Returns:
+        ThreadingHTTPServer: server, run it with serve_forever.
+    """
+
+    class DecompileHandler(BaseHTTPRequestHandler):
+        """Request handler of the decompilation server"""
+
+        def do_GET(self) -> None:  # pylint: disable=invalid-name
+            """Health check and statistics"""
+            if self.path == "/health":
+                self._reply(HTTPStatus.OK, {"status": "ok"})
+            elif self.path == "/stats" and stats is not None:
+                self._reply(HTTPStatus.OK, stats())
+            else:
+                self._reply(HTTPStatus.NOT_FOUND, {"error": "not found"})
+
+        def do_POST(self) -> None:  # pylint: disable=invalid-name
+            """Decompiles the assembly of the request"""
+            if self.path != "/decompile":
+                self._reply(HTTPStatus.NOT_FOUND, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length))
+                assembly = request["input"]
+                timeout = float(request.get("timeout", default_timeout))
+            except (ValueError, KeyError, TypeError) as error:
+                self._reply(HTTPStatus.BAD_REQUEST, {"error": f"bad request: {error}"})
+                return
+            try:
+                output = batcher.submit(assembly, timeout)
+            except QueueFullError as error:
+                self._reply(HTTPStatus.SERVICE_UNAVAILABLE, {"error": str(error)})
+            except TimeoutError as error:
+                self._reply(HTTPStatus.GATEWAY_TIMEOUT, {"error": str(error)})
+            except Exception as error:  # pylint: disable=broad-except
+                self._reply(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(error)})
+            else:
+                self._reply(HTTPStatus.OK, {"output": output})
+
+        def _reply(self, status: HTTPStatus, body: dict) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args) -> None:  # pylint: disable=arguments-differ
+            """Requests are not logged, the tooling sends thousands of them"""
+
+    server = ThreadingHTTPServer((host, port), DecompileHandler)
+    server.daemon_threads = True
+    return server
+
+
+def decompile_remote(url: str, assembly: str, timeout: float = 60.0) -> str:
+    """Decompiles assembly with a running server.
+
+    Args:
+        url (str): Base url of the server, e.g. "http://127.0.0.1:8765".
+        assembly (str): Input assembly.
+        timeout (float): Seconds to wait for the output.
+
+    Returns:
+        str: Model output.
+    """
+    request = urllib.request.Request(
+        url.rstrip("/") + "/decompile",
+        data=json.dumps({"input": assembly, "timeout": timeout}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=timeout + 5) as response:
+            return json.loads(response.read())["output"]
+    except urllib.error.HTTPError as error:
+        message = json.loads(error.read()).get("error", error.reason)
+        raise RuntimeError(f"server error {error.code}: {message}") from error
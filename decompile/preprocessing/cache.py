@@ -0,0 +1,250 @@
+"""Persistent content-addressed cache for compilation and disassembly outputs."""
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, ContextManager, Dict, Iterator, Optional, Union
+
+
+@contextmanager
+def connect_index(index_path: Path) -> Iterator[sqlite3.Connection]:
+    """Opens a connection to a sqlite index and commits on exit.
+
+    Args:
+        index_path (Path): Path of the sqlite database.
+
+    Yields:
+        sqlite3.Connection: connection, closed on exit.
+    """
+    connection = sqlite3.connect(index_path, timeout=60)
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+class CompilationCache:
+    """On-disk cache shared by the preprocessing workers. Entries are stored as
+    files named after their key and tracked in a sqlite index, which keeps the
+    cache safe to use from several processes at once. The least recently used
+    entries are evicted once the cache grows past max_size_bytes. Hit and miss
+    counters live in the index too, so lookups done by pool workers are counted.
+
+    Lookups only read the index. Their counters and access times are kept in
+    memory and written in one transaction every flush_every lookups, before
+    an eviction and when stats are read, so that concurrent workers do not
+    queue on the index lock for every hit. The lifetime counters can miss the
+    last lookups of a worker that is terminated without flushing.
+
+    Attributes:
+        cache_folder (Path): Folder holding the entries and the index.
+        max_size_bytes (int): Size budget for all entries together.
+        flush_every (int): Number of lookups between writes of their counters
+            and access times to the index.
+    """
+
+    index_file_name = "index.sqlite3"
+
+    def __init__(
+        self,
+        cache_folder: Union[Path, str],
+        max_size_bytes: int = 4 * 1024**3,
+        flush_every: int = 64,
+    ) -> None:
+        self.cache_folder = Path(cache_folder)
+        self.max_size_bytes = max_size_bytes
+        self.flush_every = flush_every
+        self._pending_counters = {"hits": 0, "misses": 0}
+        self._pending_accesses: Dict[str, float] = {}
+        (self.cache_folder / "entries").mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                + "(key TEXT PRIMARY KEY, size INTEGER, last_access REAL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS counters "
+                + "(name TEXT PRIMARY KEY, value INTEGER)"
+            )
+            connection.execute(
+                "INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0)"
+            )
+            self._initial_counters = dict(
+                connection.execute("SELECT name, value FROM counters")
+            )
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """Pickled copies sent to pool workers start without pending lookups,
+        which stay with the instance that made them."""
+        state = dict(self.__dict__)
+        state["_pending_counters"] = {"hits": 0, "misses": 0}
+        state["_pending_accesses"] = {}
+        return state
+
+    @staticmethod
+    def make_key(*parts: Union[str, bytes]) -> str:
+        """Builds a cache key by hashing all parts together.
+
+        Args:
+            *parts (Union[str, bytes]): Everything the cached output depends on,
+                e.g. the source content, the compiler command and its flags.
+
+        Returns:
+            str: hex digest used as the cache key.
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode("utf-8")
+            digest.update(len(part).to_bytes(8, "little"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def get(self, key: str, destination: Union[Path, str]) -> bool:
+        """Copies the entry for key to destination.
+
+        Args:
+            key (str): Cache key.
+            destination (Union[Path, str]): Path to write the cached file to.
+
+        Returns:
+            bool: True on a cache hit.
+        """
+        data = self.get_bytes(key)
+        if data is None:
+            return False
+        Path(destination).write_bytes(data)
+        return True
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        """Reads the entry for key.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            Optional[bytes]: Cached content, or None on a cache miss.
+        """
+        try:
+            data = self._entry_path(key).read_bytes()
+        except FileNotFoundError:
+            data = None
+        if data is None:
+            self._pending_counters["misses"] += 1
+        else:
+            self._pending_counters["hits"] += 1
+            self._pending_accesses[key] = time.time()
+        if sum(self._pending_counters.values()) >= self.flush_every:
+            self.flush()
+        return data
+
+    def flush(self) -> None:
+        """Writes the counters and access times of the pending lookups to the index."""
+        if not any(self._pending_counters.values()):
+            return
+        with self._connect() as connection:
+            connection.executemany(
+                "UPDATE counters SET value = value + ? WHERE name = ?",
+                [(value, name) for name, value in self._pending_counters.items()],
+            )
+            connection.executemany(
+                "UPDATE entries SET last_access = MAX(last_access, ?) WHERE key = ?",
+                [
+                    (last_access, key)
+                    for key, last_access in self._pending_accesses.items()
+                ],
+            )
+        self._pending_counters = {"hits": 0, "misses": 0}
+        self._pending_accesses = {}
+
+    def put(self, key: str, source: Union[Path, str]) -> None:
+        """Stores a copy of source under key.
+
+        Args:
+            key (str): Cache key.
+            source (Union[Path, str]): File to be cached.
+        """
+        self.put_bytes(key, Path(source).read_bytes())
+
+    def put_bytes(self, key: str, data: bytes) -> None:
+        """Stores data under key, then evicts old entries if needed.
+
+        Args:
+            key (str): Cache key.
+            data (bytes): Content to be cached.
+        """
+        entry_path = self._entry_path(key)
+        entry_path.parent.mkdir(exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=entry_path.parent)
+        with os.fdopen(file_descriptor, "wb") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, entry_path)
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                (key, len(data), time.time()),
+            )
+        self.evict()
+
+    def evict(self) -> None:
+        """Removes least recently used entries until the cache fits max_size_bytes."""
+        self.flush()
+        with self._connect() as connection:
+            (total_size,) = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+            if total_size <= self.max_size_bytes:
+                return
+            rows = connection.execute(
+                "SELECT key, size FROM entries ORDER BY last_access"
+            ).fetchall()
+            for key, size in rows:
+                if total_size <= self.max_size_bytes:
+                    break
+                connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._entry_path(key).unlink(missing_ok=True)
+                total_size -= size
+
+    def stats(self) -> Dict[str, int]:
+        """Cache statistics.
+
+        Returns:
+            Dict[str, int]: hits and misses since this instance was created,
+            hits and misses over the lifetime of the cache folder, number of
+            entries and their total size.
+        """
+        self.flush()
+        with self._connect() as connection:
+            counters = dict(connection.execute("SELECT name, value FROM counters"))
+            entries, size = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+        return {
+            "hits": counters["hits"] - self._initial_counters["hits"],
+            "misses": counters["misses"] - self._initial_counters["misses"],
+            "total_hits": counters["hits"],
+            "total_misses": counters["misses"],
+            "entries": entries,
+            "size_bytes": size,
+        }
+
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM entries")
+        shutil.rmtree(self.cache_folder / "entries")
+        (self.cache_folder / "entries").mkdir()
+
+    def _entry_path(self, key: str) -> Path:
+        """Path of the file holding the entry for key."""
+        return self.cache_folder / "entries" / key[:2] / key
+
+    def _connect(self) -> ContextManager[sqlite3.Connection]:
+        """Opens a connection to the index and commits on exit. Connections are
+        not kept around so that the cache can be pickled and sent to pool workers."""
+        return connect_index(self.cache_folder / CompilationCache.index_file_name)
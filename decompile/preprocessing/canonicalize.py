@@ -0,0 +1,202 @@
+"""Canonical form of standardized objdump assembly: no instruction addresses,
+local labels for branch targets and no line information."""
+import re
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from decompile.preprocessing.metrics import PERCENTILES
+from decompile.preprocessing.shards import iter_jsonl_lines
+
+# "<address>: " at the start of a standardized instruction
+_ADDRESS_PREFIX_PATTERN = re.compile(r"([0-9a-f]+):(?: |$)")
+# "<address> <" starting a symbol reference, e.g. "1a <f_gold+0x1a>"
+_TARGET_START_PATTERN = re.compile(r"(?<![\w$%.])([0-9a-f]+) <")
+# same tokens as the near-duplicate shingles, a tokenizer-free length estimate
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_LABEL_PREFIX = "L"
+# end of the function name of a symbol, before its arguments or offset
+_FUNCTION_NAME_END_PATTERN = re.compile(r"[(+:]")
+
+
+def _find_targets(text: str) -> List[Tuple[int, int, int, str]]:
+    """Symbol references of an instruction, as start, end, address and symbol.
+    Symbols of C++ functions nest angle brackets, e.g. std::vector<int>."""
+    targets: List[Tuple[int, int, int, str]] = []
+    position = 0
+    while True:
+        match = _TARGET_START_PATTERN.search(text, position)
+        if match is None:
+            return targets
+        depth = 0
+        end = match.end() - 1
+        while end < len(text):
+            depth += {"<": 1, ">": -1}.get(text[end], 0)
+            end += 1
+            if depth == 0:
+                break
+        targets.append(
+            (match.start(), end, int(match.group(1), 16), text[match.end() : end - 1])
+        )
+        position = end
+
+
+def _address_lines(body: str, keep_line_info: bool) -> List[Tuple[Optional[int], str]]:
+    """Address and content of the instructions of standardized assembly, lines
+    without an address have None as their address and are dropped unless
+    keep_line_info."""
+    lines: List[Tuple[Optional[int], str]] = []
+    for line in body.split("\n"):
+        if not line:
+            continue
+        content = line[1:-2] if line.startswith("\t") and line.endswith(" ;") else line
+        match = _ADDRESS_PREFIX_PATTERN.match(content)
+        if match is not None:
+            lines.append((int(match.group(1), 16), content[match.end() :]))
+        elif keep_line_info:
+            lines.append((None, content))
+    return lines
+
+
+def _local_labels(
+    header: str,
+    lines: List[Tuple[Optional[int], str]],
+    targets: List[List[Tuple[int, int, int, str]]],
+) -> Dict[int, str]:
+    """Labels of the targets referencing the function by name and at the
+    address of one of its instructions, numbered in address order."""
+    addresses = {address for address, _ in lines if address is not None}
+    function_name = _FUNCTION_NAME_END_PATTERN.split(header, 1)[0]
+    local_targets = {
+        address
+        for found in targets
+        for _, _, address, symbol in found
+        if address in addresses
+        and _FUNCTION_NAME_END_PATTERN.split(symbol, 1)[0] == function_name
+    }
+    return {
+        address: f"{_LABEL_PREFIX}{index}"
+        for index, address in enumerate(sorted(local_targets), start=1)
+    }
+
+
+def _replace_targets(
+    content: str, targets: List[Tuple[int, int, int, str]], labels: Dict[int, str]
+) -> str:
+    """Rewrites the symbol references of an instruction to their local label,
+    or to their symbol without its address."""
+    for start, end, target, symbol in reversed(targets):
+        content = content[:start] + labels.get(target, f"<{symbol}>") + content[end:]
+    return content
+
+
+def canonicalize_asm(asm_text: str, keep_line_info: bool = False) -> str:
+    """Canonical form of the output of standardize_asm. Instruction addresses
+    are dropped. Jump and call targets inside the function, i.e. referencing
+    the function by name and at the address of one of its instructions, are
+    rewritten to local labels L1, L2, ... in address order, and the labelled
+    instructions start with "L<n>: ". Other references keep their symbol
+    without its address. The file:line annotations of objdump --line-numbers
+    and any other line without an address are dropped unless keep_line_info.
+
+    Args:
+        asm_text (str): Output of standardize_asm.
+        keep_line_info (bool): Keep the lines without an address.
+
+    Returns:
+        str: canonical assembly, in the format of standardize_asm.
+    """
+    if not asm_text:
+        return ""
+    header, _, body = asm_text.partition("\n")
+    lines = _address_lines(body, keep_line_info)
+    targets = [_find_targets(content) for _, content in lines]
+    labels = _local_labels(header, lines, targets)
+
+    canonical_buffer = [header + "\n"]
+    for (address, content), found in zip(lines, targets):
+        content = _replace_targets(content, found, labels)
+        if address in labels:
+            content = f"{labels[address]}: {content}"
+        canonical_buffer.append("\t" + content + " ;\n")
+    return "".join(canonical_buffer)
+
+
+def count_tokens(text: str) -> int:
+    """Number of words and punctuation marks of a text, a tokenizer-free
+    estimate of its length in tokens."""
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def _token_summary(tokens: List[int], max_seq_length: int) -> Dict[str, float]:
+    """Total, mean and percentiles of the tokens per record, and the number of
+    records longer than max_seq_length."""
+    counts = np.asarray(tokens, dtype=np.int64)
+    summary: Dict[str, float] = {"total": int(counts.sum())}
+    if len(counts) > 0:
+        summary["mean"] = float(counts.mean())
+        for percentile, value in zip(PERCENTILES, np.percentile(counts, PERCENTILES)):
+            summary[f"p{percentile}"] = float(value)
+    summary["over_max_seq_length"] = int(np.count_nonzero(counts > max_seq_length))
+    return summary
+
+
+def canonicalize_jsonl(
+    jsonl_file_path: Union[Path, str],
+    output_jsonl_path: Union[Path, str],
+    report_path: Optional[Union[Path, str]] = None,
+    *,
+    keep_line_info: bool = False,
+    token_counter: Callable[[str], int] = count_tokens,
+    max_seq_length: int = 1100,
+    field: str = "input",
+) -> Dict[str, Any]:
+    """Canonicalizes the assembly of a jsonl file created by
+    create_jsonl_and_standardize with the objdump backend, and reports how
+    many tokens it saves.
+
+    Args:
+        jsonl_file_path (Union[Path, str]): Path to the jsonl file, or a folder
+            of shards written by ShardedJsonlWriter.
+        output_jsonl_path (Union[Path, str]): Path to the canonical jsonl file.
+        report_path (Optional[Union[Path, str]]): Path to write the report to
+            as json.
+        keep_line_info (bool): Keep the lines without an address.
+        token_counter (Callable[[str], int]): Length of a text in tokens, e.g.
+            lambda text: len(tokenizer(text)["input_ids"]) for the tokenizer
+            of the model.
+        max_seq_length (int): Sequence length of training, assembly longer
+            than this is counted in the report.
+        field (str): Field of the records holding the assembly.
+
+    Returns:
+        Dict[str, Any]: report with the tokens before and after, the
+        reduction, percentiles of the tokens per record and the number of
+        records longer than max_seq_length.
+    """
+    tokens_before = []
+    tokens_after = []
+    with Path(output_jsonl_path).open("w", encoding="utf-8") as output_file:
+        for line in iter_jsonl_lines(jsonl_file_path):
+            record = json.loads(line)
+            tokens_before.append(token_counter(record[field]))
+            record[field] = canonicalize_asm(
+                record[field], keep_line_info=keep_line_info
+            )
+            tokens_after.append(token_counter(record[field]))
+            output_file.write(json.dumps(record) + "\n")
+
+    report: Dict[str, Any] = {
+        "num_records": len(tokens_before),
+        "before": _token_summary(tokens_before, max_seq_length),
+        "after": _token_summary(tokens_after, max_seq_length),
+    }
+    total_before = report["before"]["total"]
+    report["reduction"] = (
+        1 - report["after"]["total"] / total_before if total_before else 0.0
+    )
+    if report_path is not None:
+        Path(report_path).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return report
@@ -0,0 +1,475 @@
+"""Integer-coded columnar corpus of standardized assembly, stored as numpy arrays."""
+import re
+import json
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from decompile.preprocessing.metrics import PERCENTILES
+from decompile.preprocessing.shards import iter_jsonl_lines
+
+Record = Dict[str, Any]
+
+# operand kinds, the operand_kinds column holds indices into this tuple
+OPERAND_KINDS = ("other", "register", "immediate", "memory", "target")
+# column name to its widest dtype. Columns are saved as <name>.npy with the
+# narrowest signed integer dtype holding their values
+COLUMNS = {
+    # vocabulary id of the function label line of every record, -1 for no assembly
+    "headers": np.int32,
+    # first line of every record, plus the total at the end
+    "line_offsets": np.int64,
+    # instruction address of every line, -1 for lines without one
+    "addresses": np.int64,
+    # vocabulary id of the mnemonic of every line, -1 for an address alone
+    "opcodes": np.int32,
+    # first operand of every line, plus the total at the end
+    "operand_offsets": np.int64,
+    "operands": np.int32,
+    "operand_kinds": np.int8,
+}
+VOCABULARY_FILE = "vocabulary.json"
+# the jsonl records with the assembly field set to null
+RECORDS_FILE = "records.jsonl"
+
+_NO_ID = -1
+_OPERAND_SEPARATOR = " , "
+_LINE_PREFIX = "\t"
+_LINE_SUFFIX = " ;"
+# objdump addresses are lowercase hex without leading zeros
+_ADDRESS_PATTERN = re.compile(r"(0|[1-9a-f][0-9a-f]{0,14}):(?= |$)")
+# call targets of compiler assembly, e.g. memset@PLT or mangled names
+_SYMBOL_PATTERN = re.compile(r"[A-Za-z_.$][\w.$]*(@\w+)?")
+_IMMEDIATE_PATTERN = re.compile(r"\$?-?(0x[0-9a-fA-F]+|\d+)")
+# intel syntax registers, at&t ones start with %
+_REGISTER_PATTERN = re.compile(
+    r"[re]?[abcd]x|[abcd][lh]|[re]?(si|di|bp|sp|ip)|(si|di|bp|sp)l"
+    + r"|r\d{1,2}[dwb]?|[xyz]mm\d{1,2}|st(\(\d\))?|[c-gs]s"
+)
+# multipliers of the position hashes of deduplication, odd
+_OPERAND_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_LINE_MULTIPLIER = np.uint64(0xC2B2AE3D27D4EB4F)
+_HEADER_MULTIPLIER = np.uint64(0x165667B19E3779F9)
+
+
+def operand_kind(operand: str) -> int:
+    """Kind of an operand of a standardized instruction.
+
+    Args:
+        operand (str): Operand, e.g. "%eax", "$0x1", "-0x4(%rbp)" or
+            "1a <f_gold+0x1a>".
+
+    Returns:
+        int: index into OPERAND_KINDS.
+    """
+    if "<" in operand or operand.startswith(".L"):
+        return OPERAND_KINDS.index("target")
+    if "(" in operand or "[" in operand:
+        return OPERAND_KINDS.index("memory")
+    if operand.startswith("%") or _REGISTER_PATTERN.fullmatch(operand):
+        return OPERAND_KINDS.index("register")
+    if _IMMEDIATE_PATTERN.fullmatch(operand):
+        return OPERAND_KINDS.index("immediate")
+    if _SYMBOL_PATTERN.fullmatch(operand):
+        return OPERAND_KINDS.index("target")
+    return OPERAND_KINDS.index("other")
+
+
+def split_instruction(body: str) -> Tuple[int, Optional[str], List[str]]:
+    """Splits a standardized instruction, without its tab and " ;", into its
+    address, mnemonic and operands. " ".join of the address, the mnemonic and
+    the operands joined by " , " gives the instruction back.
+
+    Args:
+        body (str): Instruction, e.g. "4: movl %edi , -0x4(%rbp)".
+
+    Returns:
+        Tuple[int, Optional[str], List[str]]: address or -1, mnemonic or None
+        for an address alone, operands.
+    """
+    address = _NO_ID
+    match = _ADDRESS_PATTERN.match(body)
+    if match is not None:
+        address = int(match.group(1), 16)
+        if match.end() == len(body):
+            return address, None, []
+        body = body[match.end() + 1 :]
+    mnemonic, separator, operand_text = body.partition(" ")
+    if not separator:
+        return address, mnemonic, []
+    return address, mnemonic, _split_operands(operand_text)
+
+
+def _split_operands(operand_text: str) -> List[str]:
+    """Splits operands on the separators outside of brackets, so that memory
+    operands and symbols keep their own commas."""
+    if not any(bracket in operand_text for bracket in "(<["):
+        return operand_text.split(_OPERAND_SEPARATOR)
+    operands = []
+    depth = 0
+    start = 0
+    position = 0
+    while position < len(operand_text):
+        character = operand_text[position]
+        if character in "(<[":
+            depth += 1
+        elif character in ")>]":
+            depth -= 1
+        elif depth == 0 and operand_text.startswith(_OPERAND_SEPARATOR, position):
+            operands.append(operand_text[start:position])
+            position += len(_OPERAND_SEPARATOR)
+            start = position
+            continue
+        position += 1
+    operands.append(operand_text[start:])
+    return operands
+
+
+def _narrowest(values: np.ndarray) -> np.ndarray:
+    """values with the narrowest signed integer dtype holding all of them."""
+    for dtype in (np.int8, np.int16, np.int32):
+        limits = np.iinfo(dtype)
+        if len(values) == 0 or (
+            values.min() >= limits.min and values.max() <= limits.max
+        ):
+            return values.astype(dtype)
+    return values
+
+
+def _segment_sums(values: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """Wrapping uint64 sums of the segments of values between offsets."""
+    cumulative = np.zeros(len(values) + 1, dtype=np.uint64)
+    np.cumsum(values, dtype=np.uint64, out=cumulative[1:])
+    return cumulative[offsets[1:]] - cumulative[offsets[:-1]]
+
+
+def _positions(offsets: np.ndarray) -> np.ndarray:
+    """Position of every element within its segment."""
+    counts = np.diff(offsets)
+    return np.arange(offsets[-1], dtype=np.int64) - np.repeat(offsets[:-1], counts)
+
+
+def _powers(multiplier: np.uint64, positions: np.ndarray) -> np.ndarray:
+    """Wrapping uint64 multiplier ** (position + 1) of every position."""
+    table = np.full(int(positions.max(initial=0)) + 1, multiplier, dtype=np.uint64)
+    return np.cumprod(table, dtype=np.uint64)[positions]
+
+
+class _ColumnBuilder:
+    """Columns and vocabulary of a corpus being encoded."""
+
+    def __init__(self) -> None:
+        self.vocabulary: Dict[str, int] = {}
+        self.columns = {
+            "headers": array("i"),
+            "line_offsets": array("q", [0]),
+            "addresses": array("q"),
+            "opcodes": array("i"),
+            "operand_offsets": array("q", [0]),
+            "operands": array("i"),
+            "operand_kinds": array("b"),
+        }
+
+    def _token_id(self, token: str) -> int:
+        return self.vocabulary.setdefault(token, len(self.vocabulary))
+
+    def add(self, asm: str) -> None:
+        """Encodes the standardized assembly of a record.
+
+        Args:
+            asm (str): Output of standardize_asm or standardize_compiler_asm.
+
+        Raises:
+            ValueError: If asm is not standardized assembly.
+        """
+        columns = self.columns
+        if not asm:
+            columns["headers"].append(_NO_ID)
+            columns["line_offsets"].append(len(columns["opcodes"]))
+            return
+        lines = asm.split("\n")
+        if len(lines) < 2 or lines[-1]:
+            raise ValueError(f"Not standardized assembly: {asm[:80]!r}")
+        columns["headers"].append(self._token_id(lines[0]))
+        for line in lines[1:-1]:
+            if not (line.startswith(_LINE_PREFIX) and line.endswith(_LINE_SUFFIX)):
+                raise ValueError(f"Not a standardized instruction: {line!r}")
+            address, mnemonic, operands = split_instruction(
+                line[len(_LINE_PREFIX) : -len(_LINE_SUFFIX)]
+            )
+            columns["addresses"].append(address)
+            columns["opcodes"].append(
+                _NO_ID if mnemonic is None else self._token_id(mnemonic)
+            )
+            for operand in operands:
+                columns["operands"].append(self._token_id(operand))
+                columns["operand_kinds"].append(operand_kind(operand))
+            columns["operand_offsets"].append(len(columns["operands"]))
+        columns["line_offsets"].append(len(columns["opcodes"]))
+
+    def save(self, output_folder: Path) -> None:
+        """Writes the columns and the vocabulary to output_folder."""
+        for name, dtype in COLUMNS.items():
+            np.save(
+                output_folder / f"{name}.npy",
+                _narrowest(np.array(self.columns[name], dtype)),
+            )
+        tokens = sorted(self.vocabulary, key=self.vocabulary.__getitem__)
+        (output_folder / VOCABULARY_FILE).write_text(
+            json.dumps(
+                {"tokens": tokens, "operand_kinds": list(OPERAND_KINDS)},
+                ensure_ascii=False,
+            ),
+            encoding="utf-8",
+        )
+
+
+class ColumnarCorpus:
+    """Standardized assembly of a corpus as integer columns with a shared
+    vocabulary of mnemonics, operands and function labels. Every record is a
+    range of lines and every line a range of operands, like a CSR matrix, so
+    statistics are computed with numpy over the whole corpus at once instead
+    of parsing text. The columns are memory-mapped and decode back to the
+    exact text of the standardizer.
+
+    Attributes:
+        corpus_folder (Path): Folder of the columns, vocabulary and records.
+        tokens (List[str]): Vocabulary, indexed by the ids of the columns.
+        field (str): Field of the records holding the assembly.
+    """
+
+    def __init__(self, corpus_folder: Union[Path, str], field: str = "input") -> None:
+        """Opens a corpus written by from_records or from_jsonl.
+
+        Args:
+            corpus_folder (Union[Path, str]): Folder of the corpus.
+            field (str): Field of the records holding the assembly.
+        """
+        self.corpus_folder = Path(corpus_folder)
+        self.field = field
+        vocabulary = json.loads(
+            (self.corpus_folder / VOCABULARY_FILE).read_text(encoding="utf-8")
+        )
+        self.tokens: List[str] = vocabulary["tokens"]
+        self.headers = self._load("headers")
+        self.line_offsets = self._load("line_offsets")
+        self.addresses = self._load("addresses")
+        self.opcodes = self._load("opcodes")
+        self.operand_offsets = self._load("operand_offsets")
+        self.operands = self._load("operands")
+        self.operand_kinds = self._load("operand_kinds")
+
+    def _load(self, name: str) -> np.ndarray:
+        """Memory-maps a column."""
+        return np.load(self.corpus_folder / f"{name}.npy", mmap_mode="r")
+
+    @staticmethod
+    def from_records(
+        records: Iterable[Record],
+        output_folder: Union[Path, str],
+        field: str = "input",
+    ) -> "ColumnarCorpus":
+        """Encodes the standardized assembly of records into a corpus. The rest
+        of every record is kept next to the columns.
+
+        Args:
+            records (Iterable[Record]): jsonl records.
+            output_folder (Union[Path, str]): Folder of the corpus.
+            field (str): Field of the records holding the assembly.
+
+        Returns:
+            ColumnarCorpus: the corpus.
+        """
+        output_folder = Path(output_folder)
+        output_folder.mkdir(parents=True, exist_ok=True)
+        builder = _ColumnBuilder()
+        with (output_folder / RECORDS_FILE).open("w", encoding="utf-8") as records_file:
+            for record in records:
+                builder.add(record[field])
+                records_file.write(json.dumps({**record, field: None}) + "\n")
+        builder.save(output_folder)
+        return ColumnarCorpus(output_folder, field)
+
+    @staticmethod
+    def from_jsonl(
+        jsonl_file_path: Union[Path, str],
+        output_folder: Union[Path, str],
+        field: str = "input",
+    ) -> "ColumnarCorpus":
+        """Encodes a jsonl file created by create_jsonl_and_standardize.
+
+        Args:
+            jsonl_file_path (Union[Path, str]): Path to the jsonl file, or a
+                folder of shards written by ShardedJsonlWriter.
+            output_folder (Union[Path, str]): Folder of the corpus.
+            field (str): Field of the records holding the assembly.
+
+        Returns:
+            ColumnarCorpus: the corpus.
+        """
+        return ColumnarCorpus.from_records(
+            (json.loads(line) for line in iter_jsonl_lines(jsonl_file_path)),
+            output_folder,
+            field,
+        )
+
+    def __len__(self) -> int:
+        return len(self.headers)
+
+    def __getitem__(self, record_index: int) -> str:
+        """Decodes the standardized assembly of a record.
+
+        Args:
+            record_index (int): Index of the record.
+
+        Returns:
+            str: standardized assembly, as written by the standardizer.
+        """
+        header = int(self.headers[record_index])
+        if header == _NO_ID:
+            return ""
+        tokens = self.tokens
+        start, end = self.line_offsets[record_index : record_index + 2].tolist()
+        operand_offsets = self.operand_offsets[start : end + 1].tolist()
+        operands = self.operands[operand_offsets[0] : operand_offsets[-1]].tolist()
+        buffer = [tokens[header], "\n"]
+        for line, (address, opcode) in enumerate(
+            zip(self.addresses[start:end].tolist(), self.opcodes[start:end].tolist())
+        ):
+            parts = [] if address == _NO_ID else [f"{address:x}:"]
+            if opcode != _NO_ID:
+                parts.append(tokens[opcode])
+            first = operand_offsets[line] - operand_offsets[0]
+            last = operand_offsets[line + 1] - operand_offsets[0]
+            if last > first:
+                parts[-1] += " " + _OPERAND_SEPARATOR.join(
+                    tokens[operand] for operand in operands[first:last]
+                )
+            buffer.append(_LINE_PREFIX + " ".join(parts) + _LINE_SUFFIX + "\n")
+        return "".join(buffer)
+
+    def records(self) -> Iterator[Record]:
+        """Decodes the jsonl records in order.
+
+        Yields:
+            Record: jsonl records, equal to the encoded ones.
+        """
+        with (self.corpus_folder / RECORDS_FILE).open(encoding="utf-8") as records:
+            for record_index, line in enumerate(records):
+                record = json.loads(line)
+                record[self.field] = self[record_index]
+                yield record
+
+    def to_jsonl(
+        self, jsonl_file_path: Union[Path, str], keep: Optional[np.ndarray] = None
+    ) -> int:
+        """Writes the records back to a jsonl file.
+
+        Args:
+            jsonl_file_path (Union[Path, str]): Path to the jsonl file.
+            keep (Optional[np.ndarray]): Boolean mask of the records to write,
+                e.g. ~duplicate_mask(). All of them by default.
+
+        Returns:
+            int: Number of records written.
+        """
+        num_written = 0
+        with Path(jsonl_file_path).open("w", encoding="utf-8") as jsonl_file:
+            for record_index, record in enumerate(self.records()):
+                if keep is None or keep[record_index]:
+                    jsonl_file.write(json.dumps(record) + "\n")
+                    num_written += 1
+        return num_written
+
+    def instruction_counts(self) -> np.ndarray:
+        """Number of lines of every record."""
+        return np.diff(self.line_offsets)
+
+    def opcode_histogram(self, top: Optional[int] = None) -> Dict[str, int]:
+        """Number of lines of every mnemonic over the corpus.
+
+        Args:
+            top (Optional[int]): Number of most frequent mnemonics to return,
+                all of them by default.
+
+        Returns:
+            Dict[str, int]: counts by mnemonic, most frequent first.
+        """
+        opcodes = np.asarray(self.opcodes)
+        counts = np.bincount(opcodes[opcodes != _NO_ID], minlength=len(self.tokens))
+        order = np.argsort(-counts, kind="stable")[: np.count_nonzero(counts)]
+        return {self.tokens[token]: int(counts[token]) for token in order[:top]}
+
+    def operand_kind_histogram(self) -> Dict[str, int]:
+        """Number of operands of every kind over the corpus."""
+        counts = np.bincount(self.operand_kinds, minlength=len(OPERAND_KINDS))
+        return dict(zip(OPERAND_KINDS, counts.tolist()))
+
+    def statistics(self, top: int = 20) -> Dict[str, Any]:
+        """Corpus-wide statistics.
+
+        Args:
+            top (int): Number of most frequent mnemonics listed.
+
+        Returns:
+            Dict[str, Any]: number of records, instructions, operands and
+            tokens, instructions per record, mnemonic and operand kind counts.
+        """
+        with_assembly = np.asarray(self.headers) != _NO_ID
+        instruction_counts = self.instruction_counts()[with_assembly]
+        instructions_per_record: Dict[str, float] = {}
+        if len(instruction_counts) > 0:
+            instructions_per_record["mean"] = float(instruction_counts.mean())
+            for percentile, value in zip(
+                PERCENTILES, np.percentile(instruction_counts, PERCENTILES)
+            ):
+                instructions_per_record[f"p{percentile}"] = float(value)
+            instructions_per_record["max"] = float(instruction_counts.max())
+        return {
+            "num_records": len(self),
+            "num_without_assembly": int(np.count_nonzero(~with_assembly)),
+            "num_instructions": int(self.line_offsets[-1]),
+            "num_operands": int(self.operand_offsets[-1]),
+            "vocabulary_size": len(self.tokens),
+            "instructions_per_record": instructions_per_record,
+            "opcodes": self.opcode_histogram(top),
+            "operand_kinds": self.operand_kind_histogram(),
+        }
+
+    def record_hashes(self) -> np.ndarray:
+        """64-bit hash of every record over its function label, mnemonics and
+        operands, in order. Instruction addresses are left out, so functions
+        that only differ by where they were placed hash the same.
+
+        Returns:
+            np.ndarray: uint64 hash of every record.
+        """
+        operand_offsets = np.asarray(self.operand_offsets)
+        line_offsets = np.asarray(self.line_offsets)
+        operand_terms = (np.asarray(self.operands).astype(np.uint64) + 1) * _powers(
+            _OPERAND_MULTIPLIER, _positions(operand_offsets)
+        )
+        line_hashes = np.asarray(self.opcodes).astype(np.uint64) + 1
+        line_hashes += _segment_sums(operand_terms, operand_offsets)
+        line_hashes += np.diff(operand_offsets).astype(np.uint64)
+        line_terms = line_hashes * _powers(_LINE_MULTIPLIER, _positions(line_offsets))
+        record_hashes = (
+            np.asarray(self.headers).astype(np.uint64) + 1
+        ) * _HEADER_MULTIPLIER
+        record_hashes += _segment_sums(line_terms, line_offsets)
+        record_hashes += np.diff(line_offsets).astype(np.uint64)
+        return record_hashes
+
+    def duplicate_mask(self) -> np.ndarray:
+        """Records whose assembly, addresses aside, equals that of an earlier
+        record. Records without assembly count as duplicates of each other.
+
+        Returns:
+            np.ndarray: boolean mask of the duplicates.
+        """
+        _, first_records = np.unique(self.record_hashes(), return_index=True)
+        mask = np.ones(len(self), dtype=bool)
+        mask[first_records] = False
+        return mask
@@ -0,0 +1,391 @@
+"""Near-duplicate detection of jsonl records with MinHash and LSH."""
+import re
+import json
+import zlib
+import tempfile
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
+
+import numpy as np
+
+from decompile.preprocessing.shards import (
+    ShardedJsonlWriter,
+    iter_jsonl_lines,
+    shard_compression,
+)
+
+_HASH_SHIFT = np.uint64(32)
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def shingle_hashes(text: str, shingle_size: int) -> np.ndarray:
+    """32-bit hashes of the token shingles of a text.
+
+    Args:
+        text (str): Source code or standardized assembly.
+        shingle_size (int): Number of tokens of a shingle.
+
+    Returns:
+        np.ndarray: Distinct shingle hashes.
+    """
+    tokens = _TOKEN_PATTERN.findall(text)
+    shingles = {
+        " ".join(tokens[start : start + shingle_size])
+        for start in range(max(len(tokens) - shingle_size + 1, 1))
+    }
+    return np.array(
+        [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64
+    )
+
+
+def lsh_parameters(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """Number of bands and rows per band whose LSH threshold (1/b)^(1/r) is
+    the closest to threshold.
+
+    Args:
+        num_perm (int): Length of the MinHash signatures.
+        threshold (float): Jaccard similarity of near-duplicates.
+
+    Returns:
+        Tuple[int, int]: bands and rows per band.
+    """
+    candidates = [
+        (num_perm // rows, rows)
+        for rows in range(1, num_perm + 1)
+        if num_perm % rows == 0
+    ]
+    return min(
+        candidates,
+        key=lambda band_rows: abs((1 / band_rows[0]) ** (1 / band_rows[1]) - threshold),
+    )
+
+
+class MinHasher:
+    """MinHash signatures over token shingles, with the permutations simulated
+    by multiply-shift hashing: the high 32 bits of a * x + b modulo 2**64,
+    which numpy computes with wrapping uint64 arithmetic and no division.
+
+    Attributes:
+        num_perm (int): Length of the signatures.
+        shingle_size (int): Number of tokens of a shingle.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # multipliers must be odd
+        self._a = rng.integers(0, 2**63, num_perm, dtype=np.uint64) * 2 + 1
+        self._b = rng.integers(0, 2**63, num_perm, dtype=np.uint64) * 2
+
+    def signature(self, text: str) -> np.ndarray:
+        """MinHash signature of a text.
+
+        Args:
+            text (str): Source code or standardized assembly.
+
+        Returns:
+            np.ndarray: uint32 signature of length num_perm.
+        """
+        hashes = shingle_hashes(text, self.shingle_size)
+        if len(hashes) == 0:
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        permuted = (hashes[:, None] * self._a[None, :] + self._b) >> _HASH_SHIFT
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def record_signature(self, line: bytes) -> np.ndarray:
+        """Signatures of the assembly and the source of a jsonl line, side by side.
+
+        Args:
+            line (bytes): jsonl line of a record.
+
+        Returns:
+            np.ndarray: uint32 signature of length 2 * num_perm.
+        """
+        record = json.loads(line)
+        return np.concatenate(
+            [self.signature(record["input"]), self.signature(record["output"])]
+        )
+
+
+class _UnionFind:
+    """Disjoint sets of record indices, the smallest index is the root."""
+
+    def __init__(self, size: int) -> None:
+        self.parents = np.arange(size)
+
+    def find(self, index: int) -> int:
+        """Root of the set of index, compressing the path to it."""
+        root = index
+        while self.parents[root] != root:
+            root = self.parents[root]
+        while self.parents[index] != root:
+            self.parents[index], index = root, self.parents[index]
+        return int(root)
+
+    def union(self, first: int, second: int) -> None:
+        """Merges the sets of first and second."""
+        first, second = self.find(first), self.find(second)
+        self.parents[max(first, second)] = min(first, second)
+
+
+def deduplicate_jsonl(
+    jsonl_file_path: Union[Path, str],
+    output_jsonl_path: Union[Path, str],
+    report_path: Union[Path, str],
+    *,
+    nproc: int = 1,
+    asm_threshold: float = 0.8,
+    source_threshold: float = 0.8,
+    num_perm: int = 128,
+    shingle_size: int = 5,
+    chunksize: int = 256,
+    scratch_folder: Optional[Union[Path, str]] = None,
+    max_shard_bytes: int = 256 * 1024**2,
+) -> int:
+    """Removes near-duplicate records from a jsonl file created by
+    create_jsonl_and_standardize. Two records are near-duplicates when the
+    estimated Jaccard similarity of the shingles of their assembly and of
+    their source both reach the thresholds. Candidates are found with LSH on
+    either signature, and clusters of near-duplicates are collapsed to their
+    first record.
+
+    Signatures are computed by a pool of workers and kept in a memory-mapped
+    scratch file, so memory use does not grow with the size of the corpus
+    beyond a few integers per record. The report lists every collapsed cluster.
+    The records of a shard folder are written to a shard folder with the same
+    compression.
+
+    Args:
+        jsonl_file_path (Union[Path, str]): Path to the jsonl file, or a folder
+            of shards written by ShardedJsonlWriter.
+        output_jsonl_path (Union[Path, str]): Path to the deduplicated jsonl
+            file, or to the folder of its shards for a shard folder input.
+        report_path (Union[Path, str]): Path to the json report of the clusters.
+        nproc (int): Number of processes to use for multiprocessing.
+        asm_threshold (float): Similarity of near-duplicate assembly.
+        source_threshold (float): Similarity of near-duplicate source code.
+        num_perm (int): Length of the MinHash signatures.
+        shingle_size (int): Number of tokens of a shingle.
+        chunksize (int): Number of records sent to a worker at once.
+        scratch_folder (Optional[Union[Path, str]]): Folder of the signature file.
+        max_shard_bytes (int): Size bound of the output shards.
+
+    Returns:
+        int: Number of records written.
+    """
+    jsonl_file_path = Path(jsonl_file_path)
+    num_records, clusters = _cluster_records(
+        jsonl_file_path,
+        MinHasher(num_perm, shingle_size),
+        thresholds=(asm_threshold, source_threshold),
+        nproc=nproc,
+        chunksize=chunksize,
+        scratch_folder=scratch_folder,
+    )
+
+    num_written, file_names = _write_kept_records(
+        jsonl_file_path, Path(output_jsonl_path), clusters, max_shard_bytes
+    )
+    Path(report_path).write_text(
+        json.dumps(
+            {
+                "num_records": num_records,
+                "num_kept": num_written,
+                "num_removed": num_records - num_written,
+                "asm_threshold": asm_threshold,
+                "source_threshold": source_threshold,
+                "num_perm": num_perm,
+                "shingle_size": shingle_size,
+                "clusters": [
+                    {
+                        "kept": file_names[members[0]],
+                        "removed": [file_names[index] for index in members[1:]],
+                    }
+                    for members in clusters
+                ],
+            },
+            indent=2,
+        ),
+        encoding="utf-8",
+    )
+    return num_written
+
+
+def _cluster_records(
+    jsonl_file_path: Path,
+    hasher: MinHasher,
+    *,
+    thresholds: Tuple[float, float],
+    nproc: int,
+    chunksize: int,
+    scratch_folder: Optional[Union[Path, str]],
+) -> Tuple[int, List[List[int]]]:
+    """Clusters of near-duplicate records of a jsonl file. Signatures are
+    computed by a pool of workers into a memory-mapped scratch file.
+
+    Args:
+        jsonl_file_path (Path): Path to the jsonl file or shard folder.
+        hasher (MinHasher): Computes the signatures.
+        thresholds (Tuple[float, float]): Similarity of near-duplicate assembly
+            and of near-duplicate source code.
+        nproc (int): Number of processes to use for multiprocessing.
+        chunksize (int): Number of records sent to a worker at once.
+        scratch_folder (Optional[Union[Path, str]]): Folder of the signature file.
+
+    Returns:
+        Tuple[int, List[List[int]]]: number of records, and the sorted record
+        indices of every cluster of two or more.
+    """
+    num_records = sum(1 for _ in iter_jsonl_lines(jsonl_file_path))
+    with tempfile.TemporaryDirectory(dir=scratch_folder) as temp_folder:
+        signatures = np.lib.format.open_memmap(
+            Path(temp_folder) / "signatures.npy",
+            mode="w+",
+            dtype=np.uint32,
+            shape=(max(num_records, 1), 2 * hasher.num_perm),
+        )
+        with Pool(processes=nproc) as pool:
+            for index, signature in enumerate(
+                pool.imap(
+                    hasher.record_signature,
+                    iter_jsonl_lines(jsonl_file_path),
+                    chunksize,
+                )
+            ):
+                signatures[index] = signature
+        clusters = _find_clusters(
+            signatures[:num_records], hasher.num_perm, *thresholds
+        )
+        del signatures
+    return num_records, clusters
+
+
+def _write_kept_records(
+    jsonl_file_path: Path,
+    output_jsonl_path: Path,
+    clusters: List[List[int]],
+    max_shard_bytes: int,
+) -> Tuple[int, Dict[int, str]]:
+    """Copies the records that are not collapsed into the first record of their
+    cluster to output_jsonl_path, as shards if jsonl_file_path is a shard
+    folder.
+
+    Args:
+        jsonl_file_path (Path): Path to the jsonl file or shard folder.
+        output_jsonl_path (Path): Path to the deduplicated jsonl file or shard
+            folder.
+        clusters (List[List[int]]): Sorted record indices of every cluster.
+        max_shard_bytes (int): Size bound of the output shards.
+
+    Returns:
+        Tuple[int, Dict[int, str]]: number of records written, and the file
+        names of the records of the clusters by index.
+    """
+    file_names: Dict[int, str] = {}
+    kept_lines = _kept_lines(jsonl_file_path, clusters, file_names)
+    if jsonl_file_path.is_dir():
+        with ShardedJsonlWriter(
+            output_jsonl_path,
+            max_shard_bytes=max_shard_bytes,
+            compression=shard_compression(jsonl_file_path),
+        ) as writer:
+            for line in kept_lines:
+                writer.write(json.loads(line))
+        return writer.num_records, file_names
+    num_written = 0
+    with output_jsonl_path.open("wb") as output_file:
+        for line in kept_lines:
+            output_file.write(line)
+            num_written += 1
+    return num_written, file_names
+
+
+def _kept_lines(
+    jsonl_file_path: Path, clusters: List[List[int]], file_names: Dict[int, str]
+) -> Iterator[bytes]:
+    """Lines of the records that are not collapsed into the first record of
+    their cluster. The file names of the records of the clusters are stored
+    in file_names while reading.
+
+    Args:
+        jsonl_file_path (Path): Path to the jsonl file or shard folder.
+        clusters (List[List[int]]): Sorted record indices of every cluster.
+        file_names (Dict[int, str]): File names of the records by index.
+
+    Yields:
+        bytes: jsonl lines of the kept records.
+    """
+    removed: Set[int] = set()
+    for members in clusters:
+        removed.update(members[1:])
+    in_clusters = {index for members in clusters for index in members}
+    for index, line in enumerate(iter_jsonl_lines(jsonl_file_path)):
+        if index in in_clusters:
+            file_names[index] = json.loads(line).get("file_name", str(index))
+        if index not in removed:
+            yield line
+
+
+def _band_buckets(signatures: np.ndarray, start: int, rows: int) -> List[np.ndarray]:
+    """Record indices sharing the rows of a band of their signatures, in buckets
+    of two or more.
+
+    Args:
+        signatures (np.ndarray): Signatures of every record.
+        start (int): First column of the band.
+        rows (int): Number of columns of the band.
+
+    Returns:
+        List[np.ndarray]: Record indices of every bucket, in ascending order.
+    """
+    band_keys = np.ascontiguousarray(signatures[:, start : start + rows])
+    band_keys = band_keys.view(np.dtype((np.void, 4 * rows))).ravel()
+    order = np.argsort(band_keys, kind="stable")
+    sorted_keys = band_keys[order]
+    boundaries = np.flatnonzero(sorted_keys[1:] != sorted_keys[:-1]) + 1
+    return [bucket for bucket in np.split(order, boundaries) if len(bucket) > 1]
+
+
+def _find_clusters(
+    signatures: np.ndarray,
+    num_perm: int,
+    asm_threshold: float,
+    source_threshold: float,
+) -> List[List[int]]:
+    """Clusters of near-duplicate records, one band of one signature at a time.
+
+    Args:
+        signatures (np.ndarray): Assembly and source signatures of every record.
+        num_perm (int): Length of a signature.
+        asm_threshold (float): Similarity of near-duplicate assembly.
+        source_threshold (float): Similarity of near-duplicate source code.
+
+    Returns:
+        List[List[int]]: Sorted record indices of every cluster of two or more.
+    """
+    union_find = _UnionFind(len(signatures))
+
+    def is_duplicate(first: int, second: int) -> bool:
+        similarities = signatures[first] == signatures[second]
+        return (
+            similarities[:num_perm].mean() >= asm_threshold
+            and similarities[num_perm:].mean() >= source_threshold
+        )
+
+    for offset, threshold in ((0, asm_threshold), (num_perm, source_threshold)):
+        bands, rows = lsh_parameters(num_perm, threshold)
+        for band in range(bands):
+            for bucket in _band_buckets(signatures, offset + band * rows, rows):
+                # compare against the first record of the bucket only
+                for other in bucket[1:]:
+                    if union_find.find(int(bucket[0])) != union_find.find(
+                        int(other)
+                    ) and is_duplicate(int(bucket[0]), int(other)):
+                        union_find.union(int(bucket[0]), int(other))
+
+    clusters: Dict[int, List[int]] = {}
+    for index in range(len(signatures)):
+        clusters.setdefault(union_find.find(index), []).append(index)
+    return [members for members in clusters.values() if len(members) > 1]
@@ -0,0 +1,118 @@
+"""Compile matrix of the fused pipeline: every source is compiled once per flag
+set, against a standard library header precompiled once per flag set."""
+import subprocess
+from pathlib import Path
+from multiprocessing.pool import Pool
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+from decompile.preprocessing.toolchain import COMPILATION_COMMANDS
+
+# flag sets of the compile matrix, real binaries are mostly optimized
+OPTIMIZATION_FLAG_SETS = ("-O0", "-O1", "-O2", "-O3")
+# header included by most C++ sources of the dataset
+PRECOMPILED_HEADER = "bits/stdc++.h"
+
+
+def build_precompiled_header(
+    include_folder: Union[Path, str],
+    flags: Sequence[str] = (),
+    timeout: float = 300.0,
+) -> bool:
+    """Precompiles PRECOMPILED_HEADER with the C++ command of the preprocessing
+    pipeline into include_folder. Compiling with include_folder on the include
+    path makes g++ load the precompiled header instead of parsing the whole
+    standard library for every source, which is most of the compile time of a
+    small function. g++ only loads a precompiled header built with the same
+    code generation flags and falls back to the real header otherwise, so the
+    generated code is the same either way.
+
+    Args:
+        include_folder (Union[Path, str]): Folder to pass to g++ with -I.
+        flags (Sequence[str]): Flags of the compilations using the header,
+            e.g. the optimization level.
+        timeout (float): Wall clock seconds allowed to the precompilation.
+
+    Returns:
+        bool: True if the precompiled header was built.
+    """
+    include_folder = Path(include_folder)
+    header_file = include_folder / f"{PRECOMPILED_HEADER}.gch"
+    header_file.parent.mkdir(parents=True, exist_ok=True)
+    source_file = include_folder / "precompiled_header.h"
+    source_file.write_text(f"#include <{PRECOMPILED_HEADER}>\n", encoding="utf-8")
+    compiler_command = COMPILATION_COMMANDS[".cpp"].split()
+    try:
+        subprocess.run(
+            compiler_command
+            + list(flags)
+            + ["-x", "c++-header", str(source_file), "-o", str(header_file)],
+            capture_output=True,
+            timeout=timeout,
+            check=True,
+        )
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+        print(f"Precompiling {PRECOMPILED_HEADER} failed with error:\n{e}")
+        return False
+    return True
+
+
+def build_precompiled_headers(
+    pool: Pool,
+    headers_folder: Path,
+    flag_sets: Sequence[str],
+    common_flags: Sequence[str] = (),
+) -> Dict[str, Optional[Path]]:
+    """Precompiles the standard library header once per flag set, in parallel.
+
+    Args:
+        pool (Pool): Workers running the precompilations.
+        headers_folder (Path): Folder holding a sub folder per flag set.
+        flag_sets (Sequence[str]): Compiler flags of every variant.
+        common_flags (Sequence[str]): Code generation flags shared by every
+            variant, e.g. the assembly syntax of the compiler backend.
+
+    Returns:
+        Dict[str, Optional[Path]]: include folder of every flag set, None
+        where the precompilation failed.
+    """
+    folders = [headers_folder / str(index) for index in range(len(flag_sets))]
+    built = pool.starmap(
+        build_precompiled_header,
+        [
+            (folder, list(common_flags) + flag_set.split())
+            for folder, flag_set in zip(folders, flag_sets)
+        ],
+    )
+    return {
+        flag_set: folder if succeeded else None
+        for flag_set, folder, succeeded in zip(flag_sets, folders, built)
+    }
+
+
+def compile_flag_matrix(
+    source_file_path: Union[Path, str],
+    pipeline: Callable[..., Optional[Dict[str, str]]],
+    include_folders: Dict[str, Optional[Path]],
+) -> List[Dict[str, str]]:
+    """Runs the fused pipeline of a source file once per flag set.
+
+    Args:
+        source_file_path (Union[Path, str]): Path for .c/.cpp source file.
+        pipeline (Callable[..., Optional[Dict[str, str]]]): Fused pipeline
+            of a single variant.
+        include_folders (Dict[str, Optional[Path]]): Folder of the
+            precompiled headers of every flag set, None if there are none.
+
+    Returns:
+        List[Dict[str, str]]: jsonl records of the variants that were
+        processed successfully, with their flag set in the "flags" field.
+    """
+    records = []
+    for flag_set, include_folder in include_folders.items():
+        record = pipeline(
+            source_file_path, flags=flag_set.split(), include_folder=include_folder
+        )
+        if record is not None:
+            record["flags"] = flag_set
+            records.append(record)
+    return records
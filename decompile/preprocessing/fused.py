@@ -0,0 +1,308 @@
+"""Single-pass pipeline of a source file: it is compiled, disassembled and
+standardized in memory, without writing to the output folder."""
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Callable, Dict, Optional, Sequence, Union
+
+from decompile.preprocessing.cache import CompilationCache
+from decompile.preprocessing.metrics import (
+    PipelineMetrics,
+    failure_reason,
+    stage_timer,
+)
+from decompile.preprocessing.standardize import (
+    standardize_asm,
+    standardize_compiler_asm,
+)
+from decompile.preprocessing.toolchain import (
+    COMPILATION_COMMANDS,
+    SHARED_MEMORY_FOLDER,
+    assembly_cache_key,
+    assembly_command,
+    compile_cache_key,
+    disassembly_cache_key,
+    include_arguments,
+    objdump_command,
+)
+
+
+def compile_to_assembly_text(
+    source_file_path: Path,
+    syntax_for_assembly_language: str,
+    architecture: str,
+    *,
+    cache: Optional[CompilationCache] = None,
+    metrics: Optional[PipelineMetrics] = None,
+    flags: Sequence[str] = (),
+    include_folder: Optional[Path] = None,
+) -> Optional[str]:
+    """Compiles a source file straight to assembly, skipping objdump.
+
+    Args:
+        source_file_path (Path): Path for .c/.cpp source file.
+        syntax_for_assembly_language (str): syntax type for the assembly output.
+        architecture (str): architecure type for the assembly output.
+        cache (Optional[CompilationCache]): Cache to reuse assembly from.
+        metrics (Optional[PipelineMetrics]): Metrics to record the stage to.
+        flags (Sequence[str]): Extra compiler flags, e.g. the optimization level.
+        include_folder (Optional[Path]): Folder of precompiled headers built
+            with the same flags.
+
+    Returns:
+        Optional[str]: assembly text, or None if compilation failed.
+    """
+    command = assembly_command(
+        source_file_path, syntax_for_assembly_language, architecture, flags
+    )
+    with stage_timer(metrics, "compile", source_file_path.name) as event:
+        source = source_file_path.read_bytes()
+        event["bytes_in"] = len(source)
+        if cache is not None:
+            cache_key = assembly_cache_key(source, command)
+            cached_assembly = cache.get_bytes(cache_key)
+            if cached_assembly is not None:
+                event["cache_hit"] = True
+                event["bytes_out"] = len(cached_assembly)
+                return cached_assembly.decode("utf-8")
+        try:
+            assembly = subprocess.run(
+                command[:-3]
+                + include_arguments(source_file_path, include_folder)
+                + command[-3:],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=True,
+                encoding="utf-8",
+            ).stdout
+        except subprocess.CalledProcessError as e:
+            print(
+                f"Compilation failed with error:\n{e}\n{e.stderr} and "
+                + "the error is associated with the following source file "
+                + f"{source_file_path}"
+            )
+            event["failure"] = failure_reason(e, e.stderr)
+            return None
+        event["bytes_out"] = len(assembly.encode("utf-8"))
+    if cache is not None:
+        cache.put_bytes(cache_key, assembly.encode("utf-8"))
+    return assembly
+
+
+def _compile_to_object(
+    source_file_path: Path,
+    out_file: Path,
+    *,
+    cache: Optional[CompilationCache],
+    metrics: Optional[PipelineMetrics],
+    flags: Sequence[str],
+    include_folder: Optional[Path],
+) -> bool:
+    """Compile stage of compile_disassemble_and_standardize, returns True if
+    out_file was written."""
+    with stage_timer(metrics, "compile", source_file_path.name) as event:
+        event["bytes_in"] = source_file_path.stat().st_size
+        if cache is not None:
+            compile_key = compile_cache_key(source_file_path, flags)
+            if cache.get(compile_key, out_file):
+                event["cache_hit"] = True
+                event["bytes_out"] = out_file.stat().st_size
+                return True
+        try:
+            subprocess.run(
+                COMPILATION_COMMANDS[source_file_path.suffix].split()
+                + list(flags)
+                + include_arguments(source_file_path, include_folder)
+                + [str(source_file_path), "-o", str(out_file)],
+                stderr=subprocess.PIPE,
+                check=True,
+                encoding="utf-8",
+            )
+        except subprocess.CalledProcessError as e:
+            print(
+                f"Compilation failed with error:\n{e}\n{e.stderr} and "
+                + "the error is associated with the following source file "
+                + f"{source_file_path}"
+            )
+            event["failure"] = failure_reason(e, e.stderr)
+            return False
+        if cache is not None:
+            cache.put(compile_key, out_file)
+        event["bytes_out"] = out_file.stat().st_size
+    return True
+
+
+def _disassemble_to_text(
+    out_file: Path,
+    source_file_path: Path,
+    syntax_for_assembly_language: str,
+    architecture: str,
+    *,
+    cache: Optional[CompilationCache],
+    metrics: Optional[PipelineMetrics],
+) -> Optional[str]:
+    """Disassemble stage of compile_disassemble_and_standardize, returns the
+    objdump listing or None if objdump failed."""
+    with stage_timer(metrics, "disassemble", source_file_path.name) as event:
+        event["bytes_in"] = out_file.stat().st_size
+        if cache is not None:
+            disassembly_key = disassembly_cache_key(
+                out_file, syntax_for_assembly_language, architecture
+            )
+            cached_disassembly = cache.get_bytes(disassembly_key)
+            if cached_disassembly is not None:
+                event["cache_hit"] = True
+                event["bytes_out"] = len(cached_disassembly)
+                return cached_disassembly.decode("utf-8")
+        try:
+            disassembly = subprocess.run(
+                objdump_command([out_file], syntax_for_assembly_language, architecture),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=True,
+                encoding="utf-8",
+            ).stdout
+        except subprocess.CalledProcessError as e:
+            print(
+                f"Dissembling failed with error:\n{e}\n{e.stderr} and "
+                + "the error is associated with the following source file "
+                + f"{source_file_path}"
+            )
+            event["failure"] = failure_reason(e, e.stderr)
+            return None
+        if cache is not None:
+            cache.put_bytes(disassembly_key, disassembly.encode("utf-8"))
+        event["bytes_out"] = len(disassembly.encode("utf-8"))
+    return disassembly
+
+
+def standardized_record(
+    source_file_path: Path,
+    assembly: str,
+    standardizer: Callable[[str], str],
+    metrics: Optional[PipelineMetrics] = None,
+) -> Dict[str, str]:
+    """Builds the jsonl record of a source file from its assembly text.
+
+    Args:
+        source_file_path (Path): Path for .c/.cpp source file.
+        assembly (str): objdump listing or compiler assembly of the source.
+        standardizer (Callable[[str], str]): standardize_asm or
+            standardize_compiler_asm.
+        metrics (Optional[PipelineMetrics]): Metrics to record the stage to.
+
+    Returns:
+        Dict[str, str]: jsonl record.
+    """
+    with stage_timer(metrics, "standardize", source_file_path.name) as event:
+        event["bytes_in"] = len(assembly.encode("utf-8"))
+        record = {
+            "input": standardizer(assembly),
+            "output": source_file_path.read_text(encoding="utf-8").strip(),
+            "file_name": source_file_path.name,
+        }
+        event["bytes_out"] = len(record["input"].encode("utf-8"))
+        if not record["input"]:
+            event["failure"] = "no f_gold function in the assembly"
+    return record
+
+
+def compile_disassemble_and_standardize(
+    source_file_path: Union[Path, str],
+    syntax_for_assembly_language: str,
+    architecture: str,
+    *,
+    scratch_folder: Optional[Union[Path, str]] = None,
+    cache: Optional[CompilationCache] = None,
+    metrics: Optional[PipelineMetrics] = None,
+    flags: Sequence[str] = (),
+    include_folder: Optional[Path] = None,
+) -> Optional[Dict[str, str]]:
+    """Runs the whole pipeline for a single source file. The binary is written
+    to a private scratch folder, objdump output is read from a pipe and
+    standardized in memory.
+
+    Args:
+        source_file_path (Union[Path, str]): Path for .c/.cpp source file.
+        syntax_for_assembly_language (str): syntax type for the assembly output.
+        architecture (str): architecure type for the assembly output.
+        scratch_folder (Optional[Union[Path, str]]): Folder for temporary
+            binaries. Defaults to /dev/shm when available.
+        cache (Optional[CompilationCache]): Cache to reuse binaries and
+            listings from.
+        metrics (Optional[PipelineMetrics]): Metrics to record the stages to.
+        flags (Sequence[str]): Extra compiler flags, e.g. the optimization level.
+        include_folder (Optional[Path]): Folder of precompiled headers built
+            with the same flags.
+
+    Returns:
+        Optional[Dict[str, str]]: jsonl record, or None if a stage failed.
+    """
+    source_file_path = Path(source_file_path)
+    if scratch_folder is None and SHARED_MEMORY_FOLDER.is_dir():
+        scratch_folder = SHARED_MEMORY_FOLDER
+    with tempfile.TemporaryDirectory(dir=scratch_folder) as temp_folder:
+        out_file = Path(temp_folder) / source_file_path.with_suffix(".o").name
+        if not _compile_to_object(
+            source_file_path,
+            out_file,
+            cache=cache,
+            metrics=metrics,
+            flags=flags,
+            include_folder=include_folder,
+        ):
+            return None
+        disassembly = _disassemble_to_text(
+            out_file,
+            source_file_path,
+            syntax_for_assembly_language,
+            architecture,
+            cache=cache,
+            metrics=metrics,
+        )
+    if disassembly is None:
+        return None
+    return standardized_record(source_file_path, disassembly, standardize_asm, metrics)
+
+
+def compile_to_assembly_and_standardize(
+    source_file_path: Union[Path, str],
+    syntax_for_assembly_language: str,
+    architecture: str,
+    *,
+    cache: Optional[CompilationCache] = None,
+    metrics: Optional[PipelineMetrics] = None,
+    flags: Sequence[str] = (),
+    include_folder: Optional[Path] = None,
+) -> Optional[Dict[str, str]]:
+    """Runs the whole compiler backend pipeline for a single source file. The
+    assembly is read from the compiler stdout and standardized in memory.
+
+    Args:
+        source_file_path (Union[Path, str]): Path for .c/.cpp source file.
+        syntax_for_assembly_language (str): syntax type for the assembly output.
+        architecture (str): architecure type for the assembly output.
+        cache (Optional[CompilationCache]): Cache to reuse assembly from.
+        metrics (Optional[PipelineMetrics]): Metrics to record the stages to.
+        flags (Sequence[str]): Extra compiler flags, e.g. the optimization level.
+        include_folder (Optional[Path]): Folder of precompiled headers built
+            with the same flags.
+
+    Returns:
+        Optional[Dict[str, str]]: jsonl record, or None if compilation failed.
+    """
+    source_file_path = Path(source_file_path)
+    assembly = compile_to_assembly_text(
+        source_file_path,
+        syntax_for_assembly_language,
+        architecture,
+        cache=cache,
+        metrics=metrics,
+        flags=flags,
+        include_folder=include_folder,
+    )
+    if assembly is None:
+        return None
+    return standardized_record(
+        source_file_path, assembly, standardize_compiler_asm, metrics
+    )
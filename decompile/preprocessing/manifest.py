@@ -0,0 +1,114 @@
+"""Crash-safe progress manifest for resuming the preprocessing pipeline."""
+import os
+import json
+from pathlib import Path
+from typing import Dict, Optional, Tuple, Union
+
+
+class ProgressManifest:
+    """Append-only jsonl log of the pipeline stages each file went through. A
+    line is written and flushed to disk as soon as a file finishes a stage, so
+    after a crash the manifest tells which files are complete. A torn last line
+    left by a crash is ignored when the manifest is loaded.
+
+    Attributes:
+        manifest_path (Path): Path of the manifest file.
+    """
+
+    def __init__(self, manifest_path: Union[Path, str], resume: bool = True) -> None:
+        """Initialize the manifest
+
+        Args:
+            manifest_path (Union[Path, str]): Path of the manifest file.
+            resume (bool): Load the existing manifest. Otherwise it is truncated.
+        """
+        self.manifest_path = Path(manifest_path)
+        # (file name, stage) -> (done, number of failed attempts)
+        self._state: Dict[Tuple[str, str], Tuple[bool, int]] = {}
+        if resume and self.manifest_path.exists():
+            complete_size = 0
+            with self.manifest_path.open("rb") as manifest_file:
+                for line in manifest_file:
+                    if not line.endswith(b"\n"):
+                        break
+                    complete_size += len(line)
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._update(entry["file"], entry["stage"], entry["status"])
+            # drop the torn line so that new entries start on a fresh line
+            os.truncate(self.manifest_path, complete_size)
+        else:
+            self.manifest_path.write_text("", encoding="utf-8")
+
+    def _update(self, file_name: str, stage: str, status: str) -> None:
+        """Applies one manifest entry to the in-memory state."""
+        done, failures = self._state.get((file_name, stage), (False, 0))
+        if status == "done":
+            done = True
+        else:
+            failures += 1
+        self._state[(file_name, stage)] = (done, failures)
+
+    def record(
+        self, file_name: str, stage: str, succeeded: bool, error: Optional[str] = None
+    ) -> None:
+        """Appends the outcome of a stage for a file and syncs it to disk.
+
+        Args:
+            file_name (str): Name of the source file.
+            stage (str): Pipeline stage, e.g. "compile".
+            succeeded (bool): Whether the stage succeeded.
+            error (Optional[str]): Failure reason.
+        """
+        status = "done" if succeeded else "failed"
+        entry = {"file": file_name, "stage": stage, "status": status}
+        if error is not None:
+            entry["error"] = error
+        with self.manifest_path.open("a", encoding="utf-8") as manifest_file:
+            manifest_file.write(json.dumps(entry) + "\n")
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        self._update(file_name, stage, status)
+
+    def is_done(self, file_name: str, stage: str) -> bool:
+        """Whether a file already finished a stage.
+
+        Args:
+            file_name (str): Name of the source file.
+            stage (str): Pipeline stage.
+
+        Returns:
+            bool: True if the stage succeeded for the file.
+        """
+        return self._state.get((file_name, stage), (False, 0))[0]
+
+    def failures(self, file_name: str, stage: str) -> int:
+        """Number of failed attempts of a stage for a file.
+
+        Args:
+            file_name (str): Name of the source file.
+            stage (str): Pipeline stage.
+
+        Returns:
+            int: Number of failed attempts.
+        """
+        return self._state.get((file_name, stage), (False, 0))[1]
+
+    def should_run(self, file_name: str, stage: str, max_retries: int) -> bool:
+        """Whether a stage still has to run for a file: it is not done yet and
+        it has not failed more than max_retries times after its first attempt.
+
+        Args:
+            file_name (str): Name of the source file.
+            stage (str): Pipeline stage.
+            max_retries (int): Number of retries allowed after a failure.
+
+        Returns:
+            bool: True if the stage should run.
+        """
+        return (
+            not self.is_done(file_name, stage)
+            and self.failures(file_name, stage) <= max_retries
+        )
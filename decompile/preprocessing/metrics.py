@@ -0,0 +1,268 @@
+"""Per-stage timings and failure reasons of the preprocessing pipeline."""
+import os
+import re
+import json
+import time
+import resource
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+import numpy as np
+
+STAGES = ("collect", "compile", "disassemble", "standardize", "write")
+PERCENTILES = (50, 95, 99)
+_MEASUREMENTS = ("wall_seconds", "subprocess_seconds", "bytes_in", "bytes_out")
+# compiler diagnostics start with "<file>:<line>:<column>: error: "
+_ERROR_MARKER = "error:"
+_QUOTED_PATH_PATTERN = re.compile(r"'/[^']*'")
+# number of distinct failure reasons listed for every stage
+_MAX_FAILURE_REASONS = 20
+
+
+def _children_cpu_seconds() -> float:
+    """User and system time of the finished child processes of this process."""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def failure_reason(error: Any, stderr: Optional[str] = None) -> str:
+    """Short failure reason of a stage: the error and the first compiler error
+    of stderr, or its last line. File paths are masked so that files failing
+    for the same reason are counted together.
+
+    Args:
+        error (Any): Exception or message describing the failure.
+        stderr (Optional[str]): Error output of the failed subprocess.
+
+    Returns:
+        str: failure reason.
+    """
+    if isinstance(error, BaseException):
+        reason = type(error).__name__
+        returncode = getattr(error, "returncode", None)
+        if returncode is not None:
+            reason += f" (exit status {returncode})"
+    else:
+        reason = str(error)
+    lines = [line.strip() for line in (stderr or "").splitlines() if line.strip()]
+    errors = [line for line in lines if _ERROR_MARKER in line]
+    if errors:
+        reason += ": " + errors[0].split(_ERROR_MARKER, 1)[1].strip()
+    elif lines:
+        reason += ": " + lines[-1]
+    return _QUOTED_PATH_PATTERN.sub("'<file>'", reason)[:200]
+
+
+class PipelineMetrics:
+    """Events of the pipeline stages, one per file and stage, appended to a
+    jsonl file per process in metrics_folder. Pool workers record events
+    without sending them back to the parent, and the parent rolls them up
+    into a report once the stages are done.
+
+    Attributes:
+        metrics_folder (Path): Folder of the event files.
+    """
+
+    event_file_prefix = "events"
+
+    def __init__(self, metrics_folder: Union[Path, str], resume: bool = False) -> None:
+        """Initialize the metrics
+
+        Args:
+            metrics_folder (Union[Path, str]): Folder of the event files.
+            resume (bool): Keep the events of a previous run. Otherwise they
+                are removed.
+        """
+        self.metrics_folder = Path(metrics_folder)
+        self.metrics_folder.mkdir(parents=True, exist_ok=True)
+        if not resume:
+            for event_file in self._event_files():
+                event_file.unlink()
+
+    def _event_files(self) -> List[Path]:
+        """Event files of every process, in a stable order."""
+        return sorted(
+            self.metrics_folder.glob(f"{PipelineMetrics.event_file_prefix}.*.jsonl")
+        )
+
+    def record(self, event: Dict[str, Any]) -> None:
+        """Appends an event to the file of the calling process.
+
+        Args:
+            event (Dict[str, Any]): Event built by stage_timer.
+        """
+        event_file = (
+            self.metrics_folder
+            / f"{PipelineMetrics.event_file_prefix}.{os.getpid()}.jsonl"
+        )
+        with event_file.open("a", encoding="utf-8") as events:
+            events.write(json.dumps(event) + "\n")
+
+    def record_batch(
+        self, batch_event: Dict[str, Any], events: List[Dict[str, Any]]
+    ) -> None:
+        """Records the events of files processed together, e.g. by one objdump
+        process. The wall and subprocess time of the batch are split evenly
+        between its files.
+
+        Args:
+            batch_event (Dict[str, Any]): Event of the whole batch, timed by
+                stage_timer.
+            events (List[Dict[str, Any]]): Events of the files, built by new_event.
+        """
+        for event in events:
+            event["wall_seconds"] = batch_event["wall_seconds"] / len(events)
+            event["subprocess_seconds"] = batch_event["subprocess_seconds"] / len(
+                events
+            )
+            self.record(event)
+
+    def record_concurrent(
+        self, events: List[Dict[str, Any]], subprocess_seconds: float
+    ) -> None:
+        """Records the events of jobs run concurrently by one process, e.g. by
+        SubprocessScheduler. Their wall time is measured per job, but the CPU
+        time of child processes can only be measured for all of them together,
+        so subprocess_seconds is split in proportion to the wall times.
+
+        Args:
+            events (List[Dict[str, Any]]): Events of the files, with their wall time.
+            subprocess_seconds (float): CPU time of all the child processes.
+        """
+        total_wall_seconds = sum(event["wall_seconds"] for event in events)
+        for event in events:
+            if total_wall_seconds > 0:
+                event["subprocess_seconds"] = (
+                    subprocess_seconds * event["wall_seconds"] / total_wall_seconds
+                )
+            self.record(event)
+
+    def events(self) -> Iterator[Dict[str, Any]]:
+        """Recorded events of every process. A torn last line left by a killed
+        worker is skipped.
+
+        Yields:
+            Dict[str, Any]: events.
+        """
+        for event_file in self._event_files():
+            with event_file.open("rb") as events:
+                for line in events:
+                    if line.endswith(b"\n"):
+                        yield json.loads(line)
+
+    def report(self, report_path: Optional[Union[Path, str]] = None) -> Dict[str, Any]:
+        """Rolls the events up into count, failures, failure reasons, cache hits
+        and the total, mean, p50, p95, p99 and max of the wall time, subprocess
+        time, bytes in and bytes out of every stage.
+
+        Args:
+            report_path (Optional[Union[Path, str]]): Path to write the report
+                to as json.
+
+        Returns:
+            Dict[str, Any]: report.
+        """
+        columns: Dict[str, Dict[str, List[float]]] = {}
+        failures: Dict[str, Counter] = {}
+        cache_hits: Counter = Counter()
+        for event in self.events():
+            stage = event["stage"]
+            stage_columns = columns.setdefault(
+                stage, {name: [] for name in _MEASUREMENTS}
+            )
+            for name in _MEASUREMENTS:
+                stage_columns[name].append(event[name])
+            failures.setdefault(stage, Counter())
+            if event["failure"] is not None:
+                failures[stage][event["failure"]] += 1
+            cache_hits[stage] += event["cache_hit"]
+
+        stages: Dict[str, Any] = {}
+        for stage in sorted(columns, key=_stage_order):
+            stages[stage] = {
+                "count": len(columns[stage]["wall_seconds"]),
+                "failures": sum(failures[stage].values()),
+                "failure_reasons": dict(
+                    failures[stage].most_common(_MAX_FAILURE_REASONS)
+                ),
+                "cache_hits": cache_hits[stage],
+            }
+            for name, values in columns[stage].items():
+                stages[stage][name] = _summarize(np.asarray(values, dtype=np.float64))
+        report = {"stages": stages}
+        if report_path is not None:
+            Path(report_path).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        return report
+
+
+def _stage_order(stage: str) -> int:
+    """Position of a stage in the pipeline, unknown stages come last."""
+    return STAGES.index(stage) if stage in STAGES else len(STAGES)
+
+
+def _summarize(values: np.ndarray) -> Dict[str, float]:
+    """Total, mean, percentiles and maximum of a measurement."""
+    if len(values) == 0:
+        return {}
+    summary = {"total": float(values.sum()), "mean": float(values.mean())}
+    for percentile, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{percentile}"] = float(value)
+    summary["max"] = float(values.max())
+    return summary
+
+
+def new_event(stage: str, file_name: str) -> Dict[str, Any]:
+    """Event of a stage of a file with nothing measured yet.
+
+    Args:
+        stage (str): Pipeline stage, e.g. "compile".
+        file_name (str): Name of the processed file.
+
+    Returns:
+        Dict[str, Any]: event.
+    """
+    return {
+        "stage": stage,
+        "file": file_name,
+        "bytes_in": 0,
+        "bytes_out": 0,
+        "failure": None,
+        "cache_hit": False,
+        "wall_seconds": 0.0,
+        "subprocess_seconds": 0.0,
+    }
+
+
+@contextmanager
+def stage_timer(
+    metrics: Optional[PipelineMetrics], stage: str, file_name: str
+) -> Iterator[Dict[str, Any]]:
+    """Times a stage of a file and records it when metrics is not None. The
+    block fills bytes_in, bytes_out, failure and cache_hit of the yielded
+    event. Subprocess time is the CPU time of the child processes that
+    finished inside the block, and an exception escaping the block is
+    recorded as the failure reason.
+
+    Args:
+        metrics (Optional[PipelineMetrics]): Metrics to record the event to.
+        stage (str): Pipeline stage, e.g. "compile".
+        file_name (str): Name of the processed file.
+
+    Yields:
+        Dict[str, Any]: event of the stage.
+    """
+    event = new_event(stage, file_name)
+    start = time.perf_counter()
+    start_cpu = _children_cpu_seconds()
+    try:
+        yield event
+    except Exception as error:
+        event["failure"] = failure_reason(error)
+        raise
+    finally:
+        event["wall_seconds"] = time.perf_counter() - start
+        event["subprocess_seconds"] = _children_cpu_seconds() - start_cpu
+        if metrics is not None:
+            metrics.record(event)
@@ -0,0 +1,214 @@
+"""Disassembly of many binaries with a single objdump process."""
+import os
+import re
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from decompile.preprocessing.cache import CompilationCache
+from decompile.preprocessing.metrics import (
+    PipelineMetrics,
+    failure_reason,
+    new_event,
+    stage_timer,
+)
+from decompile.preprocessing.toolchain import (
+    disassembly_cache_key,
+    objdump_command,
+    temporary_path,
+)
+
+# Line objdump prints before the listing of every input file.
+FILE_FORMAT_HEADER_PATTERN = re.compile(r"^(.*):\s+file format \S+$", re.MULTILINE)
+
+
+class ObjdumpBatch:
+    """Binaries disassembled by one objdump process. The combined output is
+    split into one assembly(.s) file per binary using the "file format" header
+    objdump prints before each of them. Like DatasetJsonl._disassemble_to_assembly,
+    binaries are removed once disassembled and a failed binary leaves an empty
+    assembly file behind. Listings found in the cache are written as soon as
+    the batch is created.
+
+    Attributes:
+        events (Dict[str, Dict[str, Any]]): Disassemble event of every binary
+            by path, with its bytes, cache hit and failure filled in. Events are
+            recorded under the names of the source files when they are given.
+        pending (Dict[str, Path]): Binaries left to disassemble by path.
+    """
+
+    def __init__(
+        self,
+        binary_files: Sequence[Union[Path, str]],
+        syntax_for_assembly_language: str,
+        architecture: str,
+        cache: Optional[CompilationCache] = None,
+        *,
+        source_names: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Initialize the batch and take the listings of its binaries from the cache
+
+        Args:
+            binary_files (Sequence[Union[Path, str]]): Binary file paths.
+            syntax_for_assembly_language (str): syntax type for the assembly output files.
+            architecture (str): architecure type for assembly output files.
+            cache (Optional[CompilationCache]): Cache to reuse and store listings.
+            source_names (Optional[Sequence[str]]): File names of the sources of
+                the binaries, defaults to the names of the binaries.
+        """
+        self.syntax_for_assembly_language = syntax_for_assembly_language
+        self.architecture = architecture
+        self.cache = cache
+        self.events: Dict[str, Dict[str, Any]] = {}
+        self.pending: Dict[str, Path] = {}
+        self._cache_keys: Dict[str, str] = {}
+        binary_paths = [Path(binary_file) for binary_file in binary_files]
+        if source_names is None:
+            source_names = [binary_file.name for binary_file in binary_paths]
+        for binary_file, source_name in zip(binary_paths, source_names):
+            event = new_event("disassemble", source_name)
+            self.events[str(binary_file)] = event
+            if binary_file.exists():
+                event["bytes_in"] = binary_file.stat().st_size
+            if cache is not None and binary_file.exists():
+                cache_key = disassembly_cache_key(
+                    binary_file, syntax_for_assembly_language, architecture
+                )
+                temp_file = temporary_path(binary_file.with_suffix(".s"))
+                if cache.get(cache_key, temp_file):
+                    event["cache_hit"] = True
+                    event["bytes_out"] = temp_file.stat().st_size
+                    os.replace(temp_file, binary_file.with_suffix(".s"))
+                    os.remove(binary_file)
+                    continue
+                self._cache_keys[str(binary_file)] = cache_key
+            self.pending[str(binary_file)] = binary_file
+
+    def command(self) -> List[str]:
+        """objdump command disassembling the pending binaries.
+
+        Returns:
+            List[str]: objdump command as a list of arguments.
+        """
+        return objdump_command(
+            list(self.pending.values()),
+            self.syntax_for_assembly_language,
+            self.architecture,
+        )
+
+    def run(self) -> List[Path]:
+        """Disassembles the pending binaries with one objdump process.
+
+        Returns:
+            List[Path]: Binary files that failed to disassemble.
+        """
+        if not self.pending:
+            return []
+        process = subprocess.run(
+            self.command(),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=False,
+            encoding="utf-8",
+        )
+        return self.split_listing(
+            process.stdout, process.stderr, f"objdump exit status {process.returncode}"
+        )
+
+    def split_listing(self, listing: str, errors: str, error: str) -> List[Path]:
+        """Splits the objdump output of the pending binaries into one assembly(.s)
+        file per binary. A binary missing from the listing, e.g. because it is
+        not an object file, gets an empty assembly file and does not shift the
+        listings of the others.
+
+        Args:
+            listing (str): objdump stdout.
+            errors (str): objdump stderr.
+            error (str): Failure reason of the binaries missing from the listing.
+
+        Returns:
+            List[Path]: Binary files that failed to disassemble.
+        """
+        headers = [
+            match
+            for match in FILE_FORMAT_HEADER_PATTERN.finditer(listing)
+            if match.group(1) in self.pending
+        ]
+        for position, match in enumerate(headers):
+            # each listing starts with the empty line printed before its header
+            start = max(match.start() - 1, 0)
+            end = (
+                headers[position + 1].start() - 1
+                if position + 1 < len(headers)
+                else len(listing)
+            )
+            binary_file = self.pending.pop(match.group(1))
+            temp_file = self._write_assembly(binary_file, listing[start:end])
+            self.events[str(binary_file)]["bytes_out"] = temp_file.stat().st_size
+            if self.cache is not None and str(binary_file) in self._cache_keys:
+                self.cache.put(self._cache_keys[str(binary_file)], temp_file)
+            os.replace(temp_file, binary_file.with_suffix(".s"))
+            os.remove(binary_file)
+
+        for file_name, binary_file in self.pending.items():
+            os.replace(
+                self._write_assembly(binary_file, ""), binary_file.with_suffix(".s")
+            )
+            file_errors = [line for line in errors.splitlines() if file_name in line]
+            self.events[file_name]["failure"] = failure_reason(
+                error, "\n".join(file_errors)
+            )
+            print(
+                f"Dissembling failed with error:\n{' '.join(file_errors)} and "
+                + "the error is associated with the following output file "
+                + f"{binary_file.with_suffix('.s')}"
+            )
+        failed = list(self.pending.values())
+        self.pending = {}
+        return failed
+
+    @staticmethod
+    def _write_assembly(binary_file: Path, assembly: str) -> Path:
+        """Writes the assembly of a binary to the temporary path of its assembly file."""
+        temp_file = temporary_path(binary_file.with_suffix(".s"))
+        temp_file.write_text(assembly, encoding="utf-8")
+        return temp_file
+
+
+def disassemble_batch_to_assembly(
+    binary_files: Sequence[Union[Path, str]],
+    syntax_for_assembly_language: str,
+    architecture: str,
+    cache: Optional[CompilationCache] = None,
+    metrics: Optional[PipelineMetrics] = None,
+    *,
+    source_names: Optional[Sequence[str]] = None,
+) -> List[Path]:
+    """Disassembles many binary files with a single objdump process into one
+    assembly(.s) file per binary, see ObjdumpBatch.
+
+    Args:
+        binary_files (Sequence[Union[Path, str]]): Disassembled binary file paths.
+        syntax_for_assembly_language (str): syntax type for the assembly output files.
+        architecture (str): architecure type for assembly output files.
+        cache (Optional[CompilationCache]): Cache to reuse listings from.
+        metrics (Optional[PipelineMetrics]): Metrics to record the stage to,
+            the time of the batch is split evenly between its binaries.
+        source_names (Optional[Sequence[str]]): File names of the sources of
+            the binaries the events are recorded under.
+
+    Returns:
+        List[Path]: Binary files that failed to disassemble.
+    """
+    with stage_timer(None, "disassemble", "") as batch_event:
+        batch = ObjdumpBatch(
+            binary_files,
+            syntax_for_assembly_language,
+            architecture,
+            cache,
+            source_names=source_names,
+        )
+        failed = batch.run()
+    if metrics is not None and batch.events:
+        metrics.record_batch(batch_event, list(batch.events.values()))
+    return failed
@@ -0,0 +1,209 @@
+"""Parse objdump listings into an index of all of their functions."""
+import re
+import mmap
+from pathlib import Path
+from dataclasses import dataclass
+from types import TracebackType
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Type, Union
+
+from decompile.preprocessing.standardize import AsmListing, standardize_instruction
+
+_FUNCTION_HEADER_PATTERN = re.compile(
+    rb"^([0-9a-fA-F]{16}) <(.*)>:[ \t\r]*$", re.MULTILINE
+)
+_SECTION_HEADER_PATTERN = re.compile(rb"^Disassembly of section (.*):", re.MULTILINE)
+# instruction lines kept by standardize, which drops the endbr64 landing pads
+_INSTRUCTION_PATTERN = re.compile(
+    rb"^[ \t]*[0-9a-fA-F]+:\t(?![^\n]*endbr64)", re.MULTILINE
+)
+
+
+@dataclass
+class FunctionSpan:
+    """Location of a function inside an objdump listing
+
+    Attributes:
+        symbol (str): Demangled symbol name, e.g. "f_gold(int)".
+        address (int): Address of the function in its section.
+        section (str): Section holding the function, e.g. ".text".
+        start (int): Byte offset of the function header line.
+        end (int): Byte offset right after the last line of the function.
+        num_instructions (int): Number of instructions in the function, without
+            the endbr64 instructions that standardize drops.
+    """
+
+    symbol: str
+    address: int
+    section: str
+    start: int
+    end: int
+    num_instructions: int
+
+
+class ObjdumpListing:
+    """objdump listing parsed once into an index of every function. Function
+    bodies are only decoded and standardized when they are requested. A
+    listing read with from_file memory-maps the file until it is closed, so
+    it should be used as a context manager.
+
+    Attributes:
+        index (Dict[str, FunctionSpan]): Functions by symbol, in listing order.
+            A symbol found more than once gets a "#<n>" suffix from its second
+            occurrence on.
+    """
+
+    def __init__(self, listing: AsmListing) -> None:
+        """Initialize the listing and build its function index
+
+        Args:
+            listing (AsmListing): objdump output as text, bytes or a memory map.
+        """
+        self._listing: Union[bytes, bytearray, mmap.mmap] = (
+            listing.encode("utf-8") if isinstance(listing, str) else listing
+        )
+        self._standardized: Dict[str, str] = {}
+        self.index: Dict[str, FunctionSpan] = {}
+        self._build_index()
+
+    def close(self) -> None:
+        """Unmaps the file of a listing read with from_file. Standardized
+        functions stay available, raw text is not."""
+        if isinstance(self._listing, mmap.mmap):
+            self._listing.close()
+
+    def __enter__(self) -> "ObjdumpListing":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.close()
+
+    @classmethod
+    def from_file(cls, asm_file_path: Union[Path, str]) -> "ObjdumpListing":
+        """Parse an objdump listing stored in a file.
+
+        Args:
+            asm_file_path (Union[Path, str]): path to asm file.
+
+        Returns:
+            ObjdumpListing: parsed listing.
+        """
+        asm_file_path = Path(asm_file_path)
+        if asm_file_path.stat().st_size == 0:
+            return cls(b"")
+        with asm_file_path.open("rb") as file:
+            return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _build_index(self) -> None:
+        """Finds every function header and section header in one pass over the
+        listing. A function ends where the next function or section starts."""
+        boundaries = []
+        for match in _FUNCTION_HEADER_PATTERN.finditer(self._listing):
+            boundaries.append((match.start(), match))
+        for match in _SECTION_HEADER_PATTERN.finditer(self._listing):
+            boundaries.append((match.start(), match))
+        boundaries.sort(key=lambda boundary: boundary[0])
+
+        section = ""
+        for position, (start, match) in enumerate(boundaries):
+            if match.re is _SECTION_HEADER_PATTERN:
+                section = match.group(1).decode("utf-8")
+                continue
+            end = (
+                boundaries[position + 1][0]
+                if position + 1 < len(boundaries)
+                else len(self._listing)
+            )
+            symbol = match.group(2).decode("utf-8")
+            key = symbol
+            occurrence = 1
+            while key in self.index:
+                occurrence += 1
+                key = f"{symbol}#{occurrence}"
+            self.index[key] = FunctionSpan(
+                symbol=symbol,
+                address=int(match.group(1), 16),
+                section=section,
+                start=start,
+                end=end,
+                num_instructions=len(
+                    _INSTRUCTION_PATTERN.findall(self._listing, match.end(), end)
+                ),
+            )
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, symbol: object) -> bool:
+        return symbol in self.index
+
+    def find(self, prefix: str) -> Optional[str]:
+        """First indexed symbol starting with prefix, e.g. "f_gold".
+
+        Args:
+            prefix (str): Symbol prefix.
+
+        Returns:
+            Optional[str]: Index key of the symbol, or None if not found.
+        """
+        for key, span in self.index.items():
+            if span.symbol.startswith(prefix):
+                return key
+        return None
+
+    def raw(self, symbol: str) -> str:
+        """Raw objdump text of a function, starting with its header line.
+
+        Args:
+            symbol (str): Index key of the function.
+
+        Returns:
+            str: function text.
+        """
+        span = self.index[symbol]
+        return bytes(self._listing[span.start : span.end]).decode("utf-8")
+
+    def standardize(self, symbol: str) -> str:
+        """Standardized body of a function, in the same format as
+        standardize_asm_file. Results are computed on first use and kept.
+
+        Args:
+            symbol (str): Index key of the function.
+
+        Returns:
+            str: standardized function as text.
+        """
+        if symbol not in self._standardized:
+            buffer = []
+            lines = iter(self.raw(symbol).split("\n")[1:])
+            for line in lines:
+                line = line.rstrip()
+                if line:
+                    buffer.append(line + "\n")
+                    break
+            for line in lines:
+                line = line.rstrip()
+                if not line or "endbr64" in line:
+                    continue
+                buffer.append(standardize_instruction(line))
+            self._standardized[symbol] = "".join(buffer)
+        return self._standardized[symbol]
+
+    def iter_standardized(
+        self, symbols: Optional[Iterable[str]] = None
+    ) -> Iterator[Tuple[str, str]]:
+        """Lazily standardizes functions of the listing.
+
+        Args:
+            symbols (Optional[Iterable[str]]): Index keys of the functions.
+                Defaults to every function in listing order.
+
+        Yields:
+            Tuple[str, str]: index key and standardized function.
+        """
+        for symbol in self.index if symbols is None else symbols:
+            yield symbol, self.standardize(symbol)
@@ -2,15 +2,44 @@
  and disassembling binaries."""
 import os
 import subprocess
-import shutil
 import json
+import tempfile
 from pathlib import Path
-from typing import List
-from typing import Union
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, TextIO
+from typing import Tuple, Union
 from functools import partial
 from multiprocessing import Pool
 
-from decompile.preprocessing.standardize import standardize_asm_file
+from decompile.preprocessing.cache import CompilationCache
+from decompile.preprocessing.flag_matrix import (
+    build_precompiled_headers,
+    compile_flag_matrix,
+)
+from decompile.preprocessing.fused import (
+    compile_disassemble_and_standardize,
+    compile_to_assembly_and_standardize,
+    compile_to_assembly_text,
+)
+from decompile.preprocessing.manifest import ProgressManifest
+from decompile.preprocessing.scheduled_stages import ScheduledStages
+from decompile.preprocessing.scheduler import SubprocessScheduler
+from decompile.preprocessing.metrics import (
+    PipelineMetrics,
+    failure_reason,
+    stage_timer,
+)
+from decompile.preprocessing.objdump_batch import disassemble_batch_to_assembly
+from decompile.preprocessing.standardize import (
+    standardize_asm_file,
+    standardize_compiler_asm_file,
+)
+from decompile.preprocessing.toolchain import (
+    COMPILATION_COMMANDS,
+    COMPILER_ARCHITECTURE_FLAGS,
+    COMPILER_SYNTAX_FLAGS,
+    compile_cache_key,
+    temporary_path,
+)
 
 
 class DatasetJsonl:
@@ -21,9 +50,22 @@ class DatasetJsonl:
         num_samples (int): Number of samples to be used for training.
         asm_syntax_type (str): Syntax type for Generated asm files.
         architecture (str): Architecture type for asm output files.
+        asm_backend (str): "objdump" disassembles compiled binaries, "compiler"
+            takes the assembly emitted by the compiler (gcc -S) instead.
+        cache (Optional[CompilationCache]): Cache for binaries and disassembly,
+            enabled by passing cache_folder.
+        metrics (Optional[PipelineMetrics]): Per-stage timings and failures of
+            every file, enabled by passing metrics_folder. Events of a previous
+            run are kept when resume is set, like the manifest of preprocess.
     """
 
-    compilation_command_dict = {".c": "gcc -c", ".cpp": "g++ -c"}
+    compilation_command_dict = COMPILATION_COMMANDS
+    schedulers = ("pool", "asyncio")
+    manifest_file_name = "manifest.jsonl"
+    standardizer_dict = {
+        "objdump": standardize_asm_file,
+        "compiler": standardize_compiler_asm_file,
+    }
 
     def __init__(
         self,
@@ -31,21 +73,52 @@ class DatasetJsonl:
         num_samples: int,
         asm_syntax_type: str = "att",
         architecture: str = "x86-64",
+        *,
+        asm_backend: str = "objdump",
+        cache_folder: Optional[Union[Path, str]] = None,
+        cache_size_bytes: int = 4 * 1024**3,
+        metrics_folder: Optional[Union[Path, str]] = None,
+        resume: bool = False,
     ) -> None:
+        if asm_backend not in DatasetJsonl.standardizer_dict:
+            raise ValueError(f"Unknown assembly backend {asm_backend}")
+        if asm_backend == "compiler" and (
+            asm_syntax_type not in COMPILER_SYNTAX_FLAGS
+            or architecture not in COMPILER_ARCHITECTURE_FLAGS
+        ):
+            raise ValueError(
+                f"The compiler backend does not support {asm_syntax_type} syntax "
+                + f"on {architecture}"
+            )
         self.raw_dataset_path = Path(raw_dataset_path)
         self.num_samples = num_samples
         self.asm_syntax_type = asm_syntax_type
         self.architecture = architecture
+        self.asm_backend = asm_backend
+        self.cache: Optional[CompilationCache] = None
+        if cache_folder is not None:
+            self.cache = CompilationCache(cache_folder, cache_size_bytes)
+        self.metrics: Optional[PipelineMetrics] = None
+        if metrics_folder is not None:
+            self.metrics = PipelineMetrics(metrics_folder, resume=resume)
 
     @staticmethod
     def _compile_to_binary(
-        source_file_path: Union[Path, str], output_folder: Union[Path, str]
-    ) -> None:
+        source_file_path: Union[Path, str],
+        output_folder: Union[Path, str],
+        cache: Optional[CompilationCache] = None,
+        metrics: Optional[PipelineMetrics] = None,
+    ) -> bool:
         """Converts source files into binary files
 
         Args:
             source_file_path (str): Path for .c source file.
             output_folder (str): Path for compilation output.
+            cache (Optional[CompilationCache]): Cache to reuse binaries from.
+            metrics (Optional[PipelineMetrics]): Metrics to record the stage to.
+
+        Returns:
+            bool: True if the binary file was created.
         """
         source_file_path = Path(source_file_path)
         output_folder = Path(output_folder)
@@ -54,152 +127,621 @@ class DatasetJsonl:
         compiler_command = DatasetJsonl.compilation_command_dict[
             source_file_path.suffix
         ]
-        assemble_command = f"{compiler_command} {source_file_path} -o {out_file}"
-
-        try:
-            subprocess.run(assemble_command, check=True, shell=True)
-        except subprocess.CalledProcessError as e:
-            print(
-                f"Compilation failed with error:\n{e} and "
-                + f"the error is associated with the following output file {out_file}"
-            )
+        temp_file = temporary_path(out_file)
+        assemble_command = f"{compiler_command} {source_file_path} -o {temp_file}"
+
+        with stage_timer(metrics, "compile", source_file_path.name) as event:
+            event["bytes_in"] = source_file_path.stat().st_size
+            if cache is not None:
+                cache_key = compile_cache_key(source_file_path)
+                if cache.get(cache_key, temp_file):
+                    event["cache_hit"] = True
+                    event["bytes_out"] = temp_file.stat().st_size
+                    os.replace(temp_file, out_file)
+                    return True
+            try:
+                subprocess.run(
+                    assemble_command,
+                    check=True,
+                    shell=True,
+                    stderr=subprocess.PIPE,
+                    encoding="utf-8",
+                )
+            except subprocess.CalledProcessError as e:
+                print(
+                    f"Compilation failed with error:\n{e}\n{e.stderr} and "
+                    + f"the error is associated with the following output file {out_file}"
+                )
+                event["failure"] = failure_reason(e, e.stderr)
+                return False
+            event["bytes_out"] = temp_file.stat().st_size
+        if cache is not None:
+            cache.put(cache_key, temp_file)
+        os.replace(temp_file, out_file)
+        return True
+
+    @staticmethod
+    def _compile_to_assembly(
+        source_file_path: Union[Path, str],
+        output_folder: Union[Path, str],
+        syntax_for_assembly_language: str,
+        architecture: str,
+        *,
+        cache: Optional[CompilationCache] = None,
+        metrics: Optional[PipelineMetrics] = None,
+    ) -> bool:
+        """Converts source files into assembly(.s) files with the compiler. Like
+        the objdump backend, a source that fails to compile leaves an empty
+        assembly file behind.
+
+        Args:
+            source_file_path (Union[Path, str]): Path for .c/.cpp source file.
+            output_folder (Union[Path, str]): Path for the assembly output.
+            syntax_for_assembly_language (str): syntax type for the assembly output.
+            architecture (str): architecure type for the assembly output.
+            cache (Optional[CompilationCache]): Cache to reuse assembly from.
+            metrics (Optional[PipelineMetrics]): Metrics to record the stage to.
+
+        Returns:
+            bool: True if the source file compiled.
+        """
+        source_file_path = Path(source_file_path)
+        assembly_file_path = (Path(output_folder) / source_file_path.stem).with_suffix(
+            ".s"
+        )
+        assembly = compile_to_assembly_text(
+            source_file_path,
+            syntax_for_assembly_language=syntax_for_assembly_language,
+            architecture=architecture,
+            cache=cache,
+            metrics=metrics,
+        )
+        temp_file = temporary_path(assembly_file_path)
+        temp_file.write_text(assembly or "", encoding="utf-8")
+        os.replace(temp_file, assembly_file_path)
+        return assembly is not None
 
     @staticmethod
     def _disassemble_to_assembly(
-        binary_file: Union[Path, str],
+        files: Tuple[Sequence[str], Sequence[str]],
         syntax_for_assembly_language: str,
         architecture: str,
-    ) -> None:
+        cache: Optional[CompilationCache] = None,
+        metrics: Optional[PipelineMetrics] = None,
+    ) -> List[Path]:
         """Disassembles binary files into assembly(.s) files in the same folder.
+        A binary that fails to disassemble leaves an empty assembly file behind.
+        The binaries are disassembled by one objdump process, see
+        disassemble_batch_to_assembly.
 
         Args:
-            binary_file (Union[Path, str]): Disassembled binary file path.
+            files (Tuple[Sequence[str], Sequence[str]]): Disassembled binary file
+                paths, and the names of their source files the stage is recorded
+                under.
             syntax_for_assembly_language (str): syntax type for the assembly output files.
             architecture (str): architecure type for assembly output files.
+            cache (Optional[CompilationCache]): Cache to reuse listings from. Cached
+                listings keep the binary path objdump printed when they were created.
+            metrics (Optional[PipelineMetrics]): Metrics to record the stage to.
+
+        Returns:
+            List[Path]: Binary files that failed to disassemble.
         """
-        binary_file = Path(binary_file)
-        assembly_file_path = binary_file.with_suffix(".s")
-        try:
-            with assembly_file_path.open("w", encoding="utf-8") as assembly_file:
-                subprocess.run(
-                    [
-                        "objdump",
-                        "-d",
-                        "-M",
-                        syntax_for_assembly_language,
-                        "-M",
-                        architecture,
-                        "-M",
-                        "att-mnemonic",
-                        "-M",
-                        "suffix",
-                        "--demangle",
-                        "--line-numbers",
-                        "--no-show-raw-insn",
-                        # "--no-addresses",
-                        str(binary_file),
-                    ],
-                    stdout=assembly_file,
-                    check=True,
-                )
-                os.remove(binary_file)
-        except subprocess.CalledProcessError as e:
-            print(
-                f"Dissembling failed with error:\n{e} and "
-                + f"the error is associated with the following output file {assembly_file_path}"
+        binary_files, source_names = files
+        return disassemble_batch_to_assembly(
+            binary_files,
+            syntax_for_assembly_language,
+            architecture,
+            cache,
+            metrics,
+            source_names=source_names,
+        )
+
+    def _list_source_files(self, input_folder: Union[Path, str]) -> List[str]:
+        """Lists the compilable source files in input_folder, up to num_samples.
+
+        Args:
+            input_folder (Union[Path, str]): Path for the folder containing source files.
+
+        Returns:
+            List[str]: Paths of the source files.
+        """
+        source_files: List[str] = []
+        for filename in os.listdir(input_folder)[: self.num_samples]:
+            if os.path.splitext(filename)[1] in DatasetJsonl.compilation_command_dict:
+                source_files.append(os.path.join(input_folder, filename))
+        return source_files
+
+    def _fused_pipeline(
+        self, scratch_folder: Optional[Union[Path, str]]
+    ) -> Callable[..., Optional[Dict[str, str]]]:
+        """Fused pipeline of a single source file for the assembly backend."""
+        if self.asm_backend == "compiler":
+            return partial(
+                compile_to_assembly_and_standardize,
+                syntax_for_assembly_language=self.asm_syntax_type,
+                architecture=self.architecture,
+                cache=self.cache,
+                metrics=self.metrics,
             )
+        return partial(
+            compile_disassemble_and_standardize,
+            syntax_for_assembly_language=self.asm_syntax_type,
+            architecture=self.architecture,
+            scratch_folder=scratch_folder,
+            cache=self.cache,
+            metrics=self.metrics,
+        )
+
+    def iter_fused_records(
+        self,
+        input_folder: Union[Path, str],
+        nproc: int,
+        *,
+        scratch_folder: Optional[Union[Path, str]] = None,
+        chunksize: int = 16,
+        flag_sets: Optional[Sequence[str]] = None,
+    ) -> Iterator[Dict[str, str]]:
+        """Compiles, disassembles and standardizes every source file in a single
+        pass. Each worker handles one file end to end, so there is no barrier
+        between stages and nothing is written to the output folder.
+
+        With flag_sets, every source is compiled once per flag set and each
+        variant gets its own record, with the flag set in its "flags" field.
+        The standard library header is precompiled once per flag set up front,
+        so the C++ compilations do not parse it again.
+
+        Args:
+            input_folder (Union[Path, str]): Path for the folder containing source files.
+            nproc (int): Number of processes to use for multiprocessing.
+            scratch_folder (Optional[Union[Path, str]]): Folder for temporary binaries.
+            chunksize (int): Number of files sent to a worker at once.
+            flag_sets (Optional[Sequence[str]]): Compiler flags of every variant,
+                e.g. flag_matrix.OPTIMIZATION_FLAG_SETS.
+
+        Yields:
+            Dict[str, str]: jsonl records of the files that were processed successfully.
+        """
+        source_files = self._list_source_files(input_folder)
+        partial_pipeline = self._fused_pipeline(scratch_folder)
+        if flag_sets is None:
+            with Pool(processes=nproc) as pool:
+                for record in pool.imap(partial_pipeline, source_files, chunksize):
+                    if record is not None:
+                        yield record
+            return
+
+        with tempfile.TemporaryDirectory(dir=scratch_folder) as temp_folder:
+            with Pool(processes=nproc) as pool:
+                include_folders: Dict[str, Optional[Path]] = {
+                    flag_set: None for flag_set in flag_sets
+                }
+                if any(file.endswith(".cpp") for file in source_files):
+                    # the header must be built with the code generation flags
+                    # of the compilations of the assembly backend
+                    include_folders = build_precompiled_headers(
+                        pool,
+                        Path(temp_folder),
+                        flag_sets,
+                        (
+                            [
+                                COMPILER_SYNTAX_FLAGS[self.asm_syntax_type],
+                                COMPILER_ARCHITECTURE_FLAGS[self.architecture],
+                            ]
+                            if self.asm_backend == "compiler"
+                            else []
+                        ),
+                    )
+                partial_matrix = partial(
+                    compile_flag_matrix,
+                    pipeline=partial_pipeline,
+                    include_folders=include_folders,
+                )
+                for records in pool.imap(partial_matrix, source_files, chunksize):
+                    yield from records
+
+    def preprocess_fused(
+        self,
+        input_folder: Union[Path, str],
+        jsonl_file_path: Union[Path, str],
+        nproc: int,
+        *,
+        scratch_folder: Optional[Union[Path, str]] = None,
+        flag_sets: Optional[Sequence[str]] = None,
+    ) -> None:
+        """Creates the jsonl file straight from the source files using the fused
+        single-pass pipeline.
+
+        Args:
+            input_folder (Union[Path, str]): Path for the folder containing source files.
+            jsonl_file_path (Union[Path, str]): Path to the jsonl file.
+            nproc (int): Number of processes to use for multiprocessing.
+            scratch_folder (Optional[Union[Path, str]]): Folder for temporary binaries.
+            flag_sets (Optional[Sequence[str]]): Compiler flags of every variant,
+                one record is written per source and flag set.
+        """
+        jsonl_file_path = Path(jsonl_file_path)
+        with jsonl_file_path.open(mode="w", encoding="utf-8") as jsonl_file:
+            for record in self.iter_fused_records(
+                input_folder, nproc, scratch_folder=scratch_folder, flag_sets=flag_sets
+            ):
+                DatasetJsonl._write_record(jsonl_file, record, self.metrics)
+
+    @staticmethod
+    def _write_record(
+        jsonl_file: TextIO,
+        record: Dict[str, str],
+        metrics: Optional[PipelineMetrics] = None,
+    ) -> None:
+        """Writes a record to a jsonl file.
+
+        Args:
+            jsonl_file (TextIO): Open jsonl file.
+            record (Dict[str, str]): jsonl record.
+            metrics (Optional[PipelineMetrics]): Metrics to record the stage to.
+        """
+        with stage_timer(metrics, "write", record["file_name"]) as event:
+            line = json.dumps(record) + "\n"
+            jsonl_file.write(line)
+            event["bytes_out"] = len(line.encode("utf-8"))
 
     def preprocess(
         self,
         input_folder: Union[Path, str],
         output_folder: Union[Path, str],
         nproc: int,
+        *,
+        objdump_batch_size: int = 1,
+        resume: bool = False,
+        max_retries: int = 2,
+        scheduler: str = "pool",
+        job_timeout: Optional[float] = None,
     ) -> None:
         """Converts source files into assembly using multiprocessing. First
         compiles source using corresponding language compiler. Then disassembles
-        binaries using objdump.
+        binaries using objdump. With the compiler backend the assembly files are
+        written by the compiler directly. Every finished stage of every file is
+        logged to a manifest in output_folder, which lets an interrupted run resume.
 
         Args:
             input_folder (str): Path for the folder containing source files.
             output_folder (str): Path for the folder to deposit the binaries then assembly files.
             nproc (int): Number of processes to use for multiprocessing.
+            objdump_batch_size (int): Number of binaries passed to each objdump
+                process. Batching amortizes process start up over small binaries.
+            resume (bool): Skip the files the manifest marks as done, instead of
+                starting over with a fresh manifest.
+            max_retries (int): Number of times a failed file is retried when resuming.
+            scheduler (str): "pool" runs every compiler and objdump process from
+                a pool of Python workers, "asyncio" runs up to nproc of them
+                straight from this process with a SubprocessScheduler.
+            job_timeout (Optional[float]): Seconds after which a compiler or
+                objdump process run by the "asyncio" scheduler is killed.
         """
-        input_folder = Path(input_folder)
+        if scheduler not in DatasetJsonl.schedulers:
+            raise ValueError(
+                f"Unknown scheduler {scheduler}, expected one of {DatasetJsonl.schedulers}"
+            )
         output_folder = Path(output_folder)
-        source_files: List[str] = []
-        for filename in os.listdir(input_folder)[: self.num_samples]:
-            if os.path.splitext(filename)[1] in DatasetJsonl.compilation_command_dict:
-                source_files.append(os.path.join(input_folder, filename))
-
-        partial_compile = partial(
-            DatasetJsonl._compile_to_binary, output_folder=output_folder
+        manifest = ProgressManifest(
+            output_folder / DatasetJsonl.manifest_file_name, resume=resume
         )
-        with Pool(processes=nproc) as pool:
-            pool.map(partial_compile, source_files)
+        source_files = [
+            file
+            for file in self._list_source_files(input_folder)
+            if manifest.should_run(
+                os.path.basename(file),
+                "assemble" if self.asm_backend == "compiler" else "disassemble",
+                max_retries,
+            )
+        ]
+        stages = None
+        if scheduler == "asyncio":
+            stages = ScheduledStages(
+                SubprocessScheduler(nproc, default_timeout=job_timeout),
+                manifest,
+                self.asm_syntax_type,
+                self.architecture,
+                cache=self.cache,
+                metrics=self.metrics,
+            )
+
+        if self.asm_backend == "compiler":
+            if stages is not None:
+                stages.assemble(source_files, output_folder)
+            else:
+                self._assemble_with_pool(source_files, output_folder, manifest, nproc)
+            print("Finished compiling.")
+            return
 
-        print("Finished compiling.")
         binary_files = [
             os.path.join(
                 output_folder, os.path.basename(os.path.splitext(file)[0]) + ".o"
             )
             for file in source_files
         ]
+        files_to_compile = DatasetJsonl._files_to_compile(
+            source_files, binary_files, manifest, max_retries
+        )
+        if stages is not None:
+            stages.compile(files_to_compile, output_folder)
+            print("Finished compiling.")
+            num_failed = stages.disassemble(
+                source_files, binary_files, objdump_batch_size
+            )
+            print(f"Failed to disassemble {num_failed} binaries.")
+            return
+
+        self._compile_with_pool(files_to_compile, output_folder, manifest, nproc)
+        print("Finished compiling.")
+        self._disassemble_with_pool(
+            source_files,
+            binary_files,
+            manifest,
+            nproc,
+            objdump_batch_size=objdump_batch_size,
+        )
+
+    @staticmethod
+    def _files_to_compile(
+        source_files: Sequence[str],
+        binary_files: Sequence[str],
+        manifest: ProgressManifest,
+        max_retries: int,
+    ) -> List[str]:
+        """Source files the compile stage of preprocess has to run for.
+
+        Args:
+            source_files (Sequence[str]): Paths of the source files.
+            binary_files (Sequence[str]): Paths of their binary files.
+            manifest (ProgressManifest): Manifest of the previous runs.
+            max_retries (int): Number of times a failed file is retried.
+
+        Returns:
+            List[str]: Paths of the source files to compile.
+        """
+        # binaries are removed once disassembled, so a compiled file whose
+        # disassembly did not finish is compiled again if its binary is gone
+        return [
+            file
+            for file, binary_file in zip(source_files, binary_files)
+            if not (
+                manifest.is_done(os.path.basename(file), "compile")
+                and os.path.exists(binary_file)
+            )
+            and manifest.failures(os.path.basename(file), "compile") <= max_retries
+        ]
 
-        partial_disassemble = partial(
-            DatasetJsonl._disassemble_to_assembly,
+    def _assemble_with_pool(
+        self,
+        source_files: Sequence[str],
+        output_folder: Path,
+        manifest: ProgressManifest,
+        nproc: int,
+    ) -> None:
+        """Compiler backend of preprocess with the "pool" scheduler.
+
+        Args:
+            source_files (Sequence[str]): Paths of the source files.
+            output_folder (Path): Path for the assembly output.
+            manifest (ProgressManifest): Manifest to log the assemble stage to.
+            nproc (int): Number of processes to use for multiprocessing.
+        """
+        partial_assemble = partial(
+            DatasetJsonl._compile_to_assembly,
+            output_folder=output_folder,
             syntax_for_assembly_language=self.asm_syntax_type,
             architecture=self.architecture,
+            cache=self.cache,
+            metrics=self.metrics,
+        )
+        with Pool(processes=nproc) as pool:
+            for file, succeeded in zip(
+                source_files, pool.imap(partial_assemble, source_files)
+            ):
+                manifest.record(os.path.basename(file), "assemble", succeeded)
+
+    def _compile_with_pool(
+        self,
+        source_files: Sequence[str],
+        output_folder: Path,
+        manifest: ProgressManifest,
+        nproc: int,
+    ) -> None:
+        """Compile stage of preprocess with the "pool" scheduler.
+
+        Args:
+            source_files (Sequence[str]): Paths of the source files to compile.
+            output_folder (Path): Path for compilation output.
+            manifest (ProgressManifest): Manifest to log the compile stage to.
+            nproc (int): Number of processes to use for multiprocessing.
+        """
+        partial_compile = partial(
+            DatasetJsonl._compile_to_binary,
+            output_folder=output_folder,
+            cache=self.cache,
+            metrics=self.metrics,
+        )
+        with Pool(processes=nproc) as pool:
+            for file, succeeded in zip(
+                source_files, pool.imap(partial_compile, source_files)
+            ):
+                manifest.record(os.path.basename(file), "compile", succeeded)
+
+    def _disassemble_with_pool(
+        self,
+        source_files: Sequence[str],
+        binary_files: Sequence[str],
+        manifest: ProgressManifest,
+        nproc: int,
+        *,
+        objdump_batch_size: int,
+    ) -> None:
+        """Disassemble stage of preprocess with the "pool" scheduler.
+
+        Args:
+            source_files (Sequence[str]): Paths of the source files.
+            binary_files (Sequence[str]): Paths of their binary files.
+            manifest (ProgressManifest): Manifest to log the disassemble stage to.
+            nproc (int): Number of processes to use for multiprocessing.
+            objdump_batch_size (int): Number of binaries passed to each objdump
+                process.
+        """
+        batches = DatasetJsonl._objdump_batches(
+            source_files, binary_files, max(objdump_batch_size, 1)
         )
+        num_failed = 0
         with Pool(processes=nproc) as pool:
-            pool.map(partial_disassemble, binary_files)
+            for (batch, source_names), batch_failed in zip(
+                batches,
+                pool.imap(
+                    partial(
+                        DatasetJsonl._disassemble_to_assembly,
+                        syntax_for_assembly_language=self.asm_syntax_type,
+                        architecture=self.architecture,
+                        cache=self.cache,
+                        metrics=self.metrics,
+                    ),
+                    batches,
+                ),
+            ):
+                failed_binaries = {str(binary_file) for binary_file in batch_failed}
+                num_failed += len(failed_binaries)
+                for binary_file, source_name in zip(batch, source_names):
+                    manifest.record(
+                        source_name,
+                        "disassemble",
+                        str(Path(binary_file)) not in failed_binaries,
+                    )
+        print(f"Failed to disassemble {num_failed} binaries.")
+
+    @staticmethod
+    def _objdump_batches(
+        source_files: Sequence[str], binary_files: Sequence[str], batch_size: int
+    ) -> List[Tuple[Sequence[str], List[str]]]:
+        """Splits the binaries into batches of batch_size binaries, each with the
+        names of their source files.
+
+        Args:
+            source_files (Sequence[str]): Paths of the source files.
+            binary_files (Sequence[str]): Paths of their binary files.
+            batch_size (int): Number of binaries passed to each objdump process.
+
+        Returns:
+            List[Tuple[Sequence[str], List[str]]]: Binary files and source file
+            names of every batch.
+        """
+        return [
+            (
+                binary_files[start : start + batch_size],
+                [
+                    os.path.basename(file)
+                    for file in source_files[start : start + batch_size]
+                ],
+            )
+            for start in range(0, len(binary_files), batch_size)
+        ]
 
     def collect_source_files(
         self,
         output_folder_path: Union[Path, str],
-    ) -> None:
-        """Collect all source files into one folder.
+        nproc: int = 1,
+        chunksize: int = 64,
+    ) -> int:
+        """Collect all source files into one folder. The dataset tree is walked
+        in sorted order so that the same num_samples files are picked on every
+        run, then each file is read once, filtered and written once by a pool
+        of workers.
 
         Args:
             output_folder_path (Union[Path, str]): Folder for depositing collected source files.
+            nproc (int): Number of processes to use for multiprocessing.
+            chunksize (int): Number of files sent to a worker at once.
+
+        Returns:
+            int: Number of collected source files.
         """
-        sample_files_num = self.num_samples
-
-        def _collect_source_files(source_folder_path: Union[Path, str]) -> None:
-            """DFS search for collecting source files from source_folder_path
-            and copying them to output_folder_path.
-
-            Args:
-                source_folder_path (Union[Path, str]): Folder containing all source files.
-                output_folder_path (Union[Path, str]): Folder for depositing collected source files.
-            """
-            # FIXME: The global variable is not a good idea.
-            # FIXME: The actual number of files found is 900 not 1000 like the global variable.
-            nonlocal sample_files_num
-            nonlocal output_folder_path
-            for entry in os.scandir(source_folder_path):
-                if sample_files_num == 0:
-                    break
-                if entry.name in (".", ".."):
-                    continue
-                full_input_path = os.path.join(source_folder_path, entry.name)
+        source_files = self._find_source_files(self.raw_dataset_path)
+        partial_collect = partial(
+            DatasetJsonl._collect_source_file,
+            output_folder_path=Path(output_folder_path),
+            metrics=self.metrics,
+        )
+        if nproc > 1:
+            with Pool(processes=nproc) as pool:
+                for _ in pool.imap_unordered(partial_collect, source_files, chunksize):
+                    pass
+        else:
+            for source_file in source_files:
+                partial_collect(source_file)
+        return len(source_files)
+
+    def _find_source_files(self, source_folder_path: Union[Path, str]) -> List[str]:
+        """Iterative DFS search for the first num_samples source files under
+        source_folder_path, visiting directory entries in sorted order. Files
+        are collected into a single folder, so only the first file with a given
+        name is kept.
+
+        Args:
+            source_folder_path (Union[Path, str]): Folder containing all source files.
 
+        Returns:
+            List[str]: Paths of the source files.
+        """
+        source_files: List[str] = []
+        file_names = set()
+        folders = [str(source_folder_path)]
+        while folders and len(source_files) < self.num_samples:
+            with os.scandir(folders.pop()) as scanned_entries:
+                entries = sorted(scanned_entries, key=lambda entry: entry.name)
+            sub_folders = []
+            for entry in entries:
                 if entry.is_dir():
-                    _collect_source_files(full_input_path)
-                elif entry.name.endswith(".c") or entry.name.endswith(".cpp"):
-                    output_file_path = os.path.join(output_folder_path, entry.name)
-                    shutil.copyfile(full_input_path, output_file_path)
-                    DatasetJsonl.remove_comments_empty_includes_and_main(
-                        output_file_path
-                    )
-                    sample_files_num -= 1
+                    sub_folders.append(entry.path)
+                elif (
+                    entry.name.endswith(".c") or entry.name.endswith(".cpp")
+                ) and entry.name not in file_names:
+                    file_names.add(entry.name)
+                    source_files.append(entry.path)
+                    if len(source_files) == self.num_samples:
+                        break
+            # files of a folder come before its sub folders, which are visited in order
+            folders.extend(reversed(sub_folders))
+        return source_files
 
-        _collect_source_files(self.raw_dataset_path)
+    @staticmethod
+    def _collect_source_file(
+        source_file_path: Union[Path, str],
+        output_folder_path: Path,
+        metrics: Optional[PipelineMetrics] = None,
+    ) -> None:
+        """Writes the filtered content of a source file to output_folder_path.
+
+        Args:
+            source_file_path (Union[Path, str]): path to c/cpp file
+            output_folder_path (Path): Folder for depositing collected source files.
+            metrics (Optional[PipelineMetrics]): Metrics to record the stage to.
+        """
+        source_file_path = Path(source_file_path)
+        output_file_path = output_folder_path / source_file_path.name
+        temp_file = temporary_path(output_file_path)
+        with stage_timer(metrics, "collect", source_file_path.name) as event:
+            event["bytes_in"] = source_file_path.stat().st_size
+            temp_file.write_text(
+                DatasetJsonl._filter_source_text(
+                    source_file_path.read_text(encoding="utf-8")
+                ),
+                encoding="utf-8",
+            )
+            event["bytes_out"] = temp_file.stat().st_size
+            os.replace(temp_file, output_file_path)
 
     @staticmethod
     def create_jsonl_and_standardize(
         assembly_folder_path: Union[Path, str],
         source_folder_path: Union[Path, str],
         jsonl_file_path: Union[Path, str],
+        asm_backend: str = "objdump",
     ) -> None:
         """Creates jsonl file after standardizing the assembly files. The jsonl
         file is then used to create the dataset using load_dataset function.
@@ -208,28 +750,150 @@ class DatasetJsonl:
             assembly_folder_path (Path): Path to the folder containing assembly files.
             source_folder_path (Path): Path to the folder containing source files.
             jsonl_file_path (Path): Path to the jsonl file.
+            asm_backend (str): Backend that produced the assembly files.
         """
         assembly_folder_path = Path(assembly_folder_path)
         source_folder_path = Path(source_folder_path)
         jsonl_file_path = Path(jsonl_file_path)
         data_buffer = []
         for source_file in source_folder_path.iterdir():
-            output_str = source_file.read_text(encoding="utf-8").strip()
-            assembly_file_path = Path(source_file.stem + ".s")
-            assembly_file_path = assembly_folder_path / assembly_file_path
-            input_str = standardize_asm_file(assembly_file_path)
             data_buffer.append(
-                {
-                    "input": input_str,
-                    "output": output_str,
-                    "file_name": f"{source_file.name}",
-                }
+                DatasetJsonl._standardize_source_file(
+                    source_file, assembly_folder_path, asm_backend
+                )
             )
         with jsonl_file_path.open(mode="w", encoding="utf-8") as jsonl_file:
             for entry in data_buffer:
                 print(entry)
                 jsonl_file.write(json.dumps(entry) + "\n")
 
+    @staticmethod
+    def stream_jsonl_and_standardize(
+        assembly_folder_path: Union[Path, str],
+        source_folder_path: Union[Path, str],
+        jsonl_file_path: Union[Path, str],
+        nproc: int,
+        *,
+        chunksize: int = 64,
+        report_every: int = 1000,
+        asm_backend: str = "objdump",
+        metrics: Optional[PipelineMetrics] = None,
+    ) -> int:
+        """Streaming version of create_jsonl_and_standardize. Assembly files are
+        standardized in a process pool and every record is written as soon as it
+        is ready, in the same order as the source folder listing. Nothing is
+        buffered and only progress counts are printed.
+
+        Args:
+            assembly_folder_path (Union[Path, str]): Path to the folder containing
+                assembly files.
+            source_folder_path (Union[Path, str]): Path to the folder containing
+                source files.
+            jsonl_file_path (Union[Path, str]): Path to the jsonl file.
+            nproc (int): Number of processes to use for multiprocessing.
+            chunksize (int): Number of files sent to a worker at once.
+            report_every (int): Print progress after this many records.
+            asm_backend (str): Backend that produced the assembly files.
+            metrics (Optional[PipelineMetrics]): Metrics to record the standardize
+                and write stages to.
+
+        Returns:
+            int: Number of records written.
+        """
+        jsonl_file_path = Path(jsonl_file_path)
+        num_records = 0
+        with jsonl_file_path.open(mode="w", encoding="utf-8") as jsonl_file:
+            for entry in DatasetJsonl.iter_standardized_records(
+                assembly_folder_path,
+                source_folder_path,
+                nproc,
+                chunksize=chunksize,
+                report_every=report_every,
+                asm_backend=asm_backend,
+                metrics=metrics,
+            ):
+                DatasetJsonl._write_record(jsonl_file, entry, metrics)
+                num_records += 1
+        return num_records
+
+    @staticmethod
+    def iter_standardized_records(
+        assembly_folder_path: Union[Path, str],
+        source_folder_path: Union[Path, str],
+        nproc: int,
+        *,
+        chunksize: int = 64,
+        report_every: int = 1000,
+        asm_backend: str = "objdump",
+        metrics: Optional[PipelineMetrics] = None,
+    ) -> Iterator[Dict[str, str]]:
+        """Standardizes assembly files in a process pool and yields their records
+        in the same order as the source folder listing.
+
+        Args:
+            assembly_folder_path (Union[Path, str]): Path to the folder containing
+                assembly files.
+            source_folder_path (Union[Path, str]): Path to the folder containing
+                source files.
+            nproc (int): Number of processes to use for multiprocessing.
+            chunksize (int): Number of files sent to a worker at once.
+            report_every (int): Print progress after this many records.
+            asm_backend (str): Backend that produced the assembly files.
+            metrics (Optional[PipelineMetrics]): Metrics to record the stage to.
+
+        Yields:
+            Dict[str, str]: jsonl records.
+        """
+        partial_standardize = partial(
+            DatasetJsonl._standardize_source_file,
+            assembly_folder_path=Path(assembly_folder_path),
+            asm_backend=asm_backend,
+            metrics=metrics,
+        )
+        num_records = 0
+        with Pool(processes=nproc) as pool:
+            for entry in pool.imap(
+                partial_standardize, Path(source_folder_path).iterdir(), chunksize
+            ):
+                yield entry
+                num_records += 1
+                if num_records % report_every == 0:
+                    print(f"Standardized {num_records} files.")
+        print(f"Standardized {num_records} files in total.")
+
+    @staticmethod
+    def _standardize_source_file(
+        source_file: Path,
+        assembly_folder_path: Path,
+        asm_backend: str = "objdump",
+        metrics: Optional[PipelineMetrics] = None,
+    ) -> Dict[str, str]:
+        """Builds the jsonl record of a source file and its assembly file.
+
+        Args:
+            source_file (Path): Path to the source file.
+            assembly_folder_path (Path): Path to the folder containing assembly files.
+            asm_backend (str): Backend that produced the assembly file.
+            metrics (Optional[PipelineMetrics]): Metrics to record the stage to.
+
+        Returns:
+            Dict[str, str]: jsonl record.
+        """
+        output_str = source_file.read_text(encoding="utf-8").strip()
+        assembly_file_path = Path(source_file.stem + ".s")
+        assembly_file_path = assembly_folder_path / assembly_file_path
+        with stage_timer(metrics, "standardize", source_file.name) as event:
+            input_str = DatasetJsonl.standardizer_dict[asm_backend](assembly_file_path)
+            event["bytes_in"] = assembly_file_path.stat().st_size
+            event["bytes_out"] = len(input_str.encode("utf-8"))
+            if not input_str:
+                event["failure"] = "no f_gold function in the assembly"
+        return {
+            "input": input_str,
+            "output": output_str,
+            "file_name": f"{source_file.name}",
+        }
+
     @staticmethod
     def remove_comments_empty_includes_and_main(file_path: Union[Path, str]) -> None:
         """Removes all // comments, empty lines, and main function with everything after it.
@@ -239,21 +903,33 @@ class DatasetJsonl:
         """
         if isinstance(file_path, str):
             file_path = Path(file_path)
-        buffer = []
-        with file_path.open("r", encoding="utf-8") as read_file:
-            for line in read_file:
-                stripped_line = line.strip()
-                if (
-                    stripped_line.startswith("//")
-                    or not stripped_line
-                    or (
-                        stripped_line.startswith("#include")
-                        and stripped_line.find("bits/stdc++.h") == -1
-                    )
-                ):
-                    continue
-                if stripped_line.startswith("int main()"):
-                    break
-                buffer.append(line.rstrip())
+        source_text = file_path.read_text(encoding="utf-8")
         with file_path.open("w", encoding="utf-8") as write_file:
-            write_file.write("\n".join(buffer) + "\n")
+            write_file.write(DatasetJsonl._filter_source_text(source_text))
+
+    @staticmethod
+    def _filter_source_text(source_text: str) -> str:
+        """Removes all // comments, empty lines, and main function with everything after it.
+
+        Args:
+            source_text (str): c/cpp source code.
+
+        Returns:
+            str: filtered source code.
+        """
+        buffer = []
+        for line in source_text.split("\n"):
+            stripped_line = line.strip()
+            if (
+                stripped_line.startswith("//")
+                or not stripped_line
+                or (
+                    stripped_line.startswith("#include")
+                    and stripped_line.find("bits/stdc++.h") == -1
+                )
+            ):
+                continue
+            if stripped_line.startswith("int main()"):
+                break
+            buffer.append(line.rstrip())
+        return "\n".join(buffer) + "\n"
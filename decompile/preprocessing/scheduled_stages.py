@@ -0,0 +1,259 @@
+"""Stages of the preprocessing pipeline run by the asyncio subprocess scheduler."""
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+
+from decompile.preprocessing.cache import CompilationCache
+from decompile.preprocessing.manifest import ProgressManifest
+from decompile.preprocessing.metrics import (
+    PipelineMetrics,
+    failure_reason,
+    new_event,
+    stage_timer,
+)
+from decompile.preprocessing.objdump_batch import ObjdumpBatch
+from decompile.preprocessing.scheduler import Job, JobResult, SubprocessScheduler
+from decompile.preprocessing.toolchain import (
+    COMPILATION_COMMANDS,
+    assembly_cache_key,
+    assembly_command,
+    compile_cache_key,
+    temporary_path,
+)
+
+
+class ScheduledStages:
+    """Counterparts of the pool stages of DatasetJsonl.preprocess, whose
+    compiler and objdump processes are launched by a SubprocessScheduler
+    instead of pool workers. Cache lookups, file writes and the manifest are
+    handled in the worker thread of the scheduler, outside its event loop.
+
+    Attributes:
+        job_scheduler (SubprocessScheduler): Runs the compiler and objdump processes.
+        manifest (ProgressManifest): Manifest to log the stages to.
+        asm_syntax_type (str): Syntax type for the assembly output.
+        architecture (str): Architecture type for the assembly output.
+        cache (Optional[CompilationCache]): Cache for binaries and assembly.
+        metrics (Optional[PipelineMetrics]): Metrics to record the stages to.
+    """
+
+    def __init__(
+        self,
+        job_scheduler: SubprocessScheduler,
+        manifest: ProgressManifest,
+        asm_syntax_type: str,
+        architecture: str,
+        *,
+        cache: Optional[CompilationCache] = None,
+        metrics: Optional[PipelineMetrics] = None,
+    ) -> None:
+        self.job_scheduler = job_scheduler
+        self.manifest = manifest
+        self.asm_syntax_type = asm_syntax_type
+        self.architecture = architecture
+        self.cache = cache
+        self.metrics = metrics
+
+    def _run(
+        self,
+        stage: str,
+        jobs: Iterator[Job],
+        on_result: Callable[[JobResult], None],
+        events: List[Dict[str, Any]],
+    ) -> None:
+        """Runs the jobs of a stage and records the events of its files."""
+        with stage_timer(None, stage, "") as stage_event:
+            self.job_scheduler.run_all(jobs, on_result)
+        if self.metrics is not None:
+            self.metrics.record_concurrent(events, stage_event["subprocess_seconds"])
+
+    def assemble(self, source_files: Sequence[str], output_folder: Path) -> None:
+        """Compiler backend, the counterpart of DatasetJsonl._compile_to_assembly.
+        A source that fails to compile leaves an empty assembly file behind.
+
+        Args:
+            source_files (Sequence[str]): Paths of the source files.
+            output_folder (Path): Path for the assembly output.
+        """
+        events: List[Dict[str, Any]] = []
+
+        def write_assembly(
+            source_file_path: Path, assembly: bytes, succeeded: bool
+        ) -> None:
+            assembly_file_path = (output_folder / source_file_path.stem).with_suffix(
+                ".s"
+            )
+            temp_file = temporary_path(assembly_file_path)
+            temp_file.write_bytes(assembly)
+            os.replace(temp_file, assembly_file_path)
+            self.manifest.record(source_file_path.name, "assemble", succeeded)
+
+        def jobs() -> Iterator[Job]:
+            for file in source_files:
+                source_file_path = Path(file)
+                command = assembly_command(
+                    source_file_path, self.asm_syntax_type, self.architecture
+                )
+                source = source_file_path.read_bytes()
+                event = new_event("compile", source_file_path.name)
+                event["bytes_in"] = len(source)
+                events.append(event)
+                cache_key = None
+                if self.cache is not None:
+                    cache_key = assembly_cache_key(source, command)
+                    cached_assembly = self.cache.get_bytes(cache_key)
+                    if cached_assembly is not None:
+                        event["cache_hit"] = True
+                        event["bytes_out"] = len(cached_assembly)
+                        write_assembly(source_file_path, cached_assembly, True)
+                        continue
+                yield Job(command, tag=(source_file_path, cache_key, event))
+
+        def on_result(result: JobResult) -> None:
+            source_file_path, cache_key, event = result.job.tag
+            event["wall_seconds"] = result.wall_seconds
+            error = result.exception()
+            if error is None:
+                event["bytes_out"] = len(result.stdout)
+                if self.cache is not None:
+                    self.cache.put_bytes(cache_key, result.stdout)
+            else:
+                stderr = result.stderr.decode("utf-8", errors="replace")
+                print(
+                    f"Compilation failed with error:\n{error}\n{stderr} and "
+                    + "the error is associated with the following source file "
+                    + f"{source_file_path}"
+                )
+                event["failure"] = failure_reason(error, stderr)
+            write_assembly(
+                source_file_path, result.stdout if error is None else b"", error is None
+            )
+
+        self._run("compile", jobs(), on_result, events)
+
+    def compile(self, source_files: Sequence[str], output_folder: Path) -> None:
+        """Compile stage, the counterpart of DatasetJsonl._compile_to_binary.
+
+        Args:
+            source_files (Sequence[str]): Paths of the source files to compile.
+            output_folder (Path): Path for compilation output.
+        """
+        events: List[Dict[str, Any]] = []
+
+        def jobs() -> Iterator[Job]:
+            for file in source_files:
+                source_file_path = Path(file)
+                out_file = (output_folder / source_file_path.stem).with_suffix(".o")
+                temp_file = temporary_path(out_file)
+                event = new_event("compile", source_file_path.name)
+                event["bytes_in"] = source_file_path.stat().st_size
+                events.append(event)
+                cache_key = None
+                if self.cache is not None:
+                    cache_key = compile_cache_key(source_file_path)
+                    if self.cache.get(cache_key, temp_file):
+                        event["cache_hit"] = True
+                        event["bytes_out"] = temp_file.stat().st_size
+                        os.replace(temp_file, out_file)
+                        self.manifest.record(source_file_path.name, "compile", True)
+                        continue
+                yield Job(
+                    COMPILATION_COMMANDS[source_file_path.suffix].split()
+                    + [str(source_file_path), "-o", str(temp_file)],
+                    tag=(source_file_path, out_file, cache_key, event),
+                )
+
+        def on_result(result: JobResult) -> None:
+            source_file_path, out_file, cache_key, event = result.job.tag
+            temp_file = temporary_path(out_file)
+            event["wall_seconds"] = result.wall_seconds
+            error = result.exception()
+            if error is None:
+                event["bytes_out"] = temp_file.stat().st_size
+                if self.cache is not None:
+                    self.cache.put(cache_key, temp_file)
+                os.replace(temp_file, out_file)
+            else:
+                stderr = result.stderr.decode("utf-8", errors="replace")
+                print(
+                    f"Compilation failed with error:\n{error}\n{stderr} and "
+                    + f"the error is associated with the following output file {out_file}"
+                )
+                event["failure"] = failure_reason(error, stderr)
+                if temp_file.exists():
+                    os.remove(temp_file)
+            self.manifest.record(source_file_path.name, "compile", error is None)
+
+        self._run("compile", jobs(), on_result, events)
+
+    def disassemble(
+        self,
+        source_files: Sequence[str],
+        binary_files: Sequence[str],
+        objdump_batch_size: int,
+    ) -> int:
+        """Disassemble stage, the counterpart of disassemble_batch_to_assembly.
+
+        Args:
+            source_files (Sequence[str]): Paths of the source files.
+            binary_files (Sequence[str]): Paths of their binary files.
+            objdump_batch_size (int): Number of binaries passed to each objdump
+                process.
+
+        Returns:
+            int: Number of binaries that failed to disassemble.
+        """
+        batch_size = max(objdump_batch_size, 1)
+        source_names = {
+            str(Path(binary_file)): os.path.basename(file)
+            for binary_file, file in zip(binary_files, source_files)
+        }
+        events: List[Dict[str, Any]] = []
+        num_failed = 0
+
+        def jobs() -> Iterator[Job]:
+            for start in range(0, len(binary_files), batch_size):
+                batch = ObjdumpBatch(
+                    binary_files[start : start + batch_size],
+                    self.asm_syntax_type,
+                    self.architecture,
+                    self.cache,
+                    source_names=[
+                        os.path.basename(file)
+                        for file in source_files[start : start + batch_size]
+                    ],
+                )
+                events.extend(batch.events.values())
+                for binary_file in batch.events:
+                    if binary_file not in batch.pending:
+                        self.manifest.record(
+                            source_names[binary_file], "disassemble", True
+                        )
+                if batch.pending:
+                    yield Job(batch.command(), tag=batch)
+
+        def on_result(result: JobResult) -> None:
+            nonlocal num_failed
+            batch = result.job.tag
+            disassembled = list(batch.pending)
+            failed = {
+                str(binary_file)
+                for binary_file in batch.split_listing(
+                    result.stdout.decode("utf-8", errors="replace"),
+                    result.stderr.decode("utf-8", errors="replace"),
+                    failure_reason(result.exception()),
+                )
+            }
+            for binary_file in disassembled:
+                batch.events[binary_file]["wall_seconds"] = result.wall_seconds / len(
+                    disassembled
+                )
+                self.manifest.record(
+                    source_names[binary_file],
+                    "disassemble",
+                    binary_file not in failed,
+                )
+                num_failed += binary_file in failed
+
+        self._run("disassemble", jobs(), on_result, events)
+        return num_failed
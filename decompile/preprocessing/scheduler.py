@@ -0,0 +1,262 @@
+"""Asyncio scheduler running compiler and objdump jobs as child processes."""
+import os
+import time
+import signal
+import asyncio
+import subprocess
+from asyncio.subprocess import Process
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Any, AsyncGenerator, Callable, Dict, Iterable, List, Optional, Set
+
+
+@dataclass
+class Job:
+    """Child process to run
+
+    Attributes:
+        argv (List[str]): Command as a list of arguments, run without a shell.
+        timeout (Optional[float]): Wall clock seconds before the process is
+            killed, None uses the default timeout of the scheduler.
+        stdin (Optional[bytes]): Data sent to the standard input.
+        cwd (Optional[str]): Working directory of the process.
+        tag (Any): Data of the caller, handed back with the result.
+    """
+
+    argv: List[str]
+    timeout: Optional[float] = None
+    stdin: Optional[bytes] = None
+    cwd: Optional[str] = None
+    tag: Any = None
+
+
+@dataclass
+class JobResult:
+    """Outcome of a job
+
+    Attributes:
+        job (Job): The job.
+        returncode (Optional[int]): Exit status, None if the process timed out
+            or could not be started.
+        stdout (bytes): Standard output.
+        stderr (bytes): Standard error, or the reason the process could not
+            be started.
+        wall_seconds (float): Time from the start of the process to its exit.
+        timed_out (bool): Whether the process was killed by the timeout.
+    """
+
+    job: Job
+    returncode: Optional[int]
+    stdout: bytes
+    stderr: bytes
+    wall_seconds: float
+    timed_out: bool = False
+
+    @property
+    def succeeded(self) -> bool:
+        """Whether the process exited with status 0"""
+        return self.returncode == 0
+
+    def exception(self) -> Optional[Exception]:
+        """Exception subprocess.run would have raised for the job.
+
+        Returns:
+            Optional[Exception]: TimeoutExpired, CalledProcessError or the
+            OSError that prevented the start, None if the job succeeded.
+        """
+        if self.timed_out:
+            return subprocess.TimeoutExpired(
+                self.job.argv, self.job.timeout or 0.0, self.stdout, self.stderr
+            )
+        if self.returncode is None:
+            return OSError(self.stderr.decode("utf-8", errors="replace"))
+        if self.returncode != 0:
+            return subprocess.CalledProcessError(
+                self.returncode, self.job.argv, self.stdout, self.stderr
+            )
+        return None
+
+
+def _kill(process: Process) -> None:
+    """Kills a process and the processes it started, e.g. cc1 and as under gcc."""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class SubprocessScheduler:
+    """Runs jobs as child processes of a single Python process, with at most
+    max_concurrency of them alive at once. Jobs are launched straight from
+    their argv, without a shell or a Python worker per job, and each of them
+    runs in its own session so that a timeout or a cancellation kills the
+    whole process tree.
+
+    Attributes:
+        max_concurrency (int): Maximum number of running child processes.
+        max_pending (int): Maximum number of jobs taken from the input and not
+            yet returned, which bounds the memory used by queued jobs and
+            unread results.
+        default_timeout (Optional[float]): Timeout of jobs that do not set one.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        default_timeout: Optional[float] = None,
+    ) -> None:
+        """Initialize the scheduler
+
+        Args:
+            max_concurrency (Optional[int]): Maximum number of running child
+                processes, the number of CPUs by default.
+            max_pending (Optional[int]): Maximum number of jobs in flight,
+                twice max_concurrency by default.
+            default_timeout (Optional[float]): Timeout of jobs that do not set one.
+        """
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.max_pending = max(max_pending or 2 * self.max_concurrency, 1)
+        self.default_timeout = default_timeout
+        self._semaphores: Dict[int, asyncio.Semaphore] = {}
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        """Semaphore of the running event loop, loops cannot share one."""
+        loop_id = id(asyncio.get_running_loop())
+        if loop_id not in self._semaphores:
+            self._semaphores = {loop_id: asyncio.Semaphore(self.max_concurrency)}
+        return self._semaphores[loop_id]
+
+    async def run(self, job: Job) -> JobResult:
+        """Runs a job once a process slot is free. A cancelled job kills its
+        process before the cancellation propagates.
+
+        Args:
+            job (Job): Job to run.
+
+        Returns:
+            JobResult: outcome of the job.
+        """
+        timeout = job.timeout if job.timeout is not None else self.default_timeout
+        async with self._semaphore():
+            start = time.perf_counter()
+            try:
+                process = await asyncio.create_subprocess_exec(
+                    *job.argv,
+                    stdin=(
+                        asyncio.subprocess.DEVNULL
+                        if job.stdin is None
+                        else asyncio.subprocess.PIPE
+                    ),
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=job.cwd,
+                    start_new_session=True,
+                )
+            except OSError as error:
+                return JobResult(
+                    job, None, b"", str(error).encode(), time.perf_counter() - start
+                )
+            try:
+                stdout, stderr = await asyncio.wait_for(
+                    process.communicate(job.stdin), timeout
+                )
+            except asyncio.TimeoutError:
+                _kill(process)
+                await process.wait()
+                return JobResult(
+                    replace(job, timeout=timeout),
+                    None,
+                    b"",
+                    f"timed out after {timeout}s".encode(),
+                    time.perf_counter() - start,
+                    timed_out=True,
+                )
+            except asyncio.CancelledError:
+                _kill(process)
+                await process.wait()
+                raise
+            return JobResult(
+                job, process.returncode, stdout, stderr, time.perf_counter() - start
+            )
+
+    async def iter_results(
+        self, jobs: Iterable[Job], executor: Optional[Executor] = None
+    ) -> AsyncGenerator[JobResult, None]:
+        """Runs jobs and yields their results as they finish. Jobs are taken
+        from the iterable only when fewer than max_pending are in flight, so a
+        slow consumer holds back new launches. The iterable is advanced in a
+        worker thread, so a generator that reads files or queries a cache to
+        build its jobs does not hold up the event loop, which drains the
+        output of the running processes and enforces their timeouts. Closing
+        the iterator early cancels the jobs in flight.
+
+        Args:
+            jobs (Iterable[Job]): Jobs to run, possibly a lazy generator.
+            executor (Optional[Executor]): Executor advancing the iterable, a
+                new single thread executor by default.
+
+        Yields:
+            JobResult: outcomes in completion order.
+        """
+        loop = asyncio.get_running_loop()
+        job_executor = executor or ThreadPoolExecutor(max_workers=1)
+        job_iterator = iter(jobs)
+        exhausted = False
+        in_flight: Set["asyncio.Task[JobResult]"] = set()
+        try:
+            while True:
+                while not exhausted and len(in_flight) < self.max_pending:
+                    job = await loop.run_in_executor(
+                        job_executor, next, job_iterator, None
+                    )
+                    if job is None:
+                        exhausted = True
+                    else:
+                        in_flight.add(asyncio.ensure_future(self.run(job)))
+                if not in_flight:
+                    return
+                done, in_flight = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in in_flight:
+                task.cancel()
+            if in_flight:
+                await asyncio.gather(*in_flight, return_exceptions=True)
+            if executor is None:
+                job_executor.shutdown(wait=False)
+
+    def run_all(
+        self, jobs: Iterable[Job], on_result: Callable[[JobResult], None]
+    ) -> int:
+        """Runs jobs on a new event loop until all of them are done. on_result
+        is called as every job finishes, in the worker thread that advances
+        jobs, so the two never run at the same time and neither of them holds
+        up the event loop with its file or cache accesses.
+
+        Args:
+            jobs (Iterable[Job]): Jobs to run.
+            on_result (Callable[[JobResult], None]): Handles a finished job.
+
+        Returns:
+            int: Number of jobs run.
+        """
+
+        async def consume() -> int:
+            loop = asyncio.get_running_loop()
+            num_jobs = 0
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                results = self.iter_results(jobs, executor)
+                try:
+                    async for result in results:
+                        await loop.run_in_executor(executor, on_result, result)
+                        num_jobs += 1
+                finally:
+                    # kills the jobs in flight when on_result raises
+                    await results.aclose()
+            return num_jobs
+
+        return asyncio.run(consume())
@@ -0,0 +1,349 @@
+"""Sharded, optionally compressed jsonl dataset files with a random-access index."""
+import sys
+import gzip
+import json
+import random
+import bisect
+from array import array
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+Record = Dict[str, Any]
+
+SHARD_SUFFIXES = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+INDEX_SUFFIX = ".idx"
+# block offset, block length, record offset and record length of every record
+_INDEX_WIDTH = 4
+
+
+def _check_compression(compression: Optional[str]) -> None:
+    """Raises ValueError for an unknown compression and ImportError when the
+    zstandard package needed for zstd is not installed."""
+    if compression not in SHARD_SUFFIXES:
+        raise ValueError(
+            f"Unknown compression {compression}, "
+            + f"expected one of {list(SHARD_SUFFIXES)}"
+        )
+    if compression == "zstd" and zstandard is None:
+        raise ImportError("zstd compression requires the zstandard package")
+
+
+def _index_path(shard_path: Path) -> Path:
+    """Path of the sidecar index of a shard."""
+    return shard_path.with_name(shard_path.name + INDEX_SUFFIX)
+
+
+def shard_compression(
+    input_folder: Union[Path, str], prefix: str = "data"
+) -> Optional[str]:
+    """Compression of the shards of a folder, found from the suffix of their
+    index files.
+
+    Args:
+        input_folder (Union[Path, str]): Folder holding the shards.
+        prefix (str): File name prefix of the shards.
+
+    Returns:
+        Optional[str]: None, "gzip" or "zstd".
+
+    Raises:
+        FileNotFoundError: The folder holds no indexed shards.
+    """
+    for compression, suffix in SHARD_SUFFIXES.items():
+        if any(Path(input_folder).glob(f"{prefix}-*{suffix}{INDEX_SUFFIX}")):
+            return compression
+    raise FileNotFoundError(f"no shards with prefix {prefix} in {input_folder}")
+
+
+def iter_jsonl_lines(jsonl_path: Union[Path, str]) -> Iterator[bytes]:
+    """Lazily reads the non-empty lines of a jsonl file, or the records of a
+    folder of shards written by ShardedJsonlWriter as jsonl lines.
+
+    Args:
+        jsonl_path (Union[Path, str]): Path to a jsonl file or a shard folder.
+
+    Yields:
+        bytes: jsonl lines, ending with a newline.
+    """
+    jsonl_path = Path(jsonl_path)
+    if jsonl_path.is_dir():
+        reader = ShardedJsonlReader(
+            jsonl_path, compression=shard_compression(jsonl_path)
+        )
+        yield from reader.iter_lines()
+        return
+    with jsonl_path.open("rb") as jsonl_file:
+        for line in jsonl_file:
+            if line.strip():
+                yield line if line.endswith(b"\n") else line + b"\n"
+
+
+class ShardedJsonlWriter:
+    """Writes records into size-bounded jsonl shards. Records are gathered into
+    blocks of about block_bytes, and with compression every block is
+    compressed on its own, as a gzip member or a zstd frame. Neighbouring
+    records share their compression context, so a shard is still a valid
+    .gz/.zst file while a record is read by decompressing its block only.
+    Next to each shard, a sidecar index stores the byte offset and length of
+    the block of every record and the offset and length of the record in the
+    decompressed block, as little-endian uint64.
+
+    Attributes:
+        output_folder (Path): Folder holding the shards.
+        prefix (str): File name prefix of the shards.
+        max_shard_bytes (int): A new shard is started once a shard reaches this size.
+        compression (Optional[str]): None, "gzip" or "zstd".
+        block_bytes (int): A block is compressed once it reaches this many
+            uncompressed bytes.
+        shard_paths (List[Path]): Shards written so far.
+    """
+
+    def __init__(
+        self,
+        output_folder: Union[Path, str],
+        prefix: str = "data",
+        max_shard_bytes: int = 256 * 1024**2,
+        compression: Optional[str] = None,
+        *,
+        compression_level: int = 6,
+        block_bytes: int = 64 * 1024,
+    ) -> None:
+        """Initialize the writer
+
+        Args:
+            output_folder (Union[Path, str]): Folder holding the shards.
+            prefix (str): File name prefix of the shards.
+            max_shard_bytes (int): Size bound of a shard in bytes.
+            compression (Optional[str]): None, "gzip" or "zstd".
+            compression_level (int): Compression level of gzip or zstd.
+            block_bytes (int): Uncompressed size of a block in bytes.
+        """
+        _check_compression(compression)
+        self.output_folder = Path(output_folder)
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.max_shard_bytes = max_shard_bytes
+        self.compression = compression
+        self.compression_level = compression_level
+        self.block_bytes = block_bytes
+        self.shard_paths: List[Path] = []
+        self.num_records = 0
+        self._shard_file: Optional[BinaryIO] = None
+        self._offsets = array("Q")
+        self._shard_size = 0
+        self._block = bytearray()
+        # offset and length of every record of the block
+        self._block_records = array("Q")
+        self._compressor = (
+            zstandard.ZstdCompressor(level=compression_level)
+            if compression == "zstd"
+            else None
+        )
+
+    def __enter__(self) -> "ShardedJsonlWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def write(self, record: Record) -> int:
+        """Appends a record to the current block, starting a new shard if needed.
+
+        Args:
+            record (Record): jsonl record.
+
+        Returns:
+            int: Number of uncompressed bytes of the record.
+        """
+        data = (json.dumps(record) + "\n").encode("utf-8")
+        if self._shard_file is None:
+            self._start_shard()
+        self._block_records.extend((len(self._block), len(data)))
+        self._block += data
+        self.num_records += 1
+        if len(self._block) >= self.block_bytes:
+            self._write_block()
+            if self._shard_size >= self.max_shard_bytes:
+                self._finish_shard()
+        return len(data)
+
+    def close(self) -> List[Path]:
+        """Writes the last block, finishes the current shard and writes its index.
+
+        Returns:
+            List[Path]: Paths of all written shards.
+        """
+        if self._shard_file is not None:
+            self._write_block()
+            self._finish_shard()
+        return self.shard_paths
+
+    def _compress(self, data: bytes) -> bytes:
+        """Compresses a block."""
+        if self.compression == "gzip":
+            return gzip.compress(data, compresslevel=self.compression_level, mtime=0)
+        if self._compressor is not None:
+            return self._compressor.compress(data)
+        return data
+
+    def _write_block(self) -> None:
+        """Compresses the current block into the shard and indexes its records."""
+        if not self._block:
+            return
+        assert self._shard_file is not None
+        data = self._compress(bytes(self._block))
+        self._shard_file.write(data)
+        for position in range(0, len(self._block_records), 2):
+            self._offsets.extend(
+                (self._shard_size, len(data))
+                + tuple(self._block_records[position : position + 2])
+            )
+        self._shard_size += len(data)
+        self._block = bytearray()
+        self._block_records = array("Q")
+
+    def _finish_shard(self) -> None:
+        """Closes the current shard and writes its index."""
+        assert self._shard_file is not None
+        self._shard_file.close()
+        self._shard_file = None
+        if sys.byteorder == "big":
+            self._offsets.byteswap()
+        with _index_path(self.shard_paths[-1]).open("wb") as index_file:
+            self._offsets.tofile(index_file)
+
+    def _start_shard(self) -> None:
+        """Opens the next shard."""
+        shard_path = self.output_folder / (
+            f"{self.prefix}-{len(self.shard_paths):05d}"
+            + SHARD_SUFFIXES[self.compression]
+        )
+        self.shard_paths.append(shard_path)
+        self._shard_file = shard_path.open("wb")
+        self._offsets = array("Q")
+        self._shard_size = 0
+
+
+class ShardedJsonlReader:
+    """Random access to the records of shards written by ShardedJsonlWriter.
+    Only the sidecar indexes are loaded, a record is read by seeking to its
+    block and decompressing just that block. The last decompressed block is
+    kept, so reading neighbouring records decompresses it once.
+
+    Attributes:
+        shard_paths (List[Path]): Shards in order.
+        compression (Optional[str]): None, "gzip" or "zstd".
+    """
+
+    def __init__(
+        self,
+        input_folder: Union[Path, str],
+        prefix: str = "data",
+        compression: Optional[str] = None,
+    ) -> None:
+        """Initialize the reader
+
+        Args:
+            input_folder (Union[Path, str]): Folder holding the shards.
+            prefix (str): File name prefix of the shards.
+            compression (Optional[str]): None, "gzip" or "zstd".
+        """
+        _check_compression(compression)
+        self.compression = compression
+        self.shard_paths = sorted(
+            Path(input_folder).glob(f"{prefix}-*{SHARD_SUFFIXES[compression]}")
+        )
+        self._offsets: List[array] = []
+        # number of records before each shard, plus the total at the end
+        self._first_records = [0]
+        for shard_path in self.shard_paths:
+            offsets = array("Q")
+            offsets.frombytes(_index_path(shard_path).read_bytes())
+            if sys.byteorder == "big":
+                offsets.byteswap()
+            self._offsets.append(offsets)
+            self._first_records.append(
+                self._first_records[-1] + len(offsets) // _INDEX_WIDTH
+            )
+        self._decompressor = (
+            zstandard.ZstdDecompressor() if compression == "zstd" else None
+        )
+        self._block_key: Optional[Tuple[int, int]] = None
+        self._block = b""
+
+    def __len__(self) -> int:
+        return self._first_records[-1]
+
+    def __getitem__(self, record_index: int) -> Record:
+        """Reads a single record.
+
+        Args:
+            record_index (int): Index of the record over all shards.
+
+        Returns:
+            Record: jsonl record.
+        """
+        if record_index < 0:
+            record_index += len(self)
+        if not 0 <= record_index < len(self):
+            raise IndexError(f"record {record_index} out of range")
+        shard = bisect.bisect_right(self._first_records, record_index) - 1
+        position = _INDEX_WIDTH * (record_index - self._first_records[shard])
+        block_offset, block_length, record_offset, record_length = self._offsets[shard][
+            position : position + _INDEX_WIDTH
+        ]
+        if self._block_key != (shard, block_offset):
+            with self.shard_paths[shard].open("rb") as shard_file:
+                shard_file.seek(block_offset)
+                self._block = self._decompress(shard_file.read(block_length))
+            self._block_key = (shard, block_offset)
+        return json.loads(self._block[record_offset : record_offset + record_length])
+
+    def __iter__(self) -> Iterator[Record]:
+        """Reads all records in order, one block at a time."""
+        for line in self.iter_lines():
+            yield json.loads(line)
+
+    def iter_lines(self) -> Iterator[bytes]:
+        """Reads the jsonl lines of all records in order, one block at a time.
+
+        Yields:
+            bytes: jsonl line of a record, ending with a newline.
+        """
+        for shard, shard_path in enumerate(self.shard_paths):
+            offsets = self._offsets[shard]
+            block_offset = -1
+            block = b""
+            with shard_path.open("rb") as shard_file:
+                for position in range(0, len(offsets), _INDEX_WIDTH):
+                    if offsets[position] != block_offset:
+                        block_offset = offsets[position]
+                        block = self._decompress(shard_file.read(offsets[position + 1]))
+                    record_offset = offsets[position + 2]
+                    yield block[record_offset : record_offset + offsets[position + 3]]
+
+    def sample(self, num_records: int, seed: int = 0) -> List[Record]:
+        """Reads a random subset of the records without replacement.
+
+        Args:
+            num_records (int): Number of records in the subset.
+            seed (int): Random seed.
+
+        Returns:
+            List[Record]: Records in index order.
+        """
+        record_indices = random.Random(seed).sample(range(len(self)), num_records)
+        return [self[record_index] for record_index in sorted(record_indices)]
+
+    def _decompress(self, data: bytes) -> bytes:
+        """Decompresses a block."""
+        if self.compression == "gzip":
+            return gzip.decompress(data)
+        if self._decompressor is not None:
+            return self._decompressor.decompress(data)
+        return data
@@ -1,48 +1,191 @@
 """Standardize assembly output from objdump command."""
 import re
+import mmap
 from pathlib import Path
-from typing import Union
+from typing import Iterator, Union
 
+from decompile.preprocessing.canonicalize import canonicalize_asm
 
-def standardize_asm_file(asm_file_path: Union[Path, str]) -> str:
+AsmListing = Union[str, bytes, bytearray, mmap.mmap]
+
+# objdump prints the file name and format, then the section name before the first symbol.
+_HEADER_LINES = 5
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+_TARGET_SYMBOL_PATTERN = re.compile(r"[0-9a-fA-F]{16} <f_gold.*>")
+_FUNCTION_HEADER_PATTERN = re.compile(r"[0-9a-fA-F]{16} <.*>:$")
+_TARGET_SYMBOL_SEARCH_PATTERN = re.compile(r"^[0-9a-fA-F]{16} <f_gold.*>", re.MULTILINE)
+_TARGET_SYMBOL_SEARCH_BYTES_PATTERN = re.compile(
+    rb"^[0-9a-fA-F]{16} <f_gold.*>", re.MULTILINE
+)
+# gcc -S labels: f_gold itself (mangled for C++), any other function and jump targets.
+_COMPILER_TARGET_LABEL_PATTERN = re.compile(r"(_Z\d+)?f_gold\S*:$")
+_COMPILER_FUNCTION_LABEL_PATTERN = re.compile(r"[A-Za-z_][\w.$]*:$")
+_COMPILER_JUMP_LABEL_PATTERN = re.compile(r"\.L\d+:$")
+
+
+def standardize_asm_file(
+    asm_file_path: Union[Path, str],
+    canonical: bool = False,
+    keep_line_info: bool = False,
+) -> str:
     """Standardize asm file.
 
     Args:
         asm_file_path(str): path to asm file.
+        canonical (bool): Canonicalize the output with canonicalize_asm.
+        keep_line_info (bool): Keep line information when canonicalizing.
 
     Returns:
         str: standardized asm file as text.
     """
     asm_file_path = Path(asm_file_path)
+    with asm_file_path.open("rb") as file:
+        if asm_file_path.stat().st_size == 0:
+            return ""
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as listing:
+            return standardize_asm(listing, canonical, keep_line_info)
+
+
+def standardize_asm(
+    asm_text: AsmListing, canonical: bool = False, keep_line_info: bool = False
+) -> str:
+    """Standardize objdump output of the f_gold function. The listing is scanned
+    once: the function header is located with a single regex search, and the
+    scan stops at the header of the next function.
+
+    Args:
+        asm_text (AsmListing): objdump output as text, bytes or a memory map.
+        canonical (bool): Drop instruction addresses and line information and
+            rewrite branch targets to local labels, see canonicalize_asm.
+        keep_line_info (bool): Keep line information when canonicalizing.
+
+    Returns:
+        str: standardized asm as text.
+    """
+    is_text = isinstance(asm_text, str)
+    position = 0
+    for _ in range(_HEADER_LINES):
+        position = _find_newline(asm_text, position) + 1
+        if position == 0:
+            return ""
+    target_start = _find_target_symbol(asm_text, position)
+    if target_start == -1:
+        return ""
+
     function_found = 0
-    symbol = "<f_gold.*>"
     standardized_asm_buffer = []
+    for raw_line in _iter_lines(asm_text, target_start):
+        line = (raw_line if is_text else raw_line.decode("utf-8")).rstrip()
+        if not line:
+            continue
+
+        is_header = line[0] in _HEX_DIGITS
+        if is_header and _TARGET_SYMBOL_PATTERN.match(line):
+            function_found = 1
+            continue
+
+        if function_found == 1:
+            standardized_asm_buffer.append(line + "\n")
+            function_found = 2
+            continue
+
+        if "endbr64" in line:
+            continue
+        if is_header and _FUNCTION_HEADER_PATTERN.match(line):
+            break
+        standardized_asm_buffer.append(standardize_instruction(line))
+    if canonical:
+        return canonicalize_asm("".join(standardized_asm_buffer), keep_line_info)
+    return "".join(standardized_asm_buffer)
+
+
+def standardize_instruction(line: str) -> str:
+    """Standardize a single instruction line of objdump output.
+
+    Args:
+        line (str): instruction line, e.g. "   5:\tmovq   %rsp,%rbp".
+
+    Returns:
+        str: standardized line, e.g. "\t5: movq %rsp , %rbp ;\n".
+    """
+    return "\t" + " ".join(line.split()).replace(",", " , ") + " ;\n"
 
-    with asm_file_path.open("r", encoding="utf-8") as file:
-        for line in file.readlines()[5:]:
-            line = line.rstrip()
-            if not line:
-                continue
 
-            if re.search(r"^[0-9a-fA-F]{16} " + symbol, line):
-                function_found = 1
-                continue
+def _find_newline(asm_text: AsmListing, position: int) -> int:
+    """Index of the next newline of asm_text at or after position, or -1."""
+    if isinstance(asm_text, str):
+        return asm_text.find("\n", position)
+    return asm_text.find(b"\n", position)
 
-            if function_found == 1:
+
+def _find_target_symbol(asm_text: AsmListing, position: int) -> int:
+    """Index of the first f_gold header of asm_text at or after position, or -1."""
+    if isinstance(asm_text, str):
+        match = _TARGET_SYMBOL_SEARCH_PATTERN.search(asm_text, position)
+        return -1 if match is None else match.start()
+    bytes_match = _TARGET_SYMBOL_SEARCH_BYTES_PATTERN.search(asm_text, position)
+    return -1 if bytes_match is None else bytes_match.start()
+
+
+def _iter_lines(asm_text: AsmListing, position: int) -> Iterator:
+    """Lazily yields the lines of asm_text starting at position, without the
+    trailing newline and without copying the rest of the listing."""
+    length = len(asm_text)
+    while position < length:
+        end = _find_newline(asm_text, position)
+        if end == -1:
+            end = length
+        yield asm_text[position:end]
+        position = end + 1
+
+
+def standardize_compiler_asm_file(asm_file_path: Union[Path, str]) -> str:
+    """Standardize an assembly file emitted by the compiler (gcc -S).
+
+    Args:
+        asm_file_path(str): path to asm file.
+
+    Returns:
+        str: standardized asm file as text.
+    """
+    return standardize_compiler_asm(Path(asm_file_path).read_text(encoding="utf-8"))
+
+
+def standardize_compiler_asm(asm_text: str) -> str:
+    """Standardize compiler emitted assembly of the f_gold function. The output
+    follows standardize_asm: the (mangled) function label on the first line, then
+    one instruction per line. Assembler directives and compiler bookkeeping
+    labels are dropped, while the .L<n> labels used as jump targets are kept.
+
+    Args:
+        asm_text (str): gcc -S output as text.
+
+    Returns:
+        str: standardized asm as text.
+    """
+    standardized_asm_buffer = []
+    function_found = False
+    for line in asm_text.split("\n"):
+        line = line.rstrip()
+        if not function_found:
+            if _COMPILER_TARGET_LABEL_PATTERN.match(line):
                 standardized_asm_buffer.append(line + "\n")
-                function_found = 2
-
-            elif function_found == 2:
-                if re.search(r"endbr64", line):
-                    continue
-                if re.search(r"^[0-9a-fA-F]{16} <.*>:$", line):
-                    break
-                line = re.sub(r"\s+", " ", line).strip()
-                line = " , ".join(line.split(","))
-                line = "\t" + line + " ;\n"
-                standardized_asm_buffer.append(line)
-                # if "#" in line:
-                #     # add a ; before the hash to make it a comment
-                #     line = re.sub("#", "; #", line)
-    ret = "".join(standardized_asm_buffer)
-    return ret
+                function_found = True
+            continue
+
+        stripped_line = line.strip()
+        if not stripped_line or "endbr64" in stripped_line:
+            continue
+        if stripped_line.startswith(".size") or _COMPILER_FUNCTION_LABEL_PATTERN.match(
+            line
+        ):
+            break
+        if stripped_line.startswith(".") and not _COMPILER_JUMP_LABEL_PATTERN.match(
+            stripped_line
+        ):
+            continue
+        # gcc puts a space after commas, objdump does not
+        standardized_asm_buffer.append(
+            "\t" + " ".join(stripped_line.replace(",", " , ").split()) + " ;\n"
+        )
+    return "".join(standardized_asm_buffer)
@@ -0,0 +1,125 @@
+"""Compiler and objdump commands of the preprocessing pipeline, and the cache
+keys of their outputs."""
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+from decompile.preprocessing.cache import CompilationCache
+
+COMPILATION_COMMANDS = {".c": "gcc -c", ".cpp": "g++ -c"}
+ASSEMBLY_COMMANDS = {".c": "gcc -S", ".cpp": "g++ -S"}
+COMPILER_SYNTAX_FLAGS = {"att": "-masm=att", "intel": "-masm=intel"}
+COMPILER_ARCHITECTURE_FLAGS = {"x86-64": "-m64", "i386": "-m32"}
+# In-memory filesystem used as scratch space by the fused pipeline when available.
+SHARED_MEMORY_FOLDER = Path("/dev/shm")
+
+
+def temporary_path(file_path: Path) -> Path:
+    """Path next to file_path where an output is written before being renamed
+    over file_path, so that file_path only ever holds complete outputs."""
+    return file_path.with_name(f"{file_path.name}.{os.getpid()}.tmp")
+
+
+def include_arguments(
+    source_file_path: Path, include_folder: Optional[Path]
+) -> List[str]:
+    """Compiler arguments putting the precompiled headers of include_folder on
+    the include path of a C++ source."""
+    if include_folder is None or source_file_path.suffix != ".cpp":
+        return []
+    return ["-I", str(include_folder)]
+
+
+def compile_cache_key(source_file_path: Path, flags: Sequence[str] = ()) -> str:
+    """Cache key of the binary compiled from source_file_path. It covers the
+    source content and the compiler command with all of its flags."""
+    return CompilationCache.make_key(
+        "compile",
+        source_file_path.read_bytes(),
+        COMPILATION_COMMANDS[source_file_path.suffix],
+        *flags,
+    )
+
+
+def objdump_command(
+    binary_files: Sequence[Union[Path, str]],
+    syntax_for_assembly_language: str,
+    architecture: str,
+) -> List[str]:
+    """Builds the objdump command used to disassemble binary files.
+
+    Args:
+        binary_files (Sequence[Union[Path, str]]): Binary file paths.
+        syntax_for_assembly_language (str): syntax type for the assembly output.
+        architecture (str): architecure type for the assembly output.
+
+    Returns:
+        List[str]: objdump command as a list of arguments.
+    """
+    return [
+        "objdump",
+        "-d",
+        "-M",
+        syntax_for_assembly_language,
+        "-M",
+        architecture,
+        "-M",
+        "att-mnemonic",
+        "-M",
+        "suffix",
+        "--demangle",
+        "--line-numbers",
+        "--no-show-raw-insn",
+        # "--no-addresses",
+    ] + [str(binary_file) for binary_file in binary_files]
+
+
+def disassembly_cache_key(
+    binary_file: Path,
+    syntax_for_assembly_language: str,
+    architecture: str,
+) -> str:
+    """Cache key of the objdump listing of binary_file. It covers the binary
+    content, which is itself derived from the source and compiler flags, and
+    every objdump option except the input path."""
+    return CompilationCache.make_key(
+        "disassemble",
+        binary_file.read_bytes(),
+        *objdump_command([], syntax_for_assembly_language, architecture),
+    )
+
+
+def assembly_command(
+    source_file_path: Path,
+    syntax_for_assembly_language: str,
+    architecture: str,
+    flags: Sequence[str] = (),
+) -> List[str]:
+    """Builds the compiler command that writes the assembly of a source file
+    to stdout.
+
+    Args:
+        source_file_path (Path): Path for .c/.cpp source file.
+        syntax_for_assembly_language (str): syntax type for the assembly output.
+        architecture (str): architecure type for the assembly output.
+        flags (Sequence[str]): Extra compiler flags, e.g. the optimization level.
+
+    Returns:
+        List[str]: compiler command as a list of arguments.
+    """
+    return (
+        ASSEMBLY_COMMANDS[source_file_path.suffix].split()
+        + [
+            COMPILER_SYNTAX_FLAGS[syntax_for_assembly_language],
+            COMPILER_ARCHITECTURE_FLAGS[architecture],
+        ]
+        + list(flags)
+        + [str(source_file_path), "-o", "-"]
+    )
+
+
+def assembly_cache_key(source: bytes, command: List[str]) -> str:
+    """Cache key of the assembly of a source. It covers the source content
+    and the compiler command of assembly_command with all of its flags, but
+    not the paths."""
+    return CompilationCache.make_key("assemble", source, *command[:-3])
@@ -0,0 +1,268 @@
+"""Dataset helpers for the trainers that do not depend on the training stack."""
+import os
+import math
+import json
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple, Union
+
+from decompile.preprocessing.shards import iter_jsonl_lines
+
+SPLIT_METADATA_FILE = "split.json"
+
+
+def file_sha256(file_path: Union[Path, str], chunk_size: int = 1024**2) -> str:
+    """sha256 of a file, read in chunks.
+
+    Args:
+        file_path (Union[Path, str]): Path to the file.
+        chunk_size (int): Number of bytes read at once.
+
+    Returns:
+        str: hex digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_jsonl(file_path: Union[Path, str]) -> Iterator[Dict[str, Any]]:
+    """Lazily reads the records of a jsonl file, or of a folder of shards
+    written by ShardedJsonlWriter.
+
+    Args:
+        file_path (Union[Path, str]): Path to the jsonl file or shard folder.
+
+    Yields:
+        Dict[str, Any]: jsonl records.
+    """
+    for line in iter_jsonl_lines(file_path):
+        yield json.loads(line)
+
+
+def count_lines(file_path: Union[Path, str]) -> int:
+    """Number of non-empty lines of a file, without loading it in memory.
+
+    Args:
+        file_path (Union[Path, str]): Path to the file.
+
+    Returns:
+        int: Number of lines.
+    """
+    with open(file_path, "rb") as file:
+        return sum(1 for line in file if line.strip())
+
+
+def num_training_steps(
+    num_records: int, batch_size: int, gradient_accumulation_steps: int, epochs: int
+) -> int:
+    """Number of optimizer steps needed to go over a dataset, as required by
+    the trainer for streamed datasets which have no length.
+
+    Args:
+        num_records (int): Number of records in the dataset.
+        batch_size (int): Records per device batch.
+        gradient_accumulation_steps (int): Batches per optimizer step.
+        epochs (int): Number of passes over the dataset.
+
+    Returns:
+        int: Number of optimizer steps.
+    """
+    return max(
+        1, math.ceil(num_records / (batch_size * gradient_accumulation_steps)) * epochs
+    )
+
+
+def is_test_record(key: Union[str, bytes], test_ratio: float, seed: int = 0) -> bool:
+    """Deterministically assigns a record to the test split by hashing its key,
+    so that a record keeps its split across runs and machines.
+
+    Args:
+        key (Union[str, bytes]): Stable identifier of the record, e.g. its file name.
+        test_ratio (float): Expected fraction of records in the test split.
+        seed (int): Changes the assignment of every record.
+
+    Returns:
+        bool: True if the record belongs to the test split.
+    """
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    digest = hashlib.sha256(str(seed).encode("utf-8") + b":" + key).digest()
+    return int.from_bytes(digest[:8], "big") < test_ratio * 2**64
+
+
+def _stat_key(file_path: Path) -> List[int]:
+    """Size and modification time of a file, or of every file of a shard
+    folder, recorded in the split metadata to tell whether it changed without
+    hashing it."""
+    if file_path.is_dir():
+        return [
+            value for file in sorted(file_path.iterdir()) for value in _stat_key(file)
+        ]
+    stat = file_path.stat()
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _dataset_sha256(dataset_path: Path) -> str:
+    """sha256 of the jsonl lines of a jsonl file or shard folder, as hashed by
+    _write_split."""
+    digest = hashlib.sha256()
+    for line in iter_jsonl_lines(dataset_path):
+        digest.update(line)
+    return digest.hexdigest()
+
+
+def _split_is_current(
+    dataset_path: Path,
+    stat: List[int],
+    metadata_path: Path,
+    parameters: Dict[str, Any],
+) -> bool:
+    """True if the split recorded in metadata_path was made with parameters
+    from the current content of dataset_path. The dataset is only hashed again
+    when its stat changed, and the new stat is recorded if its content did
+    not."""
+    metadata = json.loads(metadata_path.read_text(encoding="utf-8"))
+    if any(metadata.get(name) != value for name, value in parameters.items()):
+        return False
+    if metadata.get("stat") == stat:
+        return True
+    if metadata.get("source_sha256") != _dataset_sha256(dataset_path):
+        return False
+    metadata["stat"] = stat
+    metadata_path.write_text(json.dumps(metadata), encoding="utf-8")
+    return True
+
+
+def _write_split(
+    dataset_path: Path,
+    train_path: Path,
+    test_path: Path,
+    parameters: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Streams the records of dataset_path to the train and test files.
+
+    Args:
+        dataset_path (Path): Path to the jsonl file or shard folder.
+        train_path (Path): Path of the train file.
+        test_path (Path): Path of the test file.
+        parameters (Dict[str, Any]): test_ratio, seed and key_field of the split.
+
+    Returns:
+        Dict[str, Any]: sha256 of the dataset, the number of records of each
+        split and the sha256 and stat of the train and test files.
+    """
+    digest = hashlib.sha256()
+    split_digests = {
+        train_path.name: hashlib.sha256(),
+        test_path.name: hashlib.sha256(),
+    }
+    counts = {"num_train": 0, "num_test": 0}
+    train_temp_path = train_path.with_name(train_path.name + ".tmp")
+    test_temp_path = test_path.with_name(test_path.name + ".tmp")
+    with train_temp_path.open("wb") as train_file, test_temp_path.open(
+        "wb"
+    ) as test_file:
+        for line in iter_jsonl_lines(dataset_path):
+            digest.update(line)
+            key = json.loads(line).get(parameters["key_field"])
+            if is_test_record(
+                line if key is None else str(key),
+                parameters["test_ratio"],
+                parameters["seed"],
+            ):
+                test_file.write(line)
+                split_digests[test_path.name].update(line)
+                counts["num_test"] += 1
+            else:
+                train_file.write(line)
+                split_digests[train_path.name].update(line)
+                counts["num_train"] += 1
+    os.replace(train_temp_path, train_path)
+    os.replace(test_temp_path, test_path)
+    splits = {
+        split_path.name: {
+            "sha256": split_digests[split_path.name].hexdigest(),
+            "stat": _stat_key(split_path),
+        }
+        for split_path in (train_path, test_path)
+    }
+    return {"source_sha256": digest.hexdigest(), **counts, "splits": splits}
+
+
+def split_sha256(split_path: Union[Path, str]) -> str:
+    """sha256 of a file written by split_jsonl. The hash recorded in the split
+    metadata while writing it is reused if the file kept its size and
+    modification time, otherwise the file is hashed again.
+
+    Args:
+        split_path (Union[Path, str]): Path to the train or test file.
+
+    Returns:
+        str: hex digest of the file.
+    """
+    split_path = Path(split_path)
+    metadata_path = split_path.parent / SPLIT_METADATA_FILE
+    if metadata_path.exists():
+        metadata = json.loads(metadata_path.read_text(encoding="utf-8"))
+        recorded = metadata.get("splits", {}).get(split_path.name)
+        if recorded is not None and recorded["stat"] == _stat_key(split_path):
+            return recorded["sha256"]
+    return file_sha256(split_path)
+
+
+def split_jsonl(
+    dataset_path: Union[Path, str],
+    output_folder: Union[Path, str],
+    test_ratio: float,
+    *,
+    seed: int = 0,
+    key_field: str = "file_name",
+    train_file_name: str = "train.jsonl",
+    test_file_name: str = "test.jsonl",
+) -> Tuple[Path, Path]:
+    """Splits a jsonl dataset into train and test files. Records are streamed
+    one line at a time and assigned to a split by the hash of their key_field,
+    records without it are assigned by the hash of the whole line. Existing
+    splits are reused if the dataset and the split parameters are unchanged:
+    the dataset is only hashed again when its size or modification time changed.
+
+    Args:
+        dataset_path (Union[Path, str]): Path to the jsonl dataset, or a folder
+            of shards written by ShardedJsonlWriter.
+        output_folder (Union[Path, str]): Folder for the train and test files.
+        test_ratio (float): Expected fraction of records in the test split.
+        seed (int): Seed of the split assignment.
+        key_field (str): Record field used as the split key.
+        train_file_name (str): Name of the train file.
+        test_file_name (str): Name of the test file.
+
+    Returns:
+        Tuple[Path, Path]: Paths of the train and test files.
+    """
+    dataset_path = Path(dataset_path)
+    output_folder = Path(output_folder)
+    output_folder.mkdir(parents=True, exist_ok=True)
+    train_path = output_folder / train_file_name
+    test_path = output_folder / test_file_name
+    metadata_path = output_folder / SPLIT_METADATA_FILE
+
+    stat = _stat_key(dataset_path)
+    parameters = {"test_ratio": test_ratio, "seed": seed, "key_field": key_field}
+    if (
+        metadata_path.exists()
+        and train_path.exists()
+        and test_path.exists()
+        and _split_is_current(dataset_path, stat, metadata_path, parameters)
+    ):
+        return train_path, test_path
+
+    metadata = {
+        **parameters,
+        **_write_split(dataset_path, train_path, test_path, parameters),
+        "stat": stat,
+    }
+    metadata_path.write_text(json.dumps(metadata), encoding="utf-8")
+    return train_path, test_path
@@ -0,0 +1,167 @@
+"""Length-bucketed batching over precomputed example lengths."""
+import random
+from typing import Iterator, List, Sequence, Tuple
+
+import numpy as np
+
+OVER_LENGTH_POLICIES = ("drop", "truncate", "route")
+
+
+def apply_length_policy(
+    lengths: np.ndarray, max_seq_length: int, policy: str
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Handles examples longer than max_seq_length.
+
+    "drop" removes them, "truncate" keeps them cut to max_seq_length and
+    "route" removes them from training but returns them separately, e.g. for
+    a long-context run.
+
+    Args:
+        lengths (np.ndarray): Number of tokens of every example.
+        max_seq_length (int): Maximum number of tokens of an example.
+        policy (str): "drop", "truncate" or "route".
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: indices of the kept examples,
+        their lengths after the policy, and the indices of the over-length
+        examples that were dropped or routed.
+    """
+    if policy not in OVER_LENGTH_POLICIES:
+        raise ValueError(
+            f"Unknown over-length policy {policy}, expected one of {OVER_LENGTH_POLICIES}"
+        )
+    lengths = np.asarray(lengths)
+    over_length = lengths > max_seq_length
+    if policy == "truncate":
+        return (
+            np.arange(len(lengths)),
+            np.minimum(lengths, max_seq_length),
+            np.zeros(0, dtype=np.int64),
+        )
+    kept_indices = np.flatnonzero(~over_length)
+    return kept_indices, lengths[kept_indices], np.flatnonzero(over_length)
+
+
+def padding_ratio(lengths: np.ndarray, batches: Sequence[Sequence[int]]) -> float:
+    """Fraction of padding tokens when every batch is padded to its longest example.
+
+    Args:
+        lengths (np.ndarray): Number of tokens of every example.
+        batches (Sequence[Sequence[int]]): Positions in lengths of the examples
+            of every batch.
+
+    Returns:
+        float: Padding tokens over all tokens of the padded batches.
+    """
+    lengths = np.asarray(lengths)
+    num_tokens = 0
+    num_padded_tokens = 0
+    for batch in batches:
+        batch_lengths = lengths[np.asarray(batch, dtype=np.int64)]
+        num_tokens += int(batch_lengths.sum())
+        num_padded_tokens += int(batch_lengths.max(initial=0)) * len(batch)
+    return 1 - num_tokens / num_padded_tokens if num_padded_tokens else 0.0
+
+
+class LengthBucketSampler:
+    """Batch sampler grouping examples of similar length. Examples are put in
+    buckets by their length, shuffled within their bucket and cut into batches,
+    then the order of all batches is shuffled. It can be passed as the
+    batch_sampler of a torch DataLoader.
+
+    Attributes:
+        indices (np.ndarray): Dataset indices of the sampled examples.
+        lengths (np.ndarray): Lengths of the sampled examples.
+        boundaries (Sequence[int]): Upper length bound of every bucket, longer
+            examples go to a last bucket.
+        batch_size (int): Number of examples in a batch.
+        seed (int): Seed of the shuffling, combined with the epoch.
+    """
+
+    def __init__(
+        self,
+        indices: np.ndarray,
+        lengths: np.ndarray,
+        boundaries: Sequence[int],
+        *,
+        batch_size: int,
+        seed: int = 0,
+        drop_last: bool = False,
+    ) -> None:
+        """Initialize the sampler
+
+        Args:
+            indices (np.ndarray): Dataset indices of the sampled examples.
+            lengths (np.ndarray): Lengths of the sampled examples.
+            boundaries (Sequence[int]): Upper length bound of every bucket.
+            batch_size (int): Number of examples in a batch.
+            seed (int): Seed of the shuffling.
+            drop_last (bool): Drop the last incomplete batch of every bucket.
+        """
+        self.indices = np.asarray(indices)
+        self.lengths = np.asarray(lengths)
+        self.boundaries = sorted(boundaries)
+        self.batch_size = batch_size
+        self.seed = seed
+        self.drop_last = drop_last
+        self.epoch = 0
+        bucket_ids = np.searchsorted(self.boundaries, self.lengths, side="left")
+        self._buckets = [
+            np.flatnonzero(bucket_ids == bucket_id)
+            for bucket_id in range(len(self.boundaries) + 1)
+        ]
+
+    def set_epoch(self, epoch: int) -> None:
+        """Reshuffles the batches for a new epoch.
+
+        Args:
+            epoch (int): Epoch number.
+        """
+        self.epoch = epoch
+
+    def batches(self) -> List[List[int]]:
+        """Batches of the current epoch, as positions in indices and lengths.
+
+        Returns:
+            List[List[int]]: Positions of the examples of every batch.
+        """
+        rng = random.Random(self.seed + self.epoch)
+        batches = []
+        for bucket in self._buckets:
+            positions = bucket.tolist()
+            rng.shuffle(positions)
+            for start in range(0, len(positions), self.batch_size):
+                batch = positions[start : start + self.batch_size]
+                if len(batch) == self.batch_size or not self.drop_last:
+                    batches.append(batch)
+        rng.shuffle(batches)
+        return batches
+
+    def __iter__(self) -> Iterator[List[int]]:
+        for batch in self.batches():
+            yield self.indices[batch].tolist()
+        # the trainer does not call set_epoch on batch samplers
+        self.epoch += 1
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            return sum(len(bucket) // self.batch_size for bucket in self._buckets)
+        return sum(-(-len(bucket) // self.batch_size) for bucket in self._buckets)
+
+    def padding_report(self) -> Tuple[float, float]:
+        """Padding ratio of shuffled batches without bucketing and of the
+        bucketed batches of the current epoch.
+
+        Returns:
+            Tuple[float, float]: Padding ratio before and after bucketing.
+        """
+        positions = list(range(len(self.lengths)))
+        random.Random(self.seed + self.epoch).shuffle(positions)
+        random_batches = [
+            positions[start : start + self.batch_size]
+            for start in range(0, len(positions), self.batch_size)
+        ]
+        return (
+            padding_ratio(self.lengths, random_batches),
+            padding_ratio(self.lengths, self.batches()),
+        )
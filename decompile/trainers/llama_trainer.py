@@ -1,11 +1,14 @@
 """Trainer implementation for LLaMa model"""
-from typing import Tuple, Dict, List
+from typing import Tuple, Dict, List, Optional, Union
 import os
-import random
+import types
+from pathlib import Path
 from dataclasses import dataclass
 import logging
 
+import numpy as np
 import torch
+from torch.utils.data import DataLoader
 from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
@@ -14,9 +17,31 @@ from transformers import (
 )
 from peft import LoraConfig
 from trl import SFTTrainer
-from datasets import DatasetDict
+from datasets import Dataset, IterableDataset, load_dataset
 
 from decompile.trainers.trainer import Trainer
+from decompile.trainers.dataset_utils import (
+    count_lines,
+    iter_jsonl,
+    num_training_steps,
+    split_jsonl,
+    split_sha256,
+)
+from decompile.trainers.length_buckets import (
+    LengthBucketSampler,
+    apply_length_policy,
+)
+from decompile.trainers.packing import (
+    IGNORE_INDEX,
+    fill_rate,
+    first_fit_decreasing,
+    pack_examples,
+)
+from decompile.trainers.token_cache import (
+    TokenCache,
+    TokenizedCorpus,
+    tokenizer_fingerprint,
+)
 
 
 _LOG = logging.getLogger(__name__)
@@ -30,6 +55,8 @@ class LLaMaOpt:
     model_name: str = "NousResearch/Llama-2-7b-chat-hf"
     new_model: str = "llama-2-7b-decompilation"
     test_ratio: float = 0.14
+    split_seed: int = 42
+    split_dir: str = "./splits"
     lora_r: int = 64
     lora_alpha: int = 16
     lora_dropout: float = 0.1
@@ -58,10 +85,229 @@ class LLaMaOpt:
     logging_steps: int = 25
     max_seq_length: int = 1100
     packing: bool = False
+    # read the jsonl files lazily instead of loading them in memory
+    streaming: bool = False
+    # tokenize the splits once and memory-map the token ids in later runs
+    pretokenize: bool = False
+    token_cache_dir: str = "./token_cache"
+    # with pretokenize, batches are drawn from buckets of similar lengths
+    length_bucket_boundaries: Tuple[int, ...] = (128, 256, 384, 512, 768, 1100)
+    # examples longer than max_seq_length are "drop"ped, "truncate"d or "route"d
+    # to a separate jsonl file for a long-context run
+    over_length_policy: str = "truncate"
+    # with pretokenize, pack whole examples into max_seq_length sequences
+    # with first-fit-decreasing, examples do not attend to each other
+    bin_packing: bool = False
 
     instruction: str = "Write the cpp code for this assembly."
 
 
+class TokenizedDataset(torch.utils.data.Dataset):
+    """Map-style dataset over a memory-mapped tokenized corpus"""
+
+    def __init__(
+        self,
+        corpus: TokenizedCorpus,
+        indices: Optional[np.ndarray] = None,
+        max_length: Optional[int] = None,
+    ) -> None:
+        """Initialize the dataset
+
+        Args:
+            corpus (TokenizedCorpus): Tokenized corpus.
+            indices (Optional[np.ndarray]): Corpus indices of the examples,
+                defaults to the whole corpus.
+            max_length (Optional[int]): Examples are truncated to this many tokens.
+        """
+        self.corpus = corpus
+        self.indices = np.arange(len(corpus)) if indices is None else indices
+        self.max_length = max_length
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, index: int) -> Dict[str, List[int]]:
+        input_ids = self.corpus[int(self.indices[index])][: self.max_length].tolist()
+        return {"input_ids": input_ids, "attention_mask": [1] * len(input_ids)}
+
+
+class PackedDataset(torch.utils.data.Dataset):
+    """Map-style dataset of bins of whole examples packed into one sequence"""
+
+    def __init__(self, dataset: TokenizedDataset, bins: List[List[int]]) -> None:
+        """Initialize the dataset
+
+        Args:
+            dataset (TokenizedDataset): Dataset of the packed examples.
+            bins (List[List[int]]): Dataset indices of the examples of every bin.
+        """
+        self.dataset = dataset
+        self.bins = bins
+
+    def __len__(self) -> int:
+        return len(self.bins)
+
+    def __getitem__(self, index: int) -> Dict[str, List[int]]:
+        packed = pack_examples(
+            [
+                np.asarray(self.dataset[example]["input_ids"])
+                for example in self.bins[index]
+            ]
+        )
+        return {
+            "input_ids": packed["input_ids"].tolist(),
+            "labels": packed["labels"].tolist(),
+            "position_ids": packed["position_ids"].tolist(),
+            # segment ids take the place of the attention mask
+            "attention_mask": packed["segment_ids"].tolist(),
+        }
+
+
+def collate_segments(features: List[Dict[str, List[int]]]) -> Dict[str, torch.Tensor]:
+    """Pads packed and unpacked examples into a batch. Unpacked examples get
+    a single segment, padding gets segment 0.
+
+    Args:
+        features (List[Dict[str, List[int]]]): Examples of the batch.
+
+    Returns:
+        Dict[str, torch.Tensor]: Batch tensors.
+    """
+    max_length = max(len(feature["input_ids"]) for feature in features)
+    batch: Dict[str, List[List[int]]] = {
+        "input_ids": [],
+        "labels": [],
+        "position_ids": [],
+        "attention_mask": [],
+    }
+    for feature in features:
+        length = len(feature["input_ids"])
+        padding = [0] * (max_length - length)
+        batch["input_ids"].append(feature["input_ids"] + padding)
+        batch["labels"].append(
+            feature.get("labels", feature["input_ids"]) + [IGNORE_INDEX] * len(padding)
+        )
+        batch["position_ids"].append(
+            feature.get("position_ids", list(range(length))) + padding
+        )
+        batch["attention_mask"].append(feature["attention_mask"] + padding)
+    return {name: torch.tensor(values) for name, values in batch.items()}
+
+
+def tokenize_stream(
+    dataset: IterableDataset, tokenizer, text_field: str, max_length: int
+) -> IterableDataset:
+    """Lazily tokenizes the text field of a streamed dataset and drops the
+    other columns. SFTTrainer passes iterable datasets through untokenized,
+    and the trainer then removes every column the model does not accept.
+
+    Args:
+        dataset (IterableDataset): Streamed dataset.
+        tokenizer: Tokenizer of the model.
+        text_field (str): Name of the text field.
+        max_length (int): Examples are truncated to this many tokens.
+
+    Returns:
+        IterableDataset: Streamed dataset of input_ids and attention_mask.
+    """
+    # streamed json datasets do not know their columns before reading a record
+    column_names = list(next(iter(dataset), {}))
+    return dataset.map(
+        lambda batch: tokenizer(
+            batch[text_field], truncation=True, max_length=max_length
+        ),
+        batched=True,
+        remove_columns=column_names,
+    )
+
+
+def _segment_attention_mask(
+    _self, attention_mask, input_shape, inputs_embeds, _past_key_values_length
+):
+    """Replacement of LlamaModel._prepare_decoder_attention_mask reading the
+    attention mask as segment ids: a token only attends to earlier tokens of
+    its own segment, and segment 0 is padding."""
+    sequence_length = input_shape[-1]
+    causal = torch.ones(
+        sequence_length, sequence_length, dtype=torch.bool, device=inputs_embeds.device
+    ).tril()
+    allowed = (
+        (attention_mask[:, :, None] == attention_mask[:, None, :])
+        & (attention_mask[:, None, :] != 0)
+        & causal
+    )
+    mask = torch.zeros(
+        allowed.shape, dtype=inputs_embeds.dtype, device=inputs_embeds.device
+    )
+    mask.masked_fill_(~allowed, torch.finfo(inputs_embeds.dtype).min)
+    return mask[:, None, :, :]
+
+
+def _isolate_segments(model) -> None:
+    """Makes the decoder of a LLaMa model read the attention mask as segment
+    ids, so that packed examples do not attend to each other.
+
+    Args:
+        model: LLaMa model.
+
+    Raises:
+        ValueError: If the decoder does not build its attention mask with
+            _prepare_decoder_attention_mask.
+    """
+    decoder = getattr(model, "model", None)
+    if not hasattr(decoder, "_prepare_decoder_attention_mask"):
+        raise ValueError(
+            f"bin_packing is not supported for {type(model).__name__}, its "
+            + "decoder has no _prepare_decoder_attention_mask to isolate the "
+            + "packed examples"
+        )
+    setattr(
+        decoder,
+        "_prepare_decoder_attention_mask",
+        types.MethodType(_segment_attention_mask, decoder),
+    )
+
+
+class BucketedSFTTrainer(SFTTrainer):
+    """SFTTrainer drawing its training and evaluation batches from batch samplers"""
+
+    def __init__(
+        self,
+        *args,
+        batch_sampler: LengthBucketSampler,
+        eval_batch_sampler: Optional[LengthBucketSampler] = None,
+        **kwargs,
+    ) -> None:
+        self.batch_sampler = batch_sampler
+        self.eval_batch_sampler = eval_batch_sampler
+        super().__init__(*args, **kwargs)
+
+    def get_train_dataloader(self) -> DataLoader:
+        """Training dataloader using the batch sampler"""
+        return self._bucketed_dataloader(self.train_dataset, self.batch_sampler)
+
+    def get_eval_dataloader(self, eval_dataset=None) -> DataLoader:
+        """Evaluation dataloader using the evaluation batch sampler, unless
+        another dataset is evaluated"""
+        if self.eval_batch_sampler is None or eval_dataset is not None:
+            return super().get_eval_dataloader(eval_dataset)
+        return self._bucketed_dataloader(self.eval_dataset, self.eval_batch_sampler)
+
+    def _bucketed_dataloader(
+        self, dataset: TokenizedDataset, batch_sampler: LengthBucketSampler
+    ) -> DataLoader:
+        """Dataloader of a dataset drawing its batches from batch_sampler"""
+        return self.accelerator.prepare(
+            DataLoader(
+                dataset,
+                batch_sampler=batch_sampler,
+                collate_fn=self.data_collator,
+                num_workers=self.args.dataloader_num_workers,
+                pin_memory=self.args.dataloader_pin_memory,
+            )
+        )
+
+
 class LLaMaTrainer(Trainer):
     """Trainer implementation for LLaMa model"""
 
@@ -82,41 +328,52 @@ class LLaMaTrainer(Trainer):
             input_field_name (str): Name of the input field in the dataset.
             output_field_name (str): Name of the output field in the dataset.
         """
-        self.dataset_path = dataset_path
+        super().__init__(dataset_path, input_field_name, output_field_name, **kwargs)
         self._split_dataset()
-        self.train_dataset, self.test_dataset = self._load_dataset()
-        self.train_dataset, self.test_dataset = self._map_dataset(
-            input_field_name,
-            output_field_name,
-        )
-        super().__init__(**kwargs)
+        if not LLaMaOpt.pretokenize:
+            self.train_dataset, self.test_dataset = self._load_dataset()
+            self.train_dataset, self.test_dataset = self._map_dataset(
+                input_field_name,
+                output_field_name,
+            )
 
     def _split_dataset(self) -> None:
-        """Load dataset from path and split into train and test"""
+        """Split the dataset into train and test files. Records are streamed and
+        assigned by a seeded hash of their file name, and the split files of
+        an unchanged dataset are reused."""
         _LOG.info("Splitting dataset...")
-        with open(self.dataset_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-
-        random.shuffle(lines)
-        test_size = int(len(lines) * LLaMaOpt.test_ratio)
-        train_dataset = lines[test_size:]
-        test_dataset = lines[:test_size]
-
-        with open(LLaMaTrainer.train_dataset_file, "w", encoding="utf-8") as train_file:
-            train_file.writelines(train_dataset)
-
-        with open(LLaMaTrainer.test_dataset_file, "w", encoding="utf-8") as test_file:
-            test_file.writelines(test_dataset)
+        self.train_dataset_path, self.test_dataset_path = split_jsonl(
+            self.dataset_path,
+            Path(LLaMaOpt.split_dir) / Path(self.dataset_path).stem,
+            test_ratio=LLaMaOpt.test_ratio,
+            seed=LLaMaOpt.split_seed,
+            train_file_name=LLaMaTrainer.train_dataset_file,
+            test_file_name=LLaMaTrainer.test_dataset_file,
+        )
 
-    def _load_dataset(self) -> Tuple[DatasetDict, ...]:
-        """Load train and test dataset from path"""
+    def _load_dataset(self) -> Tuple[Union[Dataset, IterableDataset], ...]:
+        """Load train and test dataset from the split jsonl files. With
+        LLaMaOpt.streaming the files are read lazily while training."""
         _LOG.info("Loading dataset...")
-        train_dataset = DatasetDict.load_from_disk(LLaMaTrainer.train_dataset_file)
-        test_dataset = DatasetDict.load_from_disk(LLaMaTrainer.test_dataset_file)
+        train_dataset = load_dataset(
+            "json",
+            data_files=str(self.train_dataset_path),
+            split="train",
+            streaming=LLaMaOpt.streaming,
+        )
+        test_dataset = load_dataset(
+            "json",
+            data_files=str(self.test_dataset_path),
+            split="train",
+            streaming=LLaMaOpt.streaming,
+        )
         return train_dataset, test_dataset
 
-    def _map_dataset(self, input_field: str, output_field: str) -> DatasetDict:
-        """Map dataset to LLaMa model
+    def _map_dataset(
+        self, input_field: str, output_field: str
+    ) -> Tuple[Union[Dataset, IterableDataset], ...]:
+        """Map dataset to LLaMa model. Streamed datasets are mapped lazily, one
+        batch at a time as the trainer reads them.
 
         Args:
             input_field (str): Name of the input field in the dataset.
@@ -128,10 +385,7 @@ class LLaMaTrainer(Trainer):
             """Dataset mapper handler"""
             return {
                 LLaMaOpt.dataset_text_field: [
-                    f"[INST] <<SYS>>\n{input}\n<</SYS>>\n\n"
-                    + LLaMaOpt.instruction
-                    + " [/INST] "
-                    + output
+                    LLaMaTrainer.add_template(input) + output
                     for input, output in zip(
                         examples[input_field], examples[output_field]
                     )
@@ -142,6 +396,87 @@ class LLaMaTrainer(Trainer):
         test_dataset_mapped = self.test_dataset.map(mapper_handler, batched=True)
         return train_dataset_mapped, test_dataset_mapped
 
+    def _pretokenize(self, dataset_path: Path, tokenizer) -> TokenizedDataset:
+        """Tokenize a split with the prompt template, or load it from the token
+        cache if the split, the tokenizer, the instruction and max_seq_length
+        did not change. Examples are stored in full, then the over-length
+        policy is applied to their lengths.
+
+        Args:
+            dataset_path (Path): Path to the jsonl split.
+            tokenizer: Tokenizer of the model.
+        """
+        key = TokenCache.make_key(
+            split_sha256(dataset_path),
+            tokenizer_fingerprint(tokenizer),
+            LLaMaOpt.instruction,
+            LLaMaOpt.max_seq_length,
+        )
+        texts = (
+            LLaMaTrainer.add_template(record[self.input_field_name])
+            + record[self.output_field_name]
+            for record in iter_jsonl(dataset_path)
+        )
+        corpus = TokenCache(LLaMaOpt.token_cache_dir).load_or_build(
+            key,
+            texts,
+            lambda batch: tokenizer(batch)["input_ids"],
+            vocab_size=len(tokenizer),
+        )
+        indices, _, over_length_indices = apply_length_policy(
+            corpus.lengths, LLaMaOpt.max_seq_length, LLaMaOpt.over_length_policy
+        )
+        if len(over_length_indices):
+            _LOG.info(
+                "%d of %d examples of %s are longer than %d tokens (%s)",
+                len(over_length_indices),
+                len(corpus),
+                dataset_path,
+                LLaMaOpt.max_seq_length,
+                LLaMaOpt.over_length_policy,
+            )
+        if LLaMaOpt.over_length_policy == "route":
+            self._route_examples(dataset_path, over_length_indices)
+        return TokenizedDataset(corpus, indices, LLaMaOpt.max_seq_length)
+
+    @staticmethod
+    def _pack_dataset(dataset: TokenizedDataset) -> PackedDataset:
+        """Pack the examples of a dataset into max_seq_length sequences.
+
+        Args:
+            dataset (TokenizedDataset): Tokenized dataset.
+        """
+        lengths = np.minimum(
+            dataset.corpus.lengths[dataset.indices], LLaMaOpt.max_seq_length
+        )
+        bins = first_fit_decreasing(lengths, LLaMaOpt.max_seq_length)
+        _LOG.info(
+            "Packed %d examples into %d sequences, fill rate %.3f",
+            len(lengths),
+            len(bins),
+            fill_rate(lengths, bins, LLaMaOpt.max_seq_length),
+        )
+        return PackedDataset(dataset, bins)
+
+    @staticmethod
+    def _route_examples(dataset_path: Path, indices: np.ndarray) -> None:
+        """Writes the records at indices of a split to over_length_<split name>
+        next to the split.
+
+        Args:
+            dataset_path (Path): Path to the jsonl split.
+            indices (np.ndarray): Line numbers of the routed records.
+        """
+        routed_indices = set(indices.tolist())
+        routed_path = dataset_path.with_name("over_length_" + dataset_path.name)
+        with open(dataset_path, "rb") as dataset_file, open(
+            routed_path, "wb"
+        ) as routed_file:
+            lines = (line for line in dataset_file if line.strip())
+            for index, line in enumerate(lines):
+                if index in routed_indices:
+                    routed_file.write(line)
+
     def train(self):
         """Train LLaMa model"""
 
@@ -170,6 +505,41 @@ class LLaMaTrainer(Trainer):
         tokenizer.pad_token = tokenizer.eos_token
         tokenizer.padding_side = "right"
 
+        if LLaMaOpt.pretokenize:
+            _LOG.info("Loading tokenized dataset...")
+            self.train_dataset = self._pretokenize(self.train_dataset_path, tokenizer)
+            self.test_dataset = self._pretokenize(self.test_dataset_path, tokenizer)
+            batch_sampler = LengthBucketSampler(
+                np.arange(len(self.train_dataset)),
+                np.minimum(
+                    self.train_dataset.corpus.lengths[self.train_dataset.indices],
+                    LLaMaOpt.max_seq_length,
+                ),
+                LLaMaOpt.length_bucket_boundaries,
+                batch_size=LLaMaOpt.per_device_train_batch_size,
+                seed=LLaMaOpt.split_seed,
+            )
+            padding_before, padding_after = batch_sampler.padding_report()
+            _LOG.info(
+                "Padding ratio %.3f without bucketing, %.3f with bucketing",
+                padding_before,
+                padding_after,
+            )
+            if LLaMaOpt.bin_packing:
+                _isolate_segments(model)
+                self.train_dataset = self._pack_dataset(self.train_dataset)
+
+        if LLaMaOpt.streaming and not LLaMaOpt.pretokenize:
+            self.train_dataset, self.test_dataset = (
+                tokenize_stream(
+                    dataset,
+                    tokenizer,
+                    LLaMaOpt.dataset_text_field,
+                    LLaMaOpt.max_seq_length,
+                )
+                for dataset in (self.train_dataset, self.test_dataset)
+            )
+
         peft_config = LoraConfig(
             lora_alpha=LLaMaOpt.lora_alpha,
             lora_dropout=LLaMaOpt.lora_dropout,
@@ -178,6 +548,16 @@ class LLaMaTrainer(Trainer):
             task_type="CAUSAL_LM",
         )
 
+        max_steps = LLaMaOpt.max_steps
+        if LLaMaOpt.streaming and max_steps == -1:
+            # streamed datasets have no length, so the trainer needs max_steps
+            max_steps = num_training_steps(
+                count_lines(self.train_dataset_path),
+                LLaMaOpt.per_device_train_batch_size,
+                LLaMaOpt.gradient_accumulation_steps,
+                LLaMaOpt.num_train_epochs,
+            )
+
         training_arguments = TrainingArguments(
             output_dir=LLaMaOpt.output_dir,
             num_train_epochs=LLaMaOpt.num_train_epochs,
@@ -191,16 +571,37 @@ class LLaMaTrainer(Trainer):
             fp16=LLaMaOpt.fp16,
             bf16=LLaMaOpt.bf16,
             max_grad_norm=LLaMaOpt.max_grad_norm,
-            max_steps=LLaMaOpt.max_steps,
+            max_steps=max_steps,
             warmup_ratio=LLaMaOpt.warmup_ratio,
-            group_by_length=LLaMaOpt.group_by_length,
+            # bucketing replaces the on the fly length grouping
+            group_by_length=LLaMaOpt.group_by_length and not LLaMaOpt.pretokenize,
             lr_scheduler_type=LLaMaOpt.lr_scheduler_type,
             report_to="all",
             evaluation_strategy="steps",
             eval_steps=LLaMaOpt.eval_steps,
+            # the forward signature of the peft model has no position_ids,
+            # which the trainer would drop from packed batches
+            remove_unused_columns=not (LLaMaOpt.pretokenize and LLaMaOpt.bin_packing),
         )
 
-        trainer = SFTTrainer(
+        trainer_class = SFTTrainer
+        trainer_kwargs = {}
+        if LLaMaOpt.pretokenize and LLaMaOpt.bin_packing:
+            trainer_kwargs["data_collator"] = collate_segments
+        elif LLaMaOpt.pretokenize:
+            trainer_class = BucketedSFTTrainer
+            trainer_kwargs["batch_sampler"] = batch_sampler
+            trainer_kwargs["eval_batch_sampler"] = LengthBucketSampler(
+                np.arange(len(self.test_dataset)),
+                np.minimum(
+                    self.test_dataset.corpus.lengths[self.test_dataset.indices],
+                    LLaMaOpt.max_seq_length,
+                ),
+                LLaMaOpt.length_bucket_boundaries,
+                batch_size=LLaMaOpt.per_device_eval_batch_size,
+                seed=LLaMaOpt.split_seed,
+            )
+        trainer = trainer_class(
             model=model,
             train_dataset=self.train_dataset,
             eval_dataset=self.test_dataset,
@@ -210,6 +611,7 @@ class LLaMaTrainer(Trainer):
             tokenizer=tokenizer,
             args=training_arguments,
             packing=LLaMaOpt.packing,
+            **trainer_kwargs,
         )
 
         _LOG.info("Training...")
@@ -0,0 +1,97 @@
+"""Bin packing of whole examples into fixed size training sequences."""
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+# label of the tokens that are not predicted
+IGNORE_INDEX = -100
+
+
+def first_fit_decreasing(lengths: np.ndarray, capacity: int) -> List[List[int]]:
+    """Packs examples into bins of capacity tokens with first-fit-decreasing:
+    examples are placed from the longest to the shortest, each in the first bin
+    with enough room left. The first fitting bin is found in O(log n) with a
+    segment tree holding the largest room left in every range of bins.
+
+    Args:
+        lengths (np.ndarray): Number of tokens of every example.
+        capacity (int): Number of tokens of a bin, e.g. max_seq_length.
+
+    Returns:
+        List[List[int]]: Indices of the examples of every bin.
+    """
+    lengths = np.asarray(lengths)
+    if len(lengths) and lengths.max() > capacity:
+        raise ValueError(f"examples longer than the bin capacity {capacity}")
+    size = 1
+    while size < max(len(lengths), 1):
+        size *= 2
+    # leaves are the bins, there are never more bins than examples
+    room = [capacity] * (2 * size)
+    bins: List[List[int]] = []
+    for index in np.argsort(-lengths, kind="stable").tolist():
+        length = int(lengths[index])
+        node = 1
+        while node < size:
+            node = 2 * node if room[2 * node] >= length else 2 * node + 1
+        bin_id = node - size
+        if bin_id == len(bins):
+            bins.append([])
+        bins[bin_id].append(index)
+        room[node] -= length
+        node //= 2
+        while node:
+            room[node] = max(room[2 * node], room[2 * node + 1])
+            node //= 2
+    return bins
+
+
+def fill_rate(
+    lengths: np.ndarray, bins: Sequence[Sequence[int]], capacity: int
+) -> float:
+    """Fraction of the bin tokens used by examples.
+
+    Args:
+        lengths (np.ndarray): Number of tokens of every example.
+        bins (Sequence[Sequence[int]]): Indices of the examples of every bin.
+        capacity (int): Number of tokens of a bin.
+
+    Returns:
+        float: Used tokens over the capacity of all bins.
+    """
+    if not bins:
+        return 0.0
+    lengths = np.asarray(lengths)
+    used_tokens = sum(int(lengths[list(examples)].sum()) for examples in bins)
+    return used_tokens / (len(bins) * capacity)
+
+
+def pack_examples(examples: Sequence[np.ndarray]) -> Dict[str, np.ndarray]:
+    """Concatenates the token ids of the examples of a bin, with the metadata
+    needed to keep them apart: position ids restart at every example, segment
+    ids number the examples from 1 so that attention can be restricted to
+    tokens of the same segment, and cu_seqlens holds the example boundaries
+    in the format of variable length attention kernels. The first token of
+    every example is not used as a label, so that no example is trained to
+    predict the start of the next one.
+
+    Args:
+        examples (Sequence[np.ndarray]): Token ids of every example.
+
+    Returns:
+        Dict[str, np.ndarray]: input_ids, labels, position_ids, segment_ids
+        and cu_seqlens of the packed sequence.
+    """
+    lengths = [len(example) for example in examples]
+    input_ids = np.concatenate([np.asarray(example) for example in examples])
+    input_ids = input_ids.astype(np.int64)
+    cu_seqlens = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int32)
+    labels = input_ids.copy()
+    labels[cu_seqlens[:-1][np.asarray(lengths) > 0]] = IGNORE_INDEX
+    return {
+        "input_ids": input_ids,
+        "labels": labels,
+        "position_ids": np.concatenate([np.arange(length) for length in lengths]),
+        "segment_ids": np.repeat(np.arange(1, len(lengths) + 1), lengths),
+        "cu_seqlens": cu_seqlens,
+    }
@@ -0,0 +1,226 @@
+"""Persistent cache of tokenized datasets stored as memory-mapped numpy arrays."""
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+TOKENS_FILE = "tokens.bin"
+OFFSETS_FILE = "offsets.bin"
+LENGTHS_FILE = "lengths.bin"
+METADATA_FILE = "meta.json"
+
+
+def tokenizer_fingerprint(tokenizer: Any) -> str:
+    """Hash of everything that changes the output of a tokenizer: its class,
+    vocabulary, special tokens and, for fast tokenizers, the whole pipeline.
+
+    Args:
+        tokenizer (Any): transformers tokenizer.
+
+    Returns:
+        str: hex digest identifying the tokenizer.
+    """
+    digest = hashlib.sha256(type(tokenizer).__name__.encode("utf-8"))
+    digest.update(json.dumps(tokenizer.get_vocab(), sort_keys=True).encode("utf-8"))
+    digest.update(
+        json.dumps(tokenizer.special_tokens_map, sort_keys=True).encode("utf-8")
+    )
+    backend_tokenizer = getattr(tokenizer, "backend_tokenizer", None)
+    if backend_tokenizer is not None:
+        digest.update(backend_tokenizer.to_str().encode("utf-8"))
+    return digest.hexdigest()
+
+
+class TokenizedCorpus:
+    """Token ids of a tokenized dataset, memory-mapped from the cache. Example i
+    holds tokens[offsets[i]:offsets[i + 1]], nothing is read before it is used.
+
+    Attributes:
+        tokens (np.memmap): Token ids of all examples, back to back.
+        offsets (np.memmap): Start of every example in tokens, plus the end.
+        lengths (np.memmap): Number of tokens of every example.
+    """
+
+    def __init__(self, corpus_folder: Union[Path, str]) -> None:
+        """Initialize the corpus
+
+        Args:
+            corpus_folder (Union[Path, str]): Cache folder of the corpus.
+        """
+        corpus_folder = Path(corpus_folder)
+        metadata = json.loads((corpus_folder / METADATA_FILE).read_text("utf-8"))
+        self.tokens = self._memmap(
+            corpus_folder / TOKENS_FILE, metadata["dtype"], metadata["num_tokens"]
+        )
+        self.offsets = self._memmap(
+            corpus_folder / OFFSETS_FILE, "int64", metadata["num_examples"] + 1
+        )
+        self.lengths = self._memmap(
+            corpus_folder / LENGTHS_FILE, "int32", metadata["num_examples"]
+        )
+
+    @staticmethod
+    def _memmap(file_path: Path, dtype: str, size: int) -> np.ndarray:
+        """Read-only memory map of a flat array, numpy cannot map empty files."""
+        if size == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(file_path, dtype=dtype, mode="r", shape=(size,))
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        """Token ids of an example, as a view into the memory map.
+
+        Args:
+            index (int): Index of the example.
+
+        Returns:
+            np.ndarray: Token ids.
+        """
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"example {index} out of range")
+        return self.tokens[self.offsets[index] : self.offsets[index + 1]]
+
+
+class TokenCache:
+    """Folder of tokenized datasets, one sub folder per cache key. A corpus is
+    tokenized in batches and streamed to disk, then published by renaming its
+    folder, so a crashed build never leaves a partial corpus behind.
+
+    Attributes:
+        cache_folder (Path): Folder holding the tokenized datasets.
+    """
+
+    def __init__(self, cache_folder: Union[Path, str]) -> None:
+        self.cache_folder = Path(cache_folder)
+        self.cache_folder.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def make_key(
+        dataset_sha256: str,
+        tokenizer_hash: str,
+        instruction: str,
+        max_seq_length: int,
+    ) -> str:
+        """Builds the cache key of a tokenized dataset.
+
+        Args:
+            dataset_sha256 (str): sha256 of the dataset file.
+            tokenizer_hash (str): Fingerprint of the tokenizer.
+            instruction (str): Instruction of the prompt template.
+            max_seq_length (int): Examples are truncated to this many tokens.
+
+        Returns:
+            str: hex digest used as the cache key.
+        """
+        parameters = [dataset_sha256, tokenizer_hash, instruction, max_seq_length]
+        return hashlib.sha256(json.dumps(parameters).encode("utf-8")).hexdigest()
+
+    def load(self, key: str) -> Optional[TokenizedCorpus]:
+        """Memory-maps the tokenized dataset stored under key.
+
+        Args:
+            key (str): Cache key.
+
+        Returns:
+            Optional[TokenizedCorpus]: Tokenized dataset, or None on a cache miss.
+        """
+        corpus_folder = self.cache_folder / key
+        if not (corpus_folder / METADATA_FILE).exists():
+            return None
+        return TokenizedCorpus(corpus_folder)
+
+    def load_or_build(
+        self,
+        key: str,
+        texts: Iterable[str],
+        tokenize: Callable[[List[str]], List[List[int]]],
+        vocab_size: int,
+        batch_size: int = 1024,
+    ) -> TokenizedCorpus:
+        """Loads the tokenized dataset stored under key, tokenizing texts first
+        on a cache miss. texts is only consumed on a cache miss, so it should
+        be a lazy iterable.
+
+        Args:
+            key (str): Cache key.
+            texts (Iterable[str]): Templated examples.
+            tokenize (Callable[[List[str]], List[List[int]]]): Tokenizes a batch of
+                texts into token ids, truncated to max_seq_length.
+            vocab_size (int): Size of the vocabulary, selects the token dtype.
+            batch_size (int): Number of texts tokenized at once.
+
+        Returns:
+            TokenizedCorpus: Tokenized dataset.
+        """
+        corpus = self.load(key)
+        if corpus is not None:
+            return corpus
+
+        dtype = "uint16" if vocab_size <= 2**16 else "uint32"
+        temp_folder = Path(tempfile.mkdtemp(dir=self.cache_folder, prefix=".build-"))
+        try:
+            metadata = _write_corpus(temp_folder, texts, tokenize, dtype, batch_size)
+            (temp_folder / METADATA_FILE).write_text(json.dumps(metadata), "utf-8")
+            try:
+                os.rename(temp_folder, self.cache_folder / key)
+            except OSError:
+                # another process published the same corpus first
+                shutil.rmtree(temp_folder)
+        except BaseException:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+            raise
+        return TokenizedCorpus(self.cache_folder / key)
+
+
+def _write_corpus(
+    corpus_folder: Path,
+    texts: Iterable[str],
+    tokenize: Callable[[List[str]], List[List[int]]],
+    dtype: str,
+    batch_size: int,
+) -> Dict[str, Any]:
+    """Tokenizes texts batch by batch into the token, offset and length files
+    of corpus_folder.
+
+    Args:
+        corpus_folder (Path): Folder of the tokenized dataset.
+        texts (Iterable[str]): Templated examples.
+        tokenize (Callable[[List[str]], List[List[int]]]): Tokenizes a batch of
+            texts into token ids.
+        dtype (str): dtype of the token ids.
+        batch_size (int): Number of texts tokenized at once.
+
+    Returns:
+        Dict[str, Any]: metadata of the tokenized dataset.
+    """
+    num_tokens = 0
+    num_examples = 0
+    with (corpus_folder / TOKENS_FILE).open("wb") as tokens_file, (
+        corpus_folder / OFFSETS_FILE
+    ).open("wb") as offsets_file, (corpus_folder / LENGTHS_FILE).open(
+        "wb"
+    ) as lengths_file:
+        offsets_file.write(np.zeros(1, dtype="int64").tobytes())
+        texts_iterator = iter(texts)
+        for batch in iter(lambda: list(islice(texts_iterator, batch_size)), []):
+            token_ids = tokenize(batch)
+            lengths = np.array([len(ids) for ids in token_ids], dtype="int32")
+            for ids in token_ids:
+                tokens_file.write(np.asarray(ids, dtype=dtype).tobytes())
+            offsets_file.write(
+                (num_tokens + np.cumsum(lengths, dtype="int64")).tobytes()
+            )
+            lengths_file.write(lengths.tobytes())
+            num_tokens += int(lengths.sum())
+            num_examples += len(batch)
+    return {"dtype": dtype, "num_examples": num_examples, "num_tokens": num_tokens}
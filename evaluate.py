@@ -1,10 +1,22 @@
-"""Testing models inference"""
+"""Testing models inference
+
+Decompile a single assembly string with `--input`, or every record of a jsonl file
+written by the preprocessing pipeline with `--input-jsonl` and `--output-jsonl`.
+"""
 import sys
+import json
+from itertools import islice
+from typing import Any, Callable, Dict, List
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
 from transformers import pipeline
 
 from decompile.trainers.llama_trainer import LLaMaTrainer
+from decompile.trainers.token_cache import tokenizer_fingerprint
+from decompile.trainers.dataset_utils import iter_jsonl
+from decompile.inference.generator import BatchGenerator
+from decompile.inference.server import decompile_remote
+from decompile.inference.result_cache import InferenceCache, model_fingerprint
 
 
 def main() -> int:
@@ -20,21 +32,64 @@ def main() -> int:
     parser.add_argument(
         "--model-path",
         type=str,
-        required=True,
         help="Path to the model.",
     )
     parser.add_argument(
         "--tokenizer-path",
         type=str,
-        required=True,
         help="Path to the tokenizer.",
     )
     parser.add_argument(
+        "--server",
+        type=str,
+        help="Url of a running serve.py, used instead of loading the model.",
+    )
+    input_group = parser.add_mutually_exclusive_group(required=True)
+    input_group.add_argument(
         "--input",
         type=str,
-        required=True,
         help="Input assembly.",
     )
+    input_group.add_argument(
+        "--input-jsonl",
+        type=str,
+        help="jsonl file of records with an input field, decompiled in batches.",
+    )
+    parser.add_argument(
+        "--output-jsonl",
+        type=str,
+        default="predictions.jsonl",
+        help="Output jsonl file of the bulk mode.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=8,
+        help="Number of prompts generated at once in the bulk mode.",
+    )
+    parser.add_argument(
+        "--window-size",
+        type=int,
+        default=1024,
+        help="Number of records read and sorted by length at once in the bulk mode.",
+    )
+    parser.add_argument(
+        "--max-new-tokens",
+        type=int,
+        default=512,
+        help="Maximum number of generated tokens in the bulk mode.",
+    )
+    parser.add_argument(
+        "--cache-folder",
+        type=str,
+        help="Folder of the persistent inference cache of the bulk mode.",
+    )
+    parser.add_argument(
+        "--report-every",
+        type=int,
+        default=100,
+        help="Print throughput after this many samples in the bulk mode.",
+    )
     parser.add_argument(
         "--max-length",
         type=int,
@@ -43,8 +98,18 @@ def main() -> int:
     )
 
     args = parser.parse_args()
-    prompt = LLaMaTrainer.add_template(args.input)
+    if args.server is not None and args.input_jsonl is not None:
+        parser.error("--server only decompiles --input, not --input-jsonl")
+    if args.server is not None:
+        print("Model Output:\n", decompile_remote(args.server, args.input), sep="")
+        return 0
+    if args.model_path is None or args.tokenizer_path is None:
+        parser.error("--model-path and --tokenizer-path are required without --server")
     model, tokenizer = LLaMaTrainer.load_model(args.model_path, args.tokenizer_path)
+    if args.input_jsonl is not None:
+        return bulk_inference(model, tokenizer, args)
+
+    prompt = LLaMaTrainer.add_template(args.input)
     pipe = pipeline(
         task="text-generation",
         model=model,
@@ -56,5 +121,79 @@ def main() -> int:
     return 0
 
 
+def bulk_inference(model, tokenizer, args) -> int:
+    """Decompiles every record of args.input_jsonl in length-sorted batches and
+    appends each prediction to args.output_jsonl as soon as its batch is done.
+    Records are read lazily, args.window_size at a time, so memory use does
+    not grow with the size of the file. Records whose assembly is already in
+    the inference cache are written first, and repeated assembly is only
+    generated once."""
+    generator = BatchGenerator(
+        model,
+        tokenizer,
+        batch_size=args.batch_size,
+        max_new_tokens=args.max_new_tokens,
+        window_size=args.window_size,
+    )
+    cache = InferenceCache(args.cache_folder)
+    model_id = model_fingerprint(args.model_path, tokenizer_fingerprint(tokenizer))
+    generation_params = {"max_new_tokens": args.max_new_tokens, "do_sample": False}
+    num_written = 0
+    with open(args.output_jsonl, "w", encoding="utf-8") as output_file:
+
+        def write_prediction(record: Dict[str, Any], prediction: str) -> None:
+            nonlocal num_written
+            output_file.write(json.dumps({**record, "prediction": prediction}))
+            output_file.write("\n")
+            output_file.flush()
+            num_written += 1
+            if num_written % args.report_every == 0:
+                print(generator.meter.report())
+
+        records = iter_jsonl(args.input_jsonl)
+        for window in iter(lambda: list(islice(records, args.window_size)), []):
+            keys = [
+                cache.make_key(record["input"], model_id, generation_params)
+                for record in window
+            ]
+            _decompile_window(window, keys, generator, cache, write_prediction)
+    print(generator.meter.report())
+    print(f"Inference cache: {cache.stats()}")
+    return 0
+
+
+def _decompile_window(
+    window: List[Dict[str, Any]],
+    keys: List[str],
+    generator: BatchGenerator,
+    cache: InferenceCache,
+    write_prediction: Callable[[Dict[str, Any], str], None],
+) -> None:
+    """Writes the predictions of a window of records, generating those missing
+    from the cache. Generated outputs are put in the cache, so assembly repeated
+    in a later window is not generated again."""
+    # window positions of every assembly that has to be generated
+    pending: Dict[str, List[int]] = {}
+    for position, (record, key) in enumerate(zip(window, keys)):
+        if key in pending:
+            pending[key].append(position)
+            continue
+        cached = cache.get(key)
+        if cached is None:
+            pending[key] = [position]
+        else:
+            write_prediction(record, cached)
+
+    pending_keys = list(pending)
+    prompts = (
+        LLaMaTrainer.add_template(window[pending[key][0]]["input"])
+        for key in pending_keys
+    )
+    for index, prediction in generator.iter_generate(prompts):
+        cache.put(pending_keys[index], prediction)
+        for position in pending[pending_keys[index]]:
+            write_prediction(window[position], prediction)
+
+
 if __name__ == "__main__":
     sys.exit(main())
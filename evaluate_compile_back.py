@@ -0,0 +1,99 @@
+"""Compile-back evaluation of model predictions
+
+Run `python evaluate.py --input-jsonl <test.jsonl> --output-jsonl predictions.jsonl`
+first, then `python evaluate_compile_back.py --predictions-jsonl predictions.jsonl` to
+recompile every prediction and compare its assembly with the model input.
+"""
+import os
+import sys
+import json
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from decompile.inference.compile_back import evaluate_compile_back
+
+
+def main() -> int:
+    """Main entry point for the compile-back evaluation"""
+    parser = ArgumentParser(
+        prog="CompileBack",
+        description="Recompile predictions and score them against the input assembly",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--predictions-jsonl",
+        type=str,
+        required=True,
+        help="jsonl file of records with input, file_name and prediction fields.",
+    )
+    parser.add_argument(
+        "--results-jsonl",
+        type=str,
+        default="compile_back.jsonl",
+        help="Output jsonl file with the result of every prediction.",
+    )
+    parser.add_argument(
+        "--summary",
+        type=str,
+        default="compile_back_summary.json",
+        help="Output json file with the compile rate and similarity.",
+    )
+    parser.add_argument(
+        "--nproc", type=int, default=os.cpu_count(), help="Number of workers."
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=10.0,
+        help="Seconds allowed to every compilation.",
+    )
+    parser.add_argument(
+        "--memory-mb",
+        type=int,
+        default=2048,
+        help="Address space limit of every compilation.",
+    )
+    parser.add_argument(
+        "--asm-syntax-type",
+        type=str,
+        choices=["att", "intel"],
+        default="att",
+        help="Syntax type the dataset assembly was produced with.",
+    )
+    parser.add_argument(
+        "--asm-backend",
+        type=str,
+        choices=["objdump", "compiler"],
+        default="objdump",
+        help="Backend the dataset assembly was produced with, objdump "
+        + "disassembles the object file and compiler reads the gcc -S output.",
+    )
+    parser.add_argument(
+        "--prediction-field",
+        type=str,
+        default="prediction",
+        help="Field of the predicted source code.",
+    )
+    parser.add_argument(
+        "--no-precompiled-header",
+        action="store_true",
+        help="Parse the standard headers for every C++ prediction.",
+    )
+    args = parser.parse_args()
+    summary = evaluate_compile_back(
+        args.predictions_jsonl,
+        args.results_jsonl,
+        args.summary,
+        nproc=args.nproc,
+        timeout=args.timeout,
+        memory_bytes=args.memory_mb * 1024**2,
+        asm_syntax_type=args.asm_syntax_type,
+        asm_backend=args.asm_backend,
+        prediction_field=args.prediction_field,
+        precompile_header=not args.no_precompiled_header,
+    )
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
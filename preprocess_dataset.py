@@ -2,8 +2,15 @@
 """Main script for preprocessing the anghadataset. Must be run from the root dir of the project"""
 import sys
 from pathlib import Path
+from typing import Dict, Iterable
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
 from decompile.preprocessing.preprocess import DatasetJsonl
+from decompile.preprocessing.shards import ShardedJsonlWriter
+from decompile.preprocessing.dedup import deduplicate_jsonl
+from decompile.preprocessing.metrics import stage_timer
+from decompile.preprocessing.columnar import ColumnarCorpus
+from decompile.preprocessing.canonicalize import canonicalize_jsonl
 
 # constants
 INPUT_FOLDER = Path("./datasets/formatted/input")
@@ -13,14 +20,84 @@ OUTPUT_FOLDER = Path("./datasets/formatted/output")
 DATASET_NAME = "geeks_for_geeks_successful_test_scripts"
 ARCHITECTURE = "x86-64"
 SYNTAX_TYPE = "att"
+# "objdump" disassembles compiled binaries, "compiler" uses gcc -S output directly
+ASM_BACKEND = "objdump"
 NUM_OF_SAMPLES = 1000
 NUM_CORES = 4
+# compile, disassemble and standardize each file in one worker without touching OUTPUT_FOLDER
+FUSED_PIPELINE = False
+# compile every source once per flag set, e.g. flag_matrix.OPTIMIZATION_FLAG_SETS,
+# into records with a "flags" field. Fused pipeline only, None compiles once
+FLAG_SETS = None
+# number of binaries disassembled by each objdump process
+OBJDUMP_BATCH_SIZE = 64
+# "pool" runs compilers from Python worker processes, "asyncio" launches them
+# directly from this process, keeping NUM_CORES of them running
+SCHEDULER = "pool"
+# seconds before a compiler or objdump process is killed, "asyncio" only
+JOB_TIMEOUT = 60
+# reuse binaries and listings across runs, set to None to disable
+CACHE_FOLDER = Path("./datasets/cache")
+# write size-bounded shards with a random-access index instead of one jsonl file
+SHARDED_OUTPUT = False
+MAX_SHARD_BYTES = 256 * 1024**2
+# None, "gzip" or "zstd" (requires the zstandard package)
+SHARD_COMPRESSION = "gzip"
+# remove near-duplicate records from the jsonl file or shards
+DEDUP = True
+DEDUP_THRESHOLD = 0.8
+# drop instruction addresses and line info and rewrite branch targets to local
+# labels to shorten the inputs, objdump backend only
+CANONICAL_ASM = False
+KEEP_LINE_INFO = False
+# also export the assembly as integer-coded numpy columns, for corpus statistics
+COLUMNAR_OUTPUT = False
+# per-file timings of every stage, rolled up into a report at the end of the run
+METRICS_FOLDER = Path("./datasets/metrics")
 jsonl_file = Path(f"./datasets/formatted/{DATASET_NAME}.jsonl")
 dataset_folder = Path(f"./datasets/raw/{DATASET_NAME}")
+dedup_jsonl_file = Path(f"./datasets/formatted/{DATASET_NAME}_dedup.jsonl")
+dedup_shard_folder = Path(f"./datasets/formatted/{DATASET_NAME}_dedup")
+dedup_report_file = Path(f"./datasets/formatted/{DATASET_NAME}_dedup_report.json")
+shard_folder = Path(f"./datasets/formatted/{DATASET_NAME}")
+canonical_jsonl_file = Path(f"./datasets/formatted/{DATASET_NAME}_canonical.jsonl")
+canonical_report_file = Path(
+    f"./datasets/formatted/{DATASET_NAME}_canonical_report.json"
+)
+columnar_folder = Path(f"./datasets/formatted/{DATASET_NAME}_columnar")
+metrics_report_file = Path(f"./datasets/formatted/{DATASET_NAME}_metrics.json")
+
+
+def write_shards(dataset: DatasetJsonl, records: Iterable[Dict[str, str]]) -> None:
+    """Writes records to sharded output, recording the write stage"""
+    with ShardedJsonlWriter(
+        shard_folder, max_shard_bytes=MAX_SHARD_BYTES, compression=SHARD_COMPRESSION
+    ) as writer:
+        for record in records:
+            with stage_timer(dataset.metrics, "write", record["file_name"]) as event:
+                event["bytes_out"] = writer.write(record)
 
 
 def main() -> int:
     """Main entry point for preprocessing the dataset"""
+    parser = ArgumentParser(
+        prog="PreprocessDataset",
+        description="Compile, disassemble and standardize the dataset",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the files an interrupted run already finished.",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        default=2,
+        help="Number of times a failed file is retried when resuming.",
+    )
+    args = parser.parse_args()
+
     if not dataset_folder.exists():
         raise FileNotFoundError(f"dataset folder not found at {dataset_folder}")
     if not INPUT_FOLDER.exists():
@@ -34,14 +111,93 @@ def main() -> int:
         num_samples=NUM_OF_SAMPLES,
         asm_syntax_type=SYNTAX_TYPE,
         architecture=ARCHITECTURE,
+        asm_backend=ASM_BACKEND,
+        cache_folder=CACHE_FOLDER,
+        metrics_folder=METRICS_FOLDER,
+        resume=args.resume,
     )
-    dataset.collect_source_files(INPUT_FOLDER)
+    dataset.collect_source_files(INPUT_FOLDER, nproc=NUM_CORES)
     print("Finished collecting source files.")
 
-    dataset.preprocess(INPUT_FOLDER, OUTPUT_FOLDER, nproc=4)
-    print("Finished dissembling.")
-    DatasetJsonl.create_jsonl_and_standardize(OUTPUT_FOLDER, INPUT_FOLDER, jsonl_file)
+    if FUSED_PIPELINE and SHARDED_OUTPUT:
+        write_shards(
+            dataset,
+            dataset.iter_fused_records(
+                INPUT_FOLDER, nproc=NUM_CORES, flag_sets=FLAG_SETS
+            ),
+        )
+    elif FUSED_PIPELINE:
+        dataset.preprocess_fused(
+            INPUT_FOLDER, jsonl_file, nproc=NUM_CORES, flag_sets=FLAG_SETS
+        )
+    else:
+        dataset.preprocess(
+            INPUT_FOLDER,
+            OUTPUT_FOLDER,
+            nproc=4,
+            objdump_batch_size=OBJDUMP_BATCH_SIZE,
+            resume=args.resume,
+            max_retries=args.max_retries,
+            scheduler=SCHEDULER,
+            job_timeout=JOB_TIMEOUT,
+        )
+        print("Finished dissembling.")
+        if SHARDED_OUTPUT:
+            write_shards(
+                dataset,
+                DatasetJsonl.iter_standardized_records(
+                    OUTPUT_FOLDER,
+                    INPUT_FOLDER,
+                    nproc=NUM_CORES,
+                    asm_backend=ASM_BACKEND,
+                    metrics=dataset.metrics,
+                ),
+            )
+        else:
+            DatasetJsonl.stream_jsonl_and_standardize(
+                OUTPUT_FOLDER,
+                INPUT_FOLDER,
+                jsonl_file,
+                nproc=NUM_CORES,
+                asm_backend=ASM_BACKEND,
+                metrics=dataset.metrics,
+            )
     print("Finished creating jsonl file.")
+    final_jsonl_file = shard_folder if SHARDED_OUTPUT else jsonl_file
+    if DEDUP:
+        dedup_output = dedup_shard_folder if SHARDED_OUTPUT else dedup_jsonl_file
+        num_records = deduplicate_jsonl(
+            final_jsonl_file,
+            dedup_output,
+            dedup_report_file,
+            nproc=NUM_CORES,
+            asm_threshold=DEDUP_THRESHOLD,
+            source_threshold=DEDUP_THRESHOLD,
+            max_shard_bytes=MAX_SHARD_BYTES,
+        )
+        final_jsonl_file = dedup_output
+        print(f"Kept {num_records} records after dedup, report at {dedup_report_file}.")
+    if CANONICAL_ASM and ASM_BACKEND == "objdump":
+        report = canonicalize_jsonl(
+            final_jsonl_file,
+            canonical_jsonl_file,
+            canonical_report_file,
+            keep_line_info=KEEP_LINE_INFO,
+        )
+        final_jsonl_file = canonical_jsonl_file
+        print(
+            f"Canonical assembly has {report['reduction']:.1%} fewer tokens, "
+            + f"report at {canonical_report_file}."
+        )
+    if COLUMNAR_OUTPUT:
+        corpus = ColumnarCorpus.from_jsonl(final_jsonl_file, columnar_folder)
+        print(f"Columnar corpus at {columnar_folder}: {corpus.statistics()}")
+    print(f"Training dataset at {final_jsonl_file}.")
+    if dataset.cache is not None:
+        print(f"Compilation cache: {dataset.cache.stats()}")
+    if dataset.metrics is not None:
+        dataset.metrics.report(metrics_report_file)
+        print(f"Stage metrics report at {metrics_report_file}.")
     print(f"Finished preprocessing {DATASET_NAME}.")
     return 0
 
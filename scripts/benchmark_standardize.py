@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Microbenchmark for the assembly standardizer.
+
+Run from the root dir of the project with `python -m scripts.benchmark_standardize`.
+
+Compares standardize_asm_file against the original line-by-line implementation on
+listings scaled up from the tests/tests_data/preprocessing fixtures, and checks that
+both produce byte-identical output.
+"""
+import re
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+from typing import Union
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from decompile.preprocessing.standardize import standardize_asm, standardize_asm_file
+
+TESTING_DATA_FOLDER = Path("tests/tests_data/preprocessing")
+
+
+def legacy_standardize_asm_file(asm_file_path: Union[Path, str]) -> str:
+    """Original implementation of standardize_asm_file, kept as the reference."""
+    asm_file_path = Path(asm_file_path)
+    function_found = 0
+    symbol = "<f_gold.*>"
+    standardized_asm_buffer = []
+
+    with asm_file_path.open("r", encoding="utf-8") as file:
+        for line in file.readlines()[5:]:
+            line = line.rstrip()
+            if not line:
+                continue
+
+            if re.search(r"^[0-9a-fA-F]{16} " + symbol, line):
+                function_found = 1
+                continue
+
+            if function_found == 1:
+                standardized_asm_buffer.append(line + "\n")
+                function_found = 2
+
+            elif function_found == 2:
+                if re.search(r"endbr64", line):
+                    continue
+                if re.search(r"^[0-9a-fA-F]{16} <.*>:$", line):
+                    break
+                line = re.sub(r"\s+", " ", line).strip()
+                line = " , ".join(line.split(","))
+                line = "\t" + line + " ;\n"
+                standardized_asm_buffer.append(line)
+    ret = "".join(standardized_asm_buffer)
+    return ret
+
+
+def build_listing(fixture: Path, scale: int, target_last: bool) -> str:
+    """Builds a synthetic objdump listing from a fixture. The target function body
+    is repeated scale times and every other function of the fixture is cloned
+    scale times under a new name.
+
+    Args:
+        fixture (Path): objdump listing to scale up.
+        scale (int): Scaling factor.
+        target_last (bool): Put f_gold after all the other functions.
+
+    Returns:
+        str: Synthetic listing.
+    """
+    lines = fixture.read_text(encoding="utf-8").split("\n")
+    header, body = lines[:5], lines[5:]
+    functions = []
+    current: list = []
+    for line in body:
+        if re.match(r"^[0-9a-fA-F]{16} <.*>:$", line) and current:
+            functions.append(current)
+            current = []
+        current.append(line)
+    functions.append(current)
+
+    target = [function for function in functions if "<f_gold" in function[0]][0]
+    others = [function for function in functions if function is not target]
+    target = target[:2] + [line for line in target[2:] if line.strip()] * scale + [""]
+    clones = []
+    for index in range(scale):
+        for function in others:
+            clones.extend(
+                line.replace("(int, int)", f"_{index}(int, int)") for line in function
+            )
+    parts = clones + target if target_last else target + clones
+    return "\n".join(header + parts)
+
+
+def main() -> int:
+    """Main entry point for the benchmark"""
+    parser = ArgumentParser(
+        prog="BenchmarkStandardize",
+        description="Benchmark the assembly standardizer",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--scale", type=int, default=200, help="Scaling factor.")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions.")
+    args = parser.parse_args()
+
+    for fixture in sorted(TESTING_DATA_FOLDER.glob("standardize_test_input_*.s")):
+        for target_last in (False, True):
+            listing = build_listing(fixture, args.scale, target_last)
+            with tempfile.TemporaryDirectory() as temp_folder:
+                asm_file_path = Path(temp_folder) / fixture.name
+                asm_file_path.write_text(listing, encoding="utf-8")
+                expected = legacy_standardize_asm_file(asm_file_path)
+                assert standardize_asm_file(asm_file_path) == expected
+                assert standardize_asm(listing) == expected
+                assert standardize_asm(listing.encode("utf-8")) == expected
+
+                legacy_time = min(
+                    timeit.repeat(
+                        lambda: legacy_standardize_asm_file(asm_file_path),
+                        number=1,
+                        repeat=args.repeat,
+                    )
+                )
+                new_time = min(
+                    timeit.repeat(
+                        lambda: standardize_asm_file(asm_file_path),
+                        number=1,
+                        repeat=args.repeat,
+                    )
+                )
+            position = "last" if target_last else "first"
+            print(
+                f"{fixture.name} (f_gold {position}, {len(listing) // 1024} KiB): "
+                + f"legacy {legacy_time * 1e3:.2f} ms, "
+                + f"new {new_time * 1e3:.2f} ms, "
+                + f"speedup {legacy_time / new_time:.1f}x"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Decompilation server
+
+To start the server, run `python serve.py --model-path <path> --tokenizer-path <path>`,
+then POST {"input": <assembly>} to http://127.0.0.1:8765/decompile, or call
+`python evaluate.py --server http://127.0.0.1:8765 --input <assembly>`.
+"""
+import sys
+from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+from decompile.trainers.llama_trainer import LLaMaTrainer
+from decompile.trainers.token_cache import tokenizer_fingerprint
+from decompile.inference.generator import BatchGenerator
+from decompile.inference.server import DynamicBatcher, make_server
+from decompile.inference.result_cache import InferenceCache, model_fingerprint
+
+
+def main() -> int:
+    """Main entry point for the server"""
+    parser = ArgumentParser(
+        prog="Serve",
+        description="Serve the decompilation model over localhost HTTP",
+        formatter_class=ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--model-path", type=str, required=True, help="Path to the model."
+    )
+    parser.add_argument(
+        "--tokenizer-path", type=str, required=True, help="Path to the tokenizer."
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Address.")
+    parser.add_argument("--port", type=int, default=8765, help="Port.")
+    parser.add_argument(
+        "--batch-size", type=int, default=8, help="Maximum prompts in a batch."
+    )
+    parser.add_argument(
+        "--max-wait-ms",
+        type=float,
+        default=20,
+        help="How long a batch waits for more requests.",
+    )
+    parser.add_argument(
+        "--max-queue-size",
+        type=int,
+        default=256,
+        help="Requests beyond this many queued ones are rejected.",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=60, help="Default request timeout in seconds."
+    )
+    parser.add_argument(
+        "--max-new-tokens", type=int, default=512, help="Maximum generated tokens."
+    )
+    parser.add_argument(
+        "--cache-folder",
+        type=str,
+        default="./inference_cache",
+        help="Folder of the persistent inference cache.",
+    )
+    args = parser.parse_args()
+
+    model, tokenizer = LLaMaTrainer.load_model(args.model_path, args.tokenizer_path)
+    generator = BatchGenerator(
+        model, tokenizer, batch_size=args.batch_size, max_new_tokens=args.max_new_tokens
+    )
+    cache = InferenceCache(args.cache_folder)
+    model_id = model_fingerprint(args.model_path, tokenizer_fingerprint(tokenizer))
+    generation_params = {"max_new_tokens": args.max_new_tokens, "do_sample": False}
+
+    def generate_batch(inputs):
+        """Generates the outputs of the inputs missing from the cache"""
+        return cache.generate(
+            [
+                cache.make_key(assembly, model_id, generation_params)
+                for assembly in inputs
+            ],
+            inputs,
+            lambda missing: [
+                output
+                for output, _ in generator.generate(
+                    [LLaMaTrainer.add_template(assembly) for assembly in missing]
+                )
+            ],
+        )
+
+    batcher = DynamicBatcher(
+        generate_batch,
+        max_batch_size=args.batch_size,
+        max_wait_seconds=args.max_wait_ms / 1000,
+        max_queue_size=args.max_queue_size,
+    ).start()
+    server = make_server(
+        batcher, args.host, args.port, default_timeout=args.timeout, stats=cache.stats
+    )
+    print(f"Serving on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
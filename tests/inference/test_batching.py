@@ -0,0 +1,16 @@
+"""Testing the bulk inference batching"""
+from decompile.inference.batching import ThroughputMeter, length_sorted_batches
+
+
+def test_length_sorted_batches():
+    batches = length_sorted_batches([3, 10, 1, 7, 5], 2)
+    assert batches == [[1, 3], [4, 0], [2]]
+    assert length_sorted_batches([], 2) == []
+
+
+def test_throughput_meter():
+    meter = ThroughputMeter()
+    meter.update(4, 100, 40)
+    meter.update(2, 50, 10)
+    assert (meter.num_samples, meter.num_generated_tokens) == (6, 50)
+    assert "samples/s" in meter.report()
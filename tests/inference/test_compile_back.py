@@ -0,0 +1,100 @@
+"""Testing the compile-back evaluation"""
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from decompile.inference.compile_back import (
+    asm_similarity,
+    compile_back,
+    evaluate_compile_back,
+    run_sandboxed,
+)
+from decompile.preprocessing.fused import (
+    compile_disassemble_and_standardize,
+    compile_to_assembly_and_standardize,
+)
+
+SOURCE = "int f_gold(int a, int b) {\n  if (a > b) return a - b;\n  return a * b;\n}\n"
+OTHER_SOURCE = "int f_gold(int a, int b) {\n  return a + b;\n}\n"
+
+requires_gcc = pytest.mark.skipif(
+    shutil.which("gcc") is None or shutil.which("objdump") is None,
+    reason="gcc and objdump are required",
+)
+
+
+def test_asm_similarity():
+    asm = "f_gold(int):\n\t0: pushq %rbp ;\n\t1: retq ;\n"
+    moved = "f_gold(int):\n\t10: pushq %rbp ;\n\t11: retq ;\n"
+    assert asm_similarity(asm, moved) == 1.0
+    assert asm_similarity(asm, "f_gold(int):\n\t0: pushq %rbp ;\n") < 1.0
+
+
+def test_run_sandboxed_timeout():
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_sandboxed(["sleep", "5"], timeout=0.2)
+
+
+@requires_gcc
+def test_compile_back():
+    result = compile_back(SOURCE, "sample.c")
+    assert result["status"] == "ok"
+    assert result["asm"].startswith("f_gold")
+    assert compile_back("int f_gold(int a) { return a }", "sample.c")["status"] == (
+        "compile_error"
+    )
+    assert compile_back("int g(void) { return 0; }", "sample.c")["status"] == (
+        "missing_function"
+    )
+    assert compile_back(SOURCE, "sample.rs")["status"] == "unsupported_language"
+
+
+@requires_gcc
+def test_evaluate_compile_back(tmp_path):
+    reference_asm = compile_back(SOURCE, "sample.c")["asm"]
+    records = [
+        {"input": reference_asm, "file_name": "a.c", "prediction": SOURCE},
+        {"input": reference_asm, "file_name": "b.c", "prediction": OTHER_SOURCE},
+        {"input": reference_asm, "file_name": "c.c", "prediction": "int f_gold("},
+    ]
+    predictions = tmp_path / "predictions.jsonl"
+    predictions.write_text(
+        "".join(json.dumps(record) + "\n" for record in records), encoding="utf-8"
+    )
+    results_path = tmp_path / "results.jsonl"
+    summary = evaluate_compile_back(
+        predictions,
+        results_path,
+        tmp_path / "summary.json",
+        precompile_header=False,
+    )
+    results = [json.loads(line) for line in results_path.read_text().splitlines()]
+    assert [result["file_name"] for result in results] == ["a.c", "b.c", "c.c"]
+    assert results[0]["exact_match"] and results[0]["similarity"] == 1.0
+    assert 0 < results[1]["similarity"] < 1
+    assert results[2]["status"] == "compile_error"
+    assert summary["num_compiled"] == 2
+    assert summary["compile_rate"] == pytest.approx(2 / 3)
+    assert summary["exact_match_rate"] == pytest.approx(1 / 3)
+    assert json.loads((tmp_path / "summary.json").read_text()) == summary
+
+
+@requires_gcc
+@pytest.mark.parametrize("asm_backend", ["objdump", "compiler"])
+@pytest.mark.parametrize("asm_syntax_type", ["att", "intel"])
+def test_compile_back_matches_dataset_assembly(tmp_path, asm_backend, asm_syntax_type):
+    source_file = tmp_path / "sample.c"
+    source_file.write_text(SOURCE, encoding="utf-8")
+    pipeline = {
+        "objdump": compile_disassemble_and_standardize,
+        "compiler": compile_to_assembly_and_standardize,
+    }[asm_backend]
+    record = pipeline(source_file, asm_syntax_type, "x86-64")
+
+    result = compile_back(
+        SOURCE, "sample.c", asm_syntax_type=asm_syntax_type, asm_backend=asm_backend
+    )
+    assert result["status"] == "ok"
+    assert result["asm"] == record["input"]
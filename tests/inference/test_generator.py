@@ -0,0 +1,65 @@
+"""Testing batched generation with a tiny random model on CPU"""
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+from decompile.inference.generator import BatchGenerator
+
+WORDS = ["movl", "addl", "subl", "retq", "pushq", "popq", "eax", "ebx"]
+
+
+def make_tokenizer():
+    vocab = {"<unk>": 0, "<s>": 1, "</s>": 2}
+    vocab.update({word: index for index, word in enumerate(WORDS, start=3)})
+    tokenizer = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocab, "<unk>"))
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    return transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        unk_token="<unk>",
+        bos_token="<s>",
+        eos_token="</s>",
+    )
+
+
+def make_model(vocab_size):
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=vocab_size,
+        hidden_size=16,
+        intermediate_size=32,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        max_position_embeddings=64,
+    )
+    return transformers.LlamaForCausalLM(config)
+
+
+def test_iter_generate_reads_prompts_lazily():
+    tokenizer = make_tokenizer()
+    generator = BatchGenerator(
+        make_model(len(tokenizer)),
+        tokenizer,
+        batch_size=2,
+        max_new_tokens=3,
+        window_size=3,
+    )
+    prompts = [" ".join(WORDS[: index + 1]) for index in range(7)]
+    num_read = 0
+
+    def read_prompts():
+        nonlocal num_read
+        for prompt in prompts:
+            num_read += 1
+            yield prompt
+
+    completions = generator.iter_generate(read_prompts())
+    first_index, _ = next(completions)
+    assert num_read == 3
+    assert first_index < 3
+
+    results = dict([(first_index, "")] + list(completions))
+    assert sorted(results) == list(range(7))
+    assert generator.meter.num_samples == 7
+    assert tokenizer.padding_side == "left"
@@ -0,0 +1,72 @@
+"""Testing the inference result cache"""
+import os
+
+from decompile.inference.result_cache import (
+    InferenceCache,
+    canonical_asm,
+    model_fingerprint,
+)
+
+ASM = (
+    "f_gold(int):\n\t4: pushq %rbp ;\n\t9: jmp 4 <f_gold(int)+0x4> ;\n"
+    + "\te: call 30 <f_gold_helper(int)> ;\n"
+)
+MOVED_ASM = (
+    "f_gold(int):\n\t24: pushq %rbp ;\n\t29: jmp 24 <f_gold(int)+0x4> ;\n"
+    + "\t2e: call 50 <f_gold_helper(int)> ;\n"
+)
+RENAMED_ASM = (
+    "g(int):\n\t4: pushq %rbp ;\n\t9: jmp 4 <g(int)+0x4> ;\n"
+    + "\te: call 30 <g_helper(int)> ;\n"
+)
+
+
+def test_canonical_asm():
+    assert canonical_asm(ASM) == (
+        "f_gold(int):\n\tL1: pushq %rbp ;\n\tjmp L1 ;\n"
+        + "\tcall <f_gold_helper(int)> ;\n"
+    )
+    assert canonical_asm(MOVED_ASM) == canonical_asm(ASM)
+    assert canonical_asm(RENAMED_ASM) != canonical_asm(ASM)
+
+
+def test_model_fingerprint(tmp_path):
+    (tmp_path / "config.json").write_text("{}")
+    weights = tmp_path / "model.safetensors"
+    weights.write_bytes(b"weights")
+    fingerprint = model_fingerprint(tmp_path, "tokenizer")
+    assert fingerprint == model_fingerprint(str(tmp_path), "tokenizer")
+    assert fingerprint != model_fingerprint(tmp_path, "other tokenizer")
+
+    (tmp_path / "README.md").write_text("unrelated")
+    assert model_fingerprint(tmp_path, "tokenizer") == fingerprint
+    weights.write_bytes(b"retrained")
+    os.utime(weights, ns=(0, 0))
+    assert model_fingerprint(tmp_path, "tokenizer") != fingerprint
+    assert model_fingerprint("org/model", "tokenizer") != fingerprint
+
+
+def test_inference_cache(tmp_path):
+    cache = InferenceCache(tmp_path, max_memory_entries=1)
+    key = InferenceCache.make_key(ASM, "model", {"max_new_tokens": 8})
+    assert key == InferenceCache.make_key(MOVED_ASM, "model", {"max_new_tokens": 8})
+    assert key != InferenceCache.make_key(ASM, "model", {"max_new_tokens": 16})
+
+    calls = []
+
+    def generate_batch(inputs):
+        calls.append(inputs)
+        return [model_input.upper() for model_input in inputs]
+
+    keys = [key, "other", key]
+    assert cache.generate(keys, ["a", "b", "a"], generate_batch) == ["A", "B", "A"]
+    assert calls == [["a", "b"]]
+    assert cache.generate(keys, ["a", "b", "a"], generate_batch) == ["A", "B", "A"]
+    assert len(calls) == 1
+
+    reopened = InferenceCache(tmp_path)
+    assert reopened.get(key) == "A"
+    assert reopened.get(key) == "A"
+    assert reopened.get("missing") is None
+    stats = reopened.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
@@ -0,0 +1,65 @@
+"""Testing the decompilation server"""
+import threading
+import time
+
+import pytest
+
+from decompile.inference.server import (
+    DynamicBatcher,
+    QueueFullError,
+    decompile_remote,
+    make_server,
+)
+
+
+def test_batcher_groups_close_requests():
+    batch_sizes = []
+
+    def generate_batch(prompts):
+        batch_sizes.append(len(prompts))
+        return [prompt.upper() for prompt in prompts]
+
+    batcher = DynamicBatcher(generate_batch, max_batch_size=4, max_wait_seconds=0.2)
+    outputs = {}
+
+    def submit(prompt):
+        outputs[prompt] = batcher.submit(prompt, timeout=5)
+
+    threads = [threading.Thread(target=submit, args=(f"p{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    batcher.start()
+    for thread in threads:
+        thread.join()
+    batcher.stop()
+    assert outputs == {f"p{i}": f"P{i}" for i in range(4)}
+    assert batch_sizes == [4]
+
+
+def test_batcher_timeout_and_full_queue():
+    batcher = DynamicBatcher(lambda prompts: prompts, max_queue_size=1)
+    with pytest.raises(TimeoutError):
+        batcher.submit("never served", timeout=0.05)
+    with pytest.raises(QueueFullError):
+        batcher.submit("no room", timeout=0.05)
+
+
+def test_server_round_trip():
+    def generate_batch(prompts):
+        if "slow" in prompts:
+            time.sleep(0.5)
+        return [prompt[::-1] for prompt in prompts]
+
+    batcher = DynamicBatcher(generate_batch).start()
+    server = make_server(batcher, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        assert decompile_remote(url, "mov") == "vom"
+        with pytest.raises(RuntimeError, match="504"):
+            decompile_remote(url, "slow", timeout=0.1)
+    finally:
+        server.shutdown()
+        server.server_close()
+        batcher.stop()
@@ -0,0 +1,50 @@
+"""Testing the compilation cache"""
+import pickle
+
+from decompile.preprocessing.cache import CompilationCache
+
+
+def test_cache_hit_and_miss(tmp_path):
+    cache = CompilationCache(tmp_path / "cache")
+    key = CompilationCache.make_key(b"int f_gold();", "gcc -c")
+    assert cache.get_bytes(key) is None
+    cache.put_bytes(key, b"binary")
+    assert cache.get(key, tmp_path / "out.o")
+    assert (tmp_path / "out.o").read_bytes() == b"binary"
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_cache_key_depends_on_flags():
+    assert CompilationCache.make_key(b"src", "gcc -c") != CompilationCache.make_key(
+        b"src", "gcc -c -O2"
+    )
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = CompilationCache(tmp_path / "cache", max_size_bytes=10)
+    cache.put_bytes("old", b"aaaa")
+    cache.put_bytes("new", b"bbbb")
+    cache.get_bytes("old")
+    cache.put_bytes("newest", b"cccc")
+    assert cache.get_bytes("new") is None
+    assert cache.get_bytes("old") == b"aaaa"
+    assert cache.get_bytes("newest") == b"cccc"
+    assert cache.stats()["size_bytes"] == 8
+
+
+def test_cache_batches_lookup_writes(tmp_path):
+    cache = CompilationCache(tmp_path / "cache", flush_every=3)
+    cache.put_bytes("key", b"binary")
+    other = CompilationCache(tmp_path / "cache")
+    assert cache.get_bytes("key") == b"binary"
+    assert cache.get_bytes("missing") is None
+    assert other.stats()["total_hits"] == 0
+    assert cache.get_bytes("key") == b"binary"
+    assert other.stats()["total_hits"] == 2
+    assert other.stats()["total_misses"] == 1
+    cache.get_bytes("key")
+    assert pickle.loads(pickle.dumps(cache)).stats()["total_hits"] == 2
+    assert cache.stats()["hits"] == 3
@@ -0,0 +1,68 @@
+"""Testing the canonical form of standardized assembly"""
+import json
+from pathlib import Path
+
+from decompile.preprocessing.canonicalize import canonicalize_asm, canonicalize_jsonl
+from decompile.preprocessing.standardize import standardize_asm_file
+
+TESTIING_DATA_FOLDER = Path("tests/tests_data/preprocessing")
+ASM = (
+    "f_gold(std::vector<int ,  std::allocator<int> >):\n"
+    + "\t/tmp/a.cpp:3 ;\n"
+    + "\t0: pushq %rbp ;\n"
+    + "\t1: jle 1a <f_gold(std::vector<int ,  std::allocator<int> >)+0x1a> ;\n"
+    + "\t7: callq 0 <_Z1gi> ;\n"
+    + "\t/tmp/a.cpp:4 (discriminator 1) ;\n"
+    + "\tc: leaq 0x0(%rip) , %rax # 13 <f_gold+0x13> ;\n"
+    + "\t13: jmp 1 <f_gold+0x1> ;\n"
+    + "\t1a: retq ;\n"
+)
+
+
+def test_canonicalize_asm():
+    assert canonicalize_asm(ASM) == (
+        "f_gold(std::vector<int ,  std::allocator<int> >):\n"
+        + "\tpushq %rbp ;\n"
+        + "\tL1: jle L3 ;\n"
+        + "\tcallq <_Z1gi> ;\n"
+        + "\tleaq 0x0(%rip) , %rax # L2 ;\n"
+        + "\tL2: jmp L1 ;\n"
+        + "\tL3: retq ;\n"
+    )
+    with_line_info = canonicalize_asm(ASM, keep_line_info=True).split("\n")
+    assert with_line_info[1] == "\t/tmp/a.cpp:3 ;"
+    assert with_line_info[5] == "\t/tmp/a.cpp:4 (discriminator 1) ;"
+    assert canonicalize_asm("") == ""
+
+
+def test_standardize_canonical():
+    input_path = TESTIING_DATA_FOLDER / "standardize_test_input_1.s"
+    assert standardize_asm_file(input_path, canonical=True) == canonicalize_asm(
+        standardize_asm_file(input_path)
+    )
+    assert ":" not in standardize_asm_file(input_path, canonical=True).split("\n")[1]
+
+
+def test_canonicalize_jsonl(tmp_path):
+    jsonl_file = tmp_path / "data.jsonl"
+    records = [{"input": ASM, "file_name": "a.cpp"}, {"input": "", "file_name": "b.c"}]
+    jsonl_file.write_text(
+        "".join(json.dumps(record) + "\n" for record in records), encoding="utf-8"
+    )
+    report = canonicalize_jsonl(
+        jsonl_file,
+        tmp_path / "canonical.jsonl",
+        tmp_path / "report.json",
+        max_seq_length=50,
+    )
+    canonical = [
+        json.loads(line)
+        for line in (tmp_path / "canonical.jsonl").read_text().splitlines()
+    ]
+    assert canonical[0]["input"] == canonicalize_asm(ASM)
+    assert canonical[1] == records[1]
+    assert report["num_records"] == 2
+    assert report["after"]["total"] < report["before"]["total"]
+    assert 0 < report["reduction"] < 1
+    assert report["before"]["over_max_seq_length"] == 1
+    assert json.loads((tmp_path / "report.json").read_text()) == report
@@ -0,0 +1,95 @@
+"""Testing the columnar corpus"""
+import json
+from pathlib import Path
+
+import pytest
+
+from decompile.preprocessing.columnar import (
+    OPERAND_KINDS,
+    ColumnarCorpus,
+    operand_kind,
+    split_instruction,
+)
+
+OBJDUMP_ASM = (
+    "f_gold(int, int):\n"
+    + "\t0: pushq %rbp ;\n"
+    + "\t4: movl %edi , -0x4(%rbp) ;\n"
+    + "\t10: jle 1a <f_gold(int ,  int)+0x1a> ;\n"
+    + "\t12: nopw 0x0(%rax , %rax , 1) ;\n"
+    + "\t18: rep stos %rax , %es:(%rdi) ;\n"
+    + "\t1a: ;\n"
+    + "\t1b: retq ;\n"
+)
+MOVED_ASM = OBJDUMP_ASM.replace("\t1b: retq", "\t2b: retq")
+INTEL_ASM = "f_gold:\n\tmov DWORD PTR -4[rbp] , edi ;\n\tjle .L2 ;\n\t.L2: ;\n\tret ;\n"
+DATA_FOLDER = Path(__file__).parent.parent / "tests_data" / "preprocessing"
+RECORDS = [
+    {"input": OBJDUMP_ASM, "output": "int f_gold(int a, int b);", "file_name": "a.c"},
+    {"input": "", "output": "broken", "file_name": "b.c"},
+    {"input": INTEL_ASM, "output": "", "file_name": "c.c", "flags": "-O2"},
+    {"input": MOVED_ASM, "output": "int f_gold(int a, int b);", "file_name": "d.c"},
+    {
+        "input": (DATA_FOLDER / "standardize_test_output_1.s").read_text(),
+        "output": "",
+        "file_name": "e.c",
+    },
+]
+
+
+def test_split_instruction():
+    assert split_instruction("4: movl %edi , -0x4(%rbp)") == (
+        4,
+        "movl",
+        ["%edi", "-0x4(%rbp)"],
+    )
+    assert split_instruction("12: nopw 0x0(%rax , %rax , 1)") == (
+        18,
+        "nopw",
+        ["0x0(%rax , %rax , 1)"],
+    )
+    assert split_instruction("1a:") == (26, None, [])
+    assert split_instruction(".L2:") == (-1, ".L2:", [])
+    kinds = [
+        operand_kind(operand)
+        for operand in ("%eax", "$0x1", "-0x4(%rbp)", "1a <f_gold+0x1a>", "edi")
+    ]
+    assert [OPERAND_KINDS[kind] for kind in kinds] == [
+        "register",
+        "immediate",
+        "memory",
+        "target",
+        "register",
+    ]
+
+
+def test_columnar_round_trip(tmp_path):
+    jsonl_file = tmp_path / "data.jsonl"
+    jsonl_file.write_text(
+        "".join(json.dumps(record) + "\n" for record in RECORDS), encoding="utf-8"
+    )
+    ColumnarCorpus.from_jsonl(jsonl_file, tmp_path / "corpus")
+    corpus = ColumnarCorpus(tmp_path / "corpus")
+    assert len(corpus) == len(RECORDS)
+    assert corpus[0] == OBJDUMP_ASM and corpus[1] == "" and corpus[2] == INTEL_ASM
+    assert list(corpus.records()) == RECORDS
+    corpus.to_jsonl(tmp_path / "back.jsonl")
+    assert (tmp_path / "back.jsonl").read_text() == jsonl_file.read_text()
+
+
+def test_columnar_statistics_and_dedup(tmp_path):
+    corpus = ColumnarCorpus.from_records(RECORDS, tmp_path)
+    statistics = corpus.statistics()
+    assert statistics["num_records"] == 5
+    assert statistics["num_without_assembly"] == 1
+    assert corpus.instruction_counts()[:4].tolist() == [7, 0, 4, 7]
+    assert corpus.opcode_histogram()["retq"] >= 2
+    assert corpus.operand_kind_histogram()["target"] >= 2
+    # the moved copy of the first record only differs by an address
+    assert corpus.duplicate_mask().tolist() == [False, False, False, True, False]
+    assert corpus.to_jsonl(tmp_path / "dedup.jsonl", ~corpus.duplicate_mask()) == 4
+
+
+def test_columnar_rejects_unstandardized_asm(tmp_path):
+    with pytest.raises(ValueError):
+        ColumnarCorpus.from_records([{"input": "f_gold:\n\tret\n"}], tmp_path)
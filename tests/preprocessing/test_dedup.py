@@ -0,0 +1,74 @@
+"""Testing the near-duplicate removal"""
+import json
+
+from decompile.preprocessing.dedup import MinHasher, deduplicate_jsonl, lsh_parameters
+from decompile.preprocessing.shards import (
+    ShardedJsonlReader,
+    ShardedJsonlWriter,
+    shard_compression,
+)
+
+SOURCE = """int f_gold ( int a [ ] , int n ) {
+  int sum = 0;
+  for ( int i = 0; i < n; i ++ ) sum += a [ i ];
+  return sum;
+}"""
+ASM = "".join(
+    f"\t{address:x}: movl -0x{address:x}(%rbp) , %eax ;\n" for address in range(40)
+)
+
+
+def test_minhash_similarity():
+    hasher = MinHasher(num_perm=128, shingle_size=3)
+    first = hasher.signature(SOURCE)
+    assert (first == hasher.signature(SOURCE)).all()
+    renamed = hasher.signature(SOURCE.replace("sum", "total"))
+    different = hasher.signature("def f(x):\n    return x * 2\n")
+    assert (first == renamed).mean() > (first == different).mean()
+    bands, rows = lsh_parameters(128, 0.8)
+    assert bands * rows == 128
+
+
+RECORDS = [
+    {"input": ASM, "output": SOURCE, "file_name": "SUM_1.cpp"},
+    {"input": ASM, "output": SOURCE + "\n", "file_name": "SUM_2.cpp"},
+    {
+        "input": "\t0: retq ;\n",
+        "output": "int f_gold ( ) { }",
+        "file_name": "EMPTY.c",
+    },
+    {"input": ASM, "output": SOURCE, "file_name": "SUM_3.cpp"},
+]
+
+
+def test_deduplicate_jsonl(tmp_path):
+    jsonl_path = tmp_path / "dataset.jsonl"
+    jsonl_path.write_text("".join(json.dumps(record) + "\n" for record in RECORDS))
+    output_path = tmp_path / "dedup.jsonl"
+    report_path = tmp_path / "report.json"
+    assert deduplicate_jsonl(jsonl_path, output_path, report_path, nproc=2) == 2
+
+    kept = [json.loads(line)["file_name"] for line in output_path.open()]
+    assert kept == ["SUM_1.cpp", "EMPTY.c"]
+    report = json.loads(report_path.read_text())
+    assert report["clusters"] == [
+        {"kept": "SUM_1.cpp", "removed": ["SUM_2.cpp", "SUM_3.cpp"]}
+    ]
+
+
+def test_deduplicate_shards(tmp_path):
+    with ShardedJsonlWriter(
+        tmp_path / "shards", max_shard_bytes=1024, compression="gzip"
+    ) as writer:
+        for record in RECORDS:
+            writer.write(record)
+    output_path = tmp_path / "dedup"
+    report_path = tmp_path / "report.json"
+    assert deduplicate_jsonl(tmp_path / "shards", output_path, report_path) == 2
+
+    assert shard_compression(output_path) == "gzip"
+    kept = [
+        record["file_name"]
+        for record in ShardedJsonlReader(output_path, compression="gzip")
+    ]
+    assert kept == ["SUM_1.cpp", "EMPTY.c"]
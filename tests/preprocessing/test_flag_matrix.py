@@ -0,0 +1,40 @@
+"""Testing the compile matrix of the fused pipeline"""
+import json
+import shutil
+
+import pytest
+
+from decompile.preprocessing.preprocess import DatasetJsonl
+from decompile.preprocessing.toolchain import compile_cache_key
+
+SOURCE = "int f_gold(int a, int b) {\n  if (a > b) return a - b;\n  return a * b;\n}\n"
+
+
+@pytest.mark.skipif(
+    shutil.which("gcc") is None or shutil.which("objdump") is None,
+    reason="gcc and objdump are required",
+)
+@pytest.mark.parametrize("asm_backend", ["objdump", "compiler"])
+def test_flag_matrix(tmp_path, asm_backend):
+    input_folder = tmp_path / "input"
+    input_folder.mkdir()
+    (input_folder / "a.c").write_text(SOURCE, encoding="utf-8")
+    (input_folder / "broken.c").write_text("int f_gold(", encoding="utf-8")
+    jsonl_file = tmp_path / "matrix.jsonl"
+    dataset = DatasetJsonl(tmp_path, 10, asm_backend=asm_backend)
+    dataset.preprocess_fused(
+        input_folder, jsonl_file, nproc=1, flag_sets=["-O0", "-O2"]
+    )
+    records = [json.loads(line) for line in jsonl_file.read_text().splitlines()]
+    assert [(record["file_name"], record["flags"]) for record in records] == [
+        ("a.c", "-O0"),
+        ("a.c", "-O2"),
+    ]
+    assert len(records[1]["input"]) < len(records[0]["input"])
+    assert records[0]["output"] == records[1]["output"]
+
+
+def test_compile_cache_key_covers_flags(tmp_path):
+    source_file = tmp_path / "a.c"
+    source_file.write_text(SOURCE, encoding="utf-8")
+    assert compile_cache_key(source_file) != compile_cache_key(source_file, ["-O2"])
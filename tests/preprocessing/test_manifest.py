@@ -0,0 +1,28 @@
+"""Testing the preprocessing progress manifest"""
+from decompile.preprocessing.manifest import ProgressManifest
+
+
+def test_manifest_resume(tmp_path):
+    manifest_path = tmp_path / "manifest.jsonl"
+    manifest = ProgressManifest(manifest_path, resume=False)
+    manifest.record("a.c", "compile", True)
+    manifest.record("b.c", "compile", False, error="syntax error")
+    with manifest_path.open("a", encoding="utf-8") as manifest_file:
+        manifest_file.write('{"file": "c.c", "sta')
+
+    resumed = ProgressManifest(manifest_path, resume=True)
+    assert resumed.is_done("a.c", "compile")
+    assert not resumed.should_run("a.c", "compile", max_retries=2)
+    assert resumed.failures("b.c", "compile") == 1
+    assert resumed.should_run("b.c", "compile", max_retries=1)
+    assert not resumed.should_run("b.c", "compile", max_retries=0)
+    assert resumed.should_run("c.c", "compile", max_retries=0)
+
+    resumed.record("c.c", "compile", True)
+    assert ProgressManifest(manifest_path).is_done("c.c", "compile")
+
+
+def test_manifest_starts_over_without_resume(tmp_path):
+    manifest_path = tmp_path / "manifest.jsonl"
+    ProgressManifest(manifest_path).record("a.c", "compile", True)
+    assert not ProgressManifest(manifest_path, resume=False).is_done("a.c", "compile")
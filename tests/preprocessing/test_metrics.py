@@ -0,0 +1,79 @@
+"""Testing the pipeline stage metrics"""
+import json
+import subprocess
+
+import pytest
+
+from decompile.preprocessing.preprocess import DatasetJsonl
+from decompile.preprocessing.metrics import (
+    PipelineMetrics,
+    failure_reason,
+    new_event,
+    stage_timer,
+)
+
+
+def test_stage_timer(tmp_path):
+    metrics = PipelineMetrics(tmp_path)
+    for index in range(100):
+        with stage_timer(metrics, "compile", f"{index}.c") as event:
+            event["bytes_in"] = index
+    with pytest.raises(ValueError):
+        with stage_timer(metrics, "collect", "broken.c"):
+            raise ValueError("bad source")
+    with stage_timer(None, "write", "ignored.c"):
+        pass
+
+    events = list(metrics.events())
+    assert len(events) == 101
+    assert all(event["wall_seconds"] >= 0 for event in events)
+    report = metrics.report(tmp_path / "report.json")
+    assert list(report["stages"]) == ["collect", "compile"]
+    compile_stage = report["stages"]["compile"]
+    assert compile_stage["count"] == 100 and compile_stage["failures"] == 0
+    assert compile_stage["bytes_in"]["total"] == sum(range(100))
+    assert compile_stage["bytes_in"]["p50"] == pytest.approx(49.5)
+    assert compile_stage["bytes_in"]["p99"] == pytest.approx(98.01)
+    assert report["stages"]["collect"]["failure_reasons"] == {"ValueError": 1}
+    assert json.loads((tmp_path / "report.json").read_text()) == report
+
+    assert len(list(PipelineMetrics(tmp_path, resume=True).events())) == 101
+    assert not list(PipelineMetrics(tmp_path).events())
+
+
+def test_record_batch(tmp_path):
+    metrics = PipelineMetrics(tmp_path)
+    with stage_timer(None, "disassemble", "") as batch_event:
+        subprocess.run(["true"], check=True)
+    events = [new_event("disassemble", name) for name in ("a.o", "b.o")]
+    events[1]["failure"] = "objdump exit status 1"
+    metrics.record_batch(batch_event, events)
+    recorded = list(metrics.events())
+    assert [event["file"] for event in recorded] == ["a.o", "b.o"]
+    assert recorded[0]["wall_seconds"] == pytest.approx(batch_event["wall_seconds"] / 2)
+    assert metrics.report()["stages"]["disassemble"]["failures"] == 1
+
+
+def test_failure_reason():
+    error = subprocess.CalledProcessError(1, "gcc")
+    stderr = (
+        "/tmp/a.c: In function 'f_gold':\n"
+        + "/tmp/a.c:1:27: error: expected ';' before '}' token\n"
+        + "    1 | int f_gold(int a){return a}\n"
+    )
+    assert failure_reason(error, stderr) == (
+        "CalledProcessError (exit status 1): expected ';' before '}' token"
+    )
+    assert failure_reason("objdump", "objdump: '/tmp/a.o': No such file") == (
+        "objdump: objdump: '<file>': No such file"
+    )
+
+
+def test_dataset_keeps_events_when_resuming(tmp_path):
+    metrics = PipelineMetrics(tmp_path)
+    with stage_timer(metrics, "compile", "a.c"):
+        pass
+    DatasetJsonl(tmp_path, 1, metrics_folder=tmp_path, resume=True)
+    assert len(list(metrics.events())) == 1
+    DatasetJsonl(tmp_path, 1, metrics_folder=tmp_path)
+    assert not list(metrics.events())
@@ -0,0 +1,88 @@
+"""Testing the disassembly of many binaries with a single objdump process"""
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from decompile.preprocessing.metrics import PipelineMetrics
+from decompile.preprocessing.objdump_batch import disassemble_batch_to_assembly
+from decompile.preprocessing.toolchain import COMPILATION_COMMANDS, objdump_command
+
+SOURCES_FOLDER = (
+    Path(__file__).parent.parent / "tests_data" / "preprocessing" / "sources"
+)
+
+pytestmark = pytest.mark.skipif(
+    shutil.which("gcc") is None
+    or shutil.which("g++") is None
+    or shutil.which("objdump") is None,
+    reason="gcc, g++ and objdump are required",
+)
+
+
+def compile_fixtures(output_folder):
+    binary_files = []
+    for source_file in sorted(SOURCES_FOLDER.iterdir()):
+        binary_file = output_folder / source_file.with_suffix(".o").name
+        subprocess.run(
+            COMPILATION_COMMANDS[source_file.suffix].split()
+            + [str(source_file), "-o", str(binary_file)],
+            check=True,
+        )
+        binary_files.append(binary_file)
+    return binary_files
+
+
+def disassemble(binary_file):
+    return subprocess.run(
+        objdump_command([binary_file], "att", "x86-64"),
+        stdout=subprocess.PIPE,
+        check=True,
+        encoding="utf-8",
+    ).stdout
+
+
+def test_batch_matches_per_file_disassembly(tmp_path):
+    binary_files = compile_fixtures(tmp_path)
+    expected = {binary_file: disassemble(binary_file) for binary_file in binary_files}
+
+    assert disassemble_batch_to_assembly(binary_files, "att", "x86-64") == []
+    for binary_file in binary_files:
+        assert not binary_file.exists()
+        assert binary_file.with_suffix(".s").read_text() == expected[binary_file]
+
+
+def test_failed_binaries_do_not_shift_listings(tmp_path):
+    first, second, third = compile_fixtures(tmp_path)
+    expected = {binary_file: disassemble(binary_file) for binary_file in (first, third)}
+    missing = tmp_path / "missing.o"
+    corrupt = tmp_path / "corrupt.o"
+    corrupt.write_text("not an object file\n")
+
+    failed = disassemble_batch_to_assembly(
+        [first, missing, second.rename(tmp_path / "other.o"), corrupt, third],
+        "att",
+        "x86-64",
+    )
+
+    assert failed == [missing, corrupt]
+    assert missing.with_suffix(".s").read_text() == ""
+    assert corrupt.with_suffix(".s").read_text() == ""
+    for binary_file in (first, third):
+        assert binary_file.with_suffix(".s").read_text() == expected[binary_file]
+    assert "f_gold" in (tmp_path / "other.s").read_text()
+
+
+def test_events_use_source_names(tmp_path):
+    binary_files = compile_fixtures(tmp_path)
+    source_names = [
+        source_file.name for source_file in sorted(SOURCES_FOLDER.iterdir())
+    ]
+    metrics = PipelineMetrics(tmp_path / "metrics")
+    disassemble_batch_to_assembly(
+        binary_files, "att", "x86-64", metrics=metrics, source_names=source_names
+    )
+    events = list(metrics.events())
+    assert [event["stage"] for event in events] == ["disassemble"] * len(source_names)
+    assert sorted(event["file"] for event in events) == sorted(source_names)
@@ -0,0 +1,45 @@
+"""Testing the objdump listing parser"""
+from pathlib import Path
+
+import pytest
+
+from decompile.preprocessing.objdump_parser import ObjdumpListing
+
+TESTIING_DATA_FOLDER = Path("tests/tests_data/preprocessing")
+
+
+def test_index_all_functions():
+    with ObjdumpListing.from_file(
+        TESTIING_DATA_FOLDER / "standardize_test_input_1.s"
+    ) as listing:
+        assert list(listing.index) == [
+            "f_gold(int)",
+            "__static_initialization_and_destruction_0(int, int)",
+            "_GLOBAL__sub_I__Z6f_goldi",
+        ]
+        span = listing.index["f_gold(int)"]
+        assert span.address == 0
+        assert span.section == ".text"
+        assert listing.index["_GLOBAL__sub_I__Z6f_goldi"].address == 0x69
+        # endbr64 is not counted, like in the standardized function
+        assert span.num_instructions == 7
+        for symbol, standardized in listing.iter_standardized():
+            assert listing.index[symbol].num_instructions == (
+                len(standardized.splitlines()) - 1
+            )
+    assert listing.standardize("f_gold(int)")
+    with pytest.raises(ValueError):
+        listing.raw("f_gold(int)")
+
+
+def test_standardize_matches_standardize_asm_file():
+    output_text = (TESTIING_DATA_FOLDER / "standardize_test_output_1.s").read_text(
+        encoding="utf-8"
+    )
+    with ObjdumpListing.from_file(
+        TESTIING_DATA_FOLDER / "standardize_test_input_1.s"
+    ) as listing:
+        symbol = listing.find("f_gold")
+        assert symbol == "f_gold(int)"
+        assert listing.standardize(symbol) == output_text
+        assert len(dict(listing.iter_standardized())) == 3
@@ -0,0 +1,119 @@
+"""Testing the preprocessing pipeline"""
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from decompile.preprocessing.preprocess import DatasetJsonl
+
+SOURCES_FOLDER = (
+    Path(__file__).parent.parent / "tests_data" / "preprocessing" / "sources"
+)
+
+requires_toolchain = pytest.mark.skipif(
+    shutil.which("gcc") is None
+    or shutil.which("g++") is None
+    or shutil.which("objdump") is None,
+    reason="gcc, g++ and objdump are required",
+)
+
+
+def read_records(jsonl_file):
+    return [json.loads(line) for line in jsonl_file.read_text().splitlines()]
+
+
+@requires_toolchain
+@pytest.mark.parametrize("asm_backend", ["objdump", "compiler"])
+def test_fused_pipeline_matches_staged_pipeline(tmp_path, asm_backend):
+    dataset = DatasetJsonl(tmp_path, 10, asm_backend=asm_backend)
+    output_folder = tmp_path / "output"
+    output_folder.mkdir()
+    dataset.preprocess(SOURCES_FOLDER, output_folder, nproc=2)
+    staged_file = tmp_path / "staged.jsonl"
+    DatasetJsonl.stream_jsonl_and_standardize(
+        output_folder, SOURCES_FOLDER, staged_file, 2, asm_backend=asm_backend
+    )
+    fused_file = tmp_path / "fused.jsonl"
+    dataset.preprocess_fused(SOURCES_FOLDER, fused_file, nproc=2)
+
+    staged_records = sorted(read_records(staged_file), key=lambda r: r["file_name"])
+    fused_records = sorted(read_records(fused_file), key=lambda r: r["file_name"])
+    assert [record["file_name"] for record in fused_records] == [
+        "count_set_bits.c",
+        "max_of_three.cpp",
+        "sum_array.c",
+    ]
+    assert all(record["input"] for record in fused_records)
+    assert fused_records == staged_records
+
+
+@requires_toolchain
+def test_streamed_jsonl_matches_buffered_jsonl(tmp_path):
+    output_folder = tmp_path / "output"
+    output_folder.mkdir()
+    DatasetJsonl(tmp_path, 10).preprocess(SOURCES_FOLDER, output_folder, nproc=2)
+    buffered_file = tmp_path / "buffered.jsonl"
+    DatasetJsonl.create_jsonl_and_standardize(
+        output_folder, SOURCES_FOLDER, buffered_file
+    )
+    streamed_file = tmp_path / "streamed.jsonl"
+    num_records = DatasetJsonl.stream_jsonl_and_standardize(
+        output_folder, SOURCES_FOLDER, streamed_file, 2, chunksize=1
+    )
+
+    assert num_records == 3
+    assert streamed_file.read_text() == buffered_file.read_text()
+
+
+def make_source_tree(root):
+    files = {
+        "b.c": "int f_gold(int a) { return a; }\n",
+        "a.cpp": "int f_gold(int a) { return a + 1; }\n",
+        "notes.txt": "not a source\n",
+        "sub1/c.c": "// comment\n\nint f_gold(int a) { return a; }\nint main() {}\n",
+        "sub1/a.cpp": "int f_gold(int a) { return a + 2; }\n",
+        "sub1/deeper/d.c": "int f_gold(int a) { return a; }\n",
+        "sub2/e.c": "int f_gold(int a) { return a; }\n",
+    }
+    for name, text in files.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_text(text)
+
+
+def test_find_source_files(tmp_path):
+    make_source_tree(tmp_path)
+    expected = [
+        tmp_path / "a.cpp",
+        tmp_path / "b.c",
+        tmp_path / "sub1" / "c.c",
+        tmp_path / "sub1" / "deeper" / "d.c",
+        tmp_path / "sub2" / "e.c",
+    ]
+    for num_samples in (10, 3):
+        dataset = DatasetJsonl(tmp_path, num_samples)
+        source_files = dataset._find_source_files(tmp_path)
+        assert source_files == [str(path) for path in expected[:num_samples]]
+
+
+def test_collect_source_files(tmp_path):
+    raw_folder = tmp_path / "raw"
+    make_source_tree(raw_folder)
+    output_folder = tmp_path / "collected"
+    output_folder.mkdir()
+
+    num_files = DatasetJsonl(raw_folder, 10).collect_source_files(output_folder)
+
+    assert num_files == 5
+    assert sorted(path.name for path in output_folder.iterdir()) == [
+        "a.cpp",
+        "b.c",
+        "c.c",
+        "d.c",
+        "e.c",
+    ]
+    # the first a.cpp in traversal order wins
+    assert (output_folder / "a.cpp").read_text() == (
+        "int f_gold(int a) { return a + 1; }\n"
+    )
+    assert (output_folder / "c.c").read_text() == "int f_gold(int a) { return a; }\n"
@@ -0,0 +1,90 @@
+"""Testing the asyncio subprocess scheduler"""
+import sys
+import time
+import asyncio
+import subprocess
+
+import pytest
+
+from decompile.preprocessing.scheduler import Job, SubprocessScheduler
+
+SLEEP = [sys.executable, "-c", "import time; time.sleep(0.3)"]
+
+
+def test_run_all_limits_concurrency():
+    scheduler = SubprocessScheduler(max_concurrency=3)
+    results = []
+    start = time.perf_counter()
+    num_jobs = scheduler.run_all(
+        (Job(SLEEP, tag=index) for index in range(6)), results.append
+    )
+    elapsed = time.perf_counter() - start
+    assert num_jobs == 6
+    assert sorted(result.job.tag for result in results) == list(range(6))
+    assert all(result.succeeded for result in results)
+    # two waves of three jobs
+    assert 0.6 <= elapsed < 1.8
+
+
+def test_job_failures():
+    scheduler = SubprocessScheduler(max_concurrency=2, default_timeout=0.2)
+    jobs = [
+        Job(["sleep", "5"], tag="timeout"),
+        Job(["/nonexistent/compiler"], tag="missing"),
+        Job([sys.executable, "-c", "import sys; sys.exit(3)"], tag="exit"),
+        Job(["cat"], stdin=b"source", timeout=5, tag="ok"),
+    ]
+    results = {}
+    scheduler.run_all(jobs, lambda result: results.setdefault(result.job.tag, result))
+    assert results["timeout"].timed_out
+    assert isinstance(results["timeout"].exception(), subprocess.TimeoutExpired)
+    assert results["timeout"].wall_seconds < 2
+    assert results["missing"].returncode is None
+    assert isinstance(results["missing"].exception(), OSError)
+    assert results["exit"].returncode == 3
+    assert isinstance(results["exit"].exception(), subprocess.CalledProcessError)
+    assert results["ok"].stdout == b"source" and results["ok"].exception() is None
+
+
+def test_backpressure_and_cancellation():
+    scheduler = SubprocessScheduler(max_concurrency=1, max_pending=2)
+    num_taken = 0
+
+    def jobs():
+        nonlocal num_taken
+        for _ in range(100):
+            num_taken += 1
+            yield Job(["sleep", "5"])
+
+    async def consume():
+        results = scheduler.iter_results(jobs())
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(results.__anext__(), 0.3)
+        await results.aclose()
+
+    start = time.perf_counter()
+    asyncio.run(consume())
+    assert num_taken == 2
+    assert time.perf_counter() - start < 2
+
+
+def test_blocking_callers_do_not_delay_timeouts():
+    scheduler = SubprocessScheduler(max_concurrency=2, max_pending=2)
+
+    def jobs():
+        yield Job(["sleep", "5"], timeout=0.3, tag="timeout")
+        yield Job(["true"], tag="ok")
+        # e.g. reading a large source file or waiting on the cache lock
+        time.sleep(0.8)
+        yield Job(["true"], tag="late")
+
+    def on_result(result):
+        results[result.job.tag] = result
+        if result.job.tag == "ok":
+            time.sleep(0.8)
+
+    results = {}
+    scheduler.run_all(jobs(), on_result)
+    assert results["timeout"].timed_out
+    assert results["timeout"].wall_seconds < 0.7
+    assert results["ok"].succeeded and results["late"].succeeded
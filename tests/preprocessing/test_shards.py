@@ -0,0 +1,80 @@
+"""Testing the sharded jsonl writer and reader"""
+import gzip
+import json
+
+import pytest
+
+from decompile.preprocessing.shards import (
+    ShardedJsonlReader,
+    ShardedJsonlWriter,
+    iter_jsonl_lines,
+    shard_compression,
+)
+
+RECORDS = [
+    {"input": "\tmov %edi , %eax ;\n" * index, "output": "", "file_name": f"{index}.c"}
+    for index in range(50)
+]
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_shards_round_trip(tmp_path, compression):
+    with ShardedJsonlWriter(
+        tmp_path, max_shard_bytes=1024, compression=compression, block_bytes=256
+    ) as writer:
+        for record in RECORDS:
+            writer.write(record)
+    assert len(writer.shard_paths) > 1
+
+    reader = ShardedJsonlReader(tmp_path, compression=compression)
+    assert len(reader) == len(RECORDS)
+    assert list(reader) == RECORDS
+    assert reader[37] == RECORDS[37]
+    assert reader[-1] == RECORDS[-1]
+    assert reader.sample(5, seed=1) == reader.sample(5, seed=1)
+    with pytest.raises(IndexError):
+        _ = reader[len(RECORDS)]
+
+
+def test_gzip_shard_is_valid_gzip(tmp_path):
+    with ShardedJsonlWriter(tmp_path, compression="gzip") as writer:
+        for record in RECORDS[:3]:
+            writer.write(record)
+    lines = gzip.decompress(writer.shard_paths[0].read_bytes()).splitlines()
+    assert [json.loads(line) for line in lines] == RECORDS[:3]
+
+
+def test_blocks_compress_better_than_records(tmp_path):
+    sizes = {}
+    for block_bytes in (1, 64 * 1024):
+        with ShardedJsonlWriter(
+            tmp_path / str(block_bytes), compression="gzip", block_bytes=block_bytes
+        ) as writer:
+            for record in RECORDS:
+                writer.write(record)
+        sizes[block_bytes] = writer.shard_paths[0].stat().st_size
+        reader = ShardedJsonlReader(tmp_path / str(block_bytes), compression="gzip")
+        assert [reader[index] for index in (3, 2, 49, 0)] == [
+            RECORDS[index] for index in (3, 2, 49, 0)
+        ]
+    assert sizes[64 * 1024] * 3 < sizes[1]
+
+
+@pytest.mark.parametrize("compression", [None, "gzip"])
+def test_iter_jsonl_lines(tmp_path, compression):
+    jsonl_file = tmp_path / "data.jsonl"
+    jsonl_file.write_text(
+        "".join(json.dumps(record) + "\n" for record in RECORDS), encoding="utf-8"
+    )
+    with ShardedJsonlWriter(
+        tmp_path / "shards", compression=compression, block_bytes=256
+    ) as writer:
+        for record in RECORDS:
+            writer.write(record)
+
+    assert shard_compression(tmp_path / "shards") == compression
+    assert list(iter_jsonl_lines(tmp_path / "shards")) == list(
+        iter_jsonl_lines(jsonl_file)
+    )
+    with pytest.raises(FileNotFoundError):
+        shard_compression(tmp_path)
@@ -1,6 +1,10 @@
 """Testing Standardization of Assembly Files"""
 from pathlib import Path
-from decompile.preprocessing.standardize import standardize_asm_file
+from decompile.preprocessing.standardize import (
+    standardize_asm,
+    standardize_asm_file,
+    standardize_compiler_asm_file,
+)
 
 TESTIING_DATA_FOLDER = Path("tests/tests_data/preprocessing")
 
@@ -18,3 +22,29 @@ def test_standardize():
         )
         == output_text
     )
+
+
+def test_standardize_bytes_input():
+    input_path = TESTIING_DATA_FOLDER / "standardize_test_input_1.s"
+    output_text = (TESTIING_DATA_FOLDER / "standardize_test_output_1.s").read_text(
+        encoding="utf-8"
+    )
+    assert standardize_asm(input_path.read_bytes()) == output_text
+    assert standardize_asm(input_path.read_text(encoding="utf-8")) == output_text
+
+
+def test_standardize_without_target_function():
+    assert standardize_asm("header\n" * 5) == ""
+    assert standardize_asm("too short\n") == ""
+
+
+def test_standardize_compiler_asm():
+    output_text = (
+        TESTIING_DATA_FOLDER / "standardize_compiler_test_output_1.s"
+    ).read_text(encoding="utf-8")
+    assert (
+        standardize_compiler_asm_file(
+            TESTIING_DATA_FOLDER / "standardize_compiler_test_input_1.s"
+        )
+        == output_text
+    )
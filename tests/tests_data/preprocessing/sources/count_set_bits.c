@@ -0,0 +1,8 @@
+unsigned int f_gold(unsigned int n) {
+  unsigned int count = 0;
+  while (n) {
+    count += n & 1;
+    n >>= 1;
+  }
+  return count;
+}
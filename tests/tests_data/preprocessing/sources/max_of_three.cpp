@@ -0,0 +1,5 @@
+#include <bits/stdc++.h>
+using namespace std;
+int f_gold(int a, int b, int c) {
+  return max(a, max(b, c));
+}
@@ -0,0 +1,5 @@
+int f_gold(int arr[], int n) {
+  int sum = 0;
+  for (int i = 0; i < n; i++) sum += arr[i];
+  return sum;
+}
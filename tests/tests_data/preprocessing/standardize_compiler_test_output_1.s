@@ -0,0 +1,34 @@
+f_gold:
+	pushq %rbp ;
+	movq %rsp , %rbp ;
+	movl %edi , -20(%rbp) ;
+	movl $0 , -4(%rbp) ;
+	movl $0 , -8(%rbp) ;
+	jmp .L2 ;
+	.L4: ;
+	movl -8(%rbp) , %ecx ;
+	movslq %ecx , %rax ;
+	imulq $1431655766 , %rax , %rax ;
+	shrq $32 , %rax ;
+	movq %rax , %rdx ;
+	movl %ecx , %eax ;
+	sarl $31 , %eax ;
+	subl %eax , %edx ;
+	movl %edx , %eax ;
+	addl %eax , %eax ;
+	addl %edx , %eax ;
+	subl %eax , %ecx ;
+	movl %ecx , %edx ;
+	testl %edx , %edx ;
+	je .L3 ;
+	movl -8(%rbp) , %eax ;
+	addl %eax , -4(%rbp) ;
+	.L3: ;
+	addl $1 , -8(%rbp) ;
+	.L2: ;
+	movl -8(%rbp) , %eax ;
+	cmpl -20(%rbp) , %eax ;
+	jl .L4 ;
+	movl -4(%rbp) , %eax ;
+	popq %rbp ;
+	ret ;
@@ -0,0 +1,98 @@
+"""Testing the dataset helpers of the trainers"""
+import json
+
+from decompile.preprocessing.shards import ShardedJsonlWriter
+from decompile.trainers.dataset_utils import (
+    count_lines,
+    file_sha256,
+    iter_jsonl,
+    num_training_steps,
+    split_jsonl,
+    split_sha256,
+)
+
+
+def _write_dataset(dataset_path, num_records):
+    with dataset_path.open("w", encoding="utf-8") as dataset_file:
+        for index in range(num_records):
+            record = {"input": "", "output": str(index), "file_name": f"{index}.c"}
+            dataset_file.write(json.dumps(record) + "\n")
+
+
+def _file_names(jsonl_path):
+    with jsonl_path.open(encoding="utf-8") as jsonl_file:
+        return {json.loads(line)["file_name"] for line in jsonl_file}
+
+
+def test_split_is_deterministic(tmp_path):
+    dataset_path = tmp_path / "dataset.jsonl"
+    _write_dataset(dataset_path, 200)
+    train_path, test_path = split_jsonl(dataset_path, tmp_path / "a", 0.25, seed=1)
+    train_names, test_names = _file_names(train_path), _file_names(test_path)
+    assert len(train_names) + len(test_names) == 200
+    assert not train_names & test_names
+    assert 20 < len(test_names) < 80
+
+    other_train_path, _ = split_jsonl(dataset_path, tmp_path / "b", 0.25, seed=1)
+    assert other_train_path.read_bytes() == train_path.read_bytes()
+
+    # a record keeps its split when the dataset grows
+    _write_dataset(dataset_path, 300)
+    _, grown_test_path = split_jsonl(dataset_path, tmp_path / "a", 0.25, seed=1)
+    assert test_names <= _file_names(grown_test_path)
+
+
+def test_split_is_reused(tmp_path):
+    dataset_path = tmp_path / "dataset.jsonl"
+    _write_dataset(dataset_path, 20)
+    train_path, _ = split_jsonl(dataset_path, tmp_path, 0.5)
+    train_path.write_text("", encoding="utf-8")
+    # rewriting the same content only changes the modification time
+    _write_dataset(dataset_path, 20)
+    assert split_jsonl(dataset_path, tmp_path, 0.5)[0].read_text() == ""
+    assert split_jsonl(dataset_path, tmp_path, 0.5, seed=3)[0].read_text() != ""
+
+
+def test_num_training_steps(tmp_path):
+    dataset_path = tmp_path / "dataset.jsonl"
+    _write_dataset(dataset_path, 10)
+    num_records = count_lines(dataset_path)
+    assert num_records == 10
+    assert num_training_steps(num_records, 4, 1, 2) == 6
+    assert num_training_steps(num_records, 4, 3, 1) == 1
+
+
+def test_split_sha256(tmp_path):
+    dataset_path = tmp_path / "dataset.jsonl"
+    _write_dataset(dataset_path, 20)
+    train_path, test_path = split_jsonl(dataset_path, tmp_path / "split", 0.5)
+    assert split_sha256(train_path) == file_sha256(train_path)
+    assert split_sha256(test_path) == file_sha256(test_path)
+    # the hash recorded in split.json is reused while the stat matches
+    metadata_path = tmp_path / "split" / "split.json"
+    metadata = json.loads(metadata_path.read_text())
+    metadata["splits"]["test.jsonl"]["sha256"] = "recorded"
+    metadata_path.write_text(json.dumps(metadata))
+    assert split_sha256(test_path) == "recorded"
+
+    # a split file changed after the split is hashed again
+    train_path.write_text("", encoding="utf-8")
+    assert split_sha256(train_path) == file_sha256(train_path)
+
+
+def test_split_shard_folder(tmp_path):
+    dataset_path = tmp_path / "dataset.jsonl"
+    _write_dataset(dataset_path, 50)
+    with ShardedJsonlWriter(
+        tmp_path / "shards", max_shard_bytes=256, compression="gzip", block_bytes=128
+    ) as writer:
+        for record in iter_jsonl(dataset_path):
+            writer.write(record)
+    assert len(writer.shard_paths) > 1
+
+    train_path, test_path = split_jsonl(dataset_path, tmp_path / "a", 0.25)
+    shard_train_path, shard_test_path = split_jsonl(
+        tmp_path / "shards", tmp_path / "b", 0.25
+    )
+    assert shard_train_path.read_bytes() == train_path.read_bytes()
+    assert shard_test_path.read_bytes() == test_path.read_bytes()
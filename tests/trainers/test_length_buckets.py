@@ -0,0 +1,42 @@
+"""Testing the length-bucketed batching"""
+import numpy as np
+import pytest
+
+from decompile.trainers.length_buckets import (
+    LengthBucketSampler,
+    apply_length_policy,
+    padding_ratio,
+)
+
+
+def test_apply_length_policy():
+    lengths = np.array([10, 2000, 500, 1101])
+    indices, kept_lengths, over_length = apply_length_policy(lengths, 1100, "truncate")
+    assert indices.tolist() == [0, 1, 2, 3]
+    assert kept_lengths.tolist() == [10, 1100, 500, 1100]
+    assert over_length.tolist() == []
+    for policy in ("drop", "route"):
+        indices, kept_lengths, over_length = apply_length_policy(lengths, 1100, policy)
+        assert indices.tolist() == [0, 2]
+        assert kept_lengths.tolist() == [10, 500]
+        assert over_length.tolist() == [1, 3]
+    with pytest.raises(ValueError):
+        apply_length_policy(lengths, 1100, "keep")
+
+
+def test_length_bucket_sampler():
+    rng = np.random.default_rng(0)
+    lengths = rng.integers(1, 1100, size=1000)
+    indices = np.arange(1000, 2000)
+    sampler = LengthBucketSampler(indices, lengths, (128, 256, 512), batch_size=8)
+    batches = list(sampler)
+    assert len(batches) == len(sampler)
+    assert sorted(index for batch in batches for index in batch) == indices.tolist()
+    assert all(len(batch) <= 8 for batch in batches)
+    # a new epoch is shuffled differently
+    assert list(sampler) != batches
+
+    before, after = sampler.padding_report()
+    assert after < before
+    assert padding_ratio(np.array([4, 4, 2]), [[0, 1], [2]]) == 0
+    assert padding_ratio(np.array([4, 2]), [[0, 1]]) == 0.25
@@ -0,0 +1,91 @@
+"""Testing the dataset preparation of the LLaMa trainer"""
+import json
+import logging
+
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+datasets = pytest.importorskip("datasets")
+pytest.importorskip("peft")
+pytest.importorskip("trl")
+
+from transformers.trainer_utils import RemoveColumnsCollator
+
+from decompile.trainers.llama_trainer import (
+    LLaMaTrainer,
+    PackedDataset,
+    _isolate_segments,
+    collate_segments,
+    tokenize_stream,
+)
+
+WORDS = ["movl", "addl", "subl", "retq", "pushq", "popq", "eax", "ebx"]
+
+
+def make_tokenizer():
+    vocab = {"<unk>": 0, "<s>": 1, "</s>": 2}
+    vocab.update({word: index for index, word in enumerate(WORDS, start=3)})
+    tokenizer = tokenizers.Tokenizer(tokenizers.models.WordLevel(vocab, "<unk>"))
+    tokenizer.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    tokenizer = transformers.PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer,
+        unk_token="<unk>",
+        bos_token="<s>",
+        eos_token="</s>",
+    )
+    tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer
+
+
+def test_streamed_dataset_reaches_collator(tmp_path):
+    dataset_path = tmp_path / "train.jsonl"
+    with dataset_path.open("w", encoding="utf-8") as dataset_file:
+        for index in range(6):
+            record = {
+                "input": " ".join(WORDS[: index + 1]),
+                "output": "retq",
+                "file_name": f"{index}.c",
+            }
+            dataset_file.write(json.dumps(record) + "\n")
+    dataset = datasets.load_dataset(
+        "json", data_files=str(dataset_path), split="train", streaming=True
+    )
+    dataset = dataset.map(
+        lambda batch: {
+            "text": [
+                LLaMaTrainer.add_template(input) + output
+                for input, output in zip(batch["input"], batch["output"])
+            ]
+        },
+        batched=True,
+    )
+    tokenizer = make_tokenizer()
+    dataset = tokenize_stream(dataset, tokenizer, "text", 8)
+
+    # the columns the trainer keeps for a LLaMa model
+    collator = RemoveColumnsCollator(
+        transformers.DataCollatorForLanguageModeling(tokenizer, mlm=False),
+        ["input_ids", "attention_mask", "labels"],
+        logging.getLogger(__name__),
+    )
+    features = list(dataset)
+    assert len(features) == 6
+    batch = collator(features)
+    assert batch["input_ids"].shape == (6, 8)
+    assert batch["labels"].shape == (6, 8)
+
+
+def test_packed_position_ids_restart():
+    examples = [{"input_ids": [3, 4, 5]}, {"input_ids": [6, 7]}, {"input_ids": [8]}]
+    dataset = PackedDataset(examples, [[0, 1], [2]])
+    batch = collate_segments([dataset[0], dataset[1]])
+    assert batch["position_ids"].tolist() == [[0, 1, 2, 0, 1], [0, 0, 0, 0, 0]]
+    assert batch["attention_mask"].tolist() == [[1, 1, 1, 2, 2], [1, 0, 0, 0, 0]]
+
+
+def test_isolate_segments_requires_llama_decoder():
+    config = transformers.GPT2Config(n_layer=1, n_head=2, n_embd=8, vocab_size=16)
+    with pytest.raises(ValueError):
+        _isolate_segments(transformers.GPT2LMHeadModel(config))
@@ -0,0 +1,38 @@
+"""Testing the bin packing of training examples"""
+import numpy as np
+import pytest
+
+from decompile.trainers.packing import (
+    IGNORE_INDEX,
+    fill_rate,
+    first_fit_decreasing,
+    pack_examples,
+)
+
+
+def test_first_fit_decreasing():
+    lengths = [5, 7, 3, 2, 4, 1, 8]
+    bins = first_fit_decreasing(lengths, 10)
+    assert bins == [[6, 3], [1, 2], [0, 4, 5]]
+    assert fill_rate(lengths, bins, 10) == 1.0
+    assert first_fit_decreasing([], 10) == []
+    with pytest.raises(ValueError):
+        first_fit_decreasing([11], 10)
+
+
+def test_first_fit_decreasing_random():
+    rng = np.random.default_rng(0)
+    lengths = rng.integers(1, 1100, size=2000)
+    bins = first_fit_decreasing(lengths, 1100)
+    assert sorted(index for examples in bins for index in examples) == list(range(2000))
+    assert all(lengths[examples].sum() <= 1100 for examples in bins)
+    assert fill_rate(lengths, bins, 1100) > 0.95
+
+
+def test_pack_examples():
+    packed = pack_examples([np.array([1, 5, 6]), np.array([1, 7])])
+    assert packed["input_ids"].tolist() == [1, 5, 6, 1, 7]
+    assert packed["labels"].tolist() == [IGNORE_INDEX, 5, 6, IGNORE_INDEX, 7]
+    assert packed["position_ids"].tolist() == [0, 1, 2, 0, 1]
+    assert packed["segment_ids"].tolist() == [1, 1, 1, 2, 2]
+    assert packed["cu_seqlens"].tolist() == [0, 3, 5]
@@ -0,0 +1,31 @@
+"""Testing the pre-tokenization cache"""
+import numpy as np
+
+from decompile.trainers.token_cache import TokenCache
+
+
+def _tokenize(batch):
+    return [[ord(character) for character in text] for text in batch]
+
+
+def test_token_cache_round_trip(tmp_path):
+    texts = ["mov", "", "ret", "push %rbp"]
+    cache = TokenCache(tmp_path)
+    key = TokenCache.make_key("dataset", "tokenizer", "instruction", 16)
+    assert cache.load(key) is None
+
+    corpus = cache.load_or_build(key, iter(texts), _tokenize, 256, batch_size=3)
+    assert len(corpus) == len(texts)
+    assert corpus.tokens.dtype == np.uint16
+    assert corpus.lengths.tolist() == [3, 0, 3, 9]
+    for index, text in enumerate(texts):
+        assert corpus[index].tolist() == _tokenize([text])[0]
+
+    def fail(batch):
+        raise AssertionError("cached corpus was tokenized again")
+
+    assert (
+        cache.load_or_build(key, iter(texts), fail, 256)[3].tolist()
+        == corpus[3].tolist()
+    )
+    assert TokenCache.make_key("dataset", "tokenizer", "instruction", 32) != key